@@ -0,0 +1,1311 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the ComfyUI API server, run against fake_comfyui.py
+No GPU or ComfyUI install needed.
+
+Usage:
+    python benchmark_api.py events [--jobs 40]
+    python benchmark_api.py client [--requests 500 --threads 8]
+    python benchmark_api.py stream [--requests 5]
+    python benchmark_api.py emit [--repeat 5]
+    python benchmark_api.py fairness [--noisy-jobs 50 --quiet-users 5]
+    python benchmark_api.py backends [--jobs 24 --max-backends 4]
+    python benchmark_api.py affinity [--jobs 30 --model-load-time 2]
+    python benchmark_api.py templates [--renders 20000 --threads 8]
+    python benchmark_api.py submit [--submissions 2000 --threads 4]
+    python benchmark_api.py conditioning [--jobs 30 --prompts 10 --encode-time 0.5]
+    python benchmark_api.py sessions [--connections 10000]
+    python benchmark_api.py download [--sizes 96,48,16 --rate 16]
+    python benchmark_api.py verify [--sizes 512,256 --rate 64]
+    python benchmark_api.py store [--size 512 --trees 3]
+    python benchmark_api.py models [--jobs 24 --bad-model 8]
+    python benchmark_api.py fetch [--jobs 24 --missing-every 4 --size 256 --rate 16]
+"""
+
+import argparse
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import requests
+
+HERE = Path(__file__).resolve().parent
+
+
+def print_header(text):
+    """Print formatted header"""
+    print("\n" + "=" * 70)
+    print(f"  {text}")
+    print("=" * 70)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_comfyui(step_time=0.01, extra_args=()):
+    """Start fake_comfyui.py in a subprocess and wait until it answers"""
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, str(HERE / "fake_comfyui.py"), "--port", str(port), "--step-time", str(step_time), *extra_args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if requests.get(f"{url}/system_stats", timeout=1).status_code == 200:
+                return proc, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("fake ComfyUI did not start")
+
+
+def small_workflow(steps=4, width=512, height=512):
+    return {
+        "3": {"class_type": "KSampler", "inputs": {"seed": 42, "steps": steps, "latent_image": ["5", 0]}},
+        "5": {"class_type": "EmptyLatentImage", "inputs": {"width": width, "height": height, "batch_size": 1}},
+        "9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "bench", "images": ["8", 0]}},
+    }
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+# ============================================
+# events: /ws completion vs /history polling
+# ============================================
+
+def bench_events(args):
+    from comfyui_client import ComfyUIEventListener
+
+    print_header(f"Completion detection: /ws events vs /history polling ({args.jobs} jobs)")
+    proc, url = start_fake_comfyui(step_time=args.step_time)
+    try:
+        results = {}
+        for mode in ("history", "events"):
+            client_id = str(uuid.uuid4())
+            listener = None
+            if mode == "events":
+                listener = ComfyUIEventListener(url, client_id)
+                listener.start()
+                listener.wait_connected(timeout=5)
+
+            history_calls = [0]
+            lags = []
+            lock = threading.Lock()
+
+            def run_one():
+                body = {"prompt": small_workflow(steps=args.steps), "client_id": client_id}
+                prompt_id = requests.post(f"{url}/prompt", json=body).json()["prompt_id"]
+                if listener:
+                    listener.wait(prompt_id, timeout=120)
+                    listener.forget(prompt_id)
+                    seen = time.time()
+                else:
+                    while True:
+                        with lock:
+                            history_calls[0] += 1
+                        if requests.get(f"{url}/history/{prompt_id}").json():
+                            seen = time.time()
+                            break
+                        time.sleep(1)
+                # Detection lag = when we noticed - when ComfyUI finished
+                status = requests.get(f"{url}/history/{prompt_id}").json()[prompt_id]["status"]
+                finished = dict(status["messages"])["execution_success"]["timestamp"] / 1000
+                with lock:
+                    lags.append(seen - finished)
+
+            start = time.time()
+            threads = [threading.Thread(target=run_one) for _ in range(args.jobs)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            total = time.time() - start
+            if listener:
+                listener.stop()
+
+            results[mode] = history_calls[0]
+            print(f"   {mode:8s} total {total:6.2f}s  /history polls {history_calls[0]:5d}  "
+                  f"detection lag p50 {percentile(lags, 50) * 1000:7.1f} ms  p99 {percentile(lags, 99) * 1000:7.1f} ms")
+
+        print(f"\n📊 /history requests saved: {results['history'] - results['events']}")
+    finally:
+        proc.kill()
+
+
+# ============================================
+# client: bare requests vs pooled ComfyUIClient
+# ============================================
+
+def bench_client(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from comfyui_client import ComfyUIClient
+
+    print_header(f"Per-request latency: bare requests vs pooled client ({args.requests} x GET /system_stats)")
+    proc, url = start_fake_comfyui()
+    try:
+        client = ComfyUIClient(url, pool_size=args.threads)
+        modes = {
+            "bare requests.get": lambda: requests.get(f"{url}/system_stats").json(),
+            "ComfyUIClient": client.system_stats,
+        }
+        for threads in (1, args.threads):
+            print(f"\n   {threads} thread(s):")
+            for name, call in modes.items():
+                call()  # warm up (pool connection, imports)
+
+                def timed(_):
+                    start = time.perf_counter()
+                    call()
+                    return time.perf_counter() - start
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(threads) as pool:
+                    latencies = list(pool.map(timed, range(args.requests)))
+                total = time.perf_counter() - start
+                print(f"   {name:18s} p50 {percentile(latencies, 50) * 1000:6.2f} ms  "
+                      f"p99 {percentile(latencies, 99) * 1000:6.2f} ms  {args.requests / total:7.0f} req/s")
+    finally:
+        proc.kill()
+
+
+# ============================================
+# stream: /tmp copy + send_file vs proxied stream
+# ============================================
+
+STREAM_SIZES = [(1536, 1536), (2400, 1024)]
+
+
+def serve_delivery(args):
+    """Subprocess: API server with only the image delivery stage mounted"""
+    import resource
+    import tempfile
+    import eventlet
+    import notebook_comfyui_api as api
+    from comfyui_backends import BackendPool, ComfyUIBackend
+    from result_cache import ResultCache
+
+    backend = ComfyUIBackend(args.comfy_url)
+    api.comfy_pool = BackendPool([backend])
+    api.result_cache = ResultCache(disk_dir=None)  # measure delivery, not caching
+
+    prompt_id = backend.client.queue_prompt(small_workflow(steps=1, width=args.width, height=args.height))["prompt_id"]
+    while prompt_id not in backend.client.history(prompt_id):
+        time.sleep(0.05)
+    image_info = dict(backend.client.history(prompt_id)[prompt_id]["outputs"]["9"]["images"][0], backend=backend.name)
+
+    @api.app.route("/bench/image")
+    def bench_image():
+        if args.mode == "tmpfile":
+            # The pre-streaming /generate path
+            image_data = api.get_image(image_info)
+            temp_path = Path(tempfile.gettempdir()) / f"{uuid.uuid4()}.png"
+            temp_path.write_bytes(image_data)
+            response = api.send_file(str(temp_path), mimetype="image/png")
+            response.call_on_close(temp_path.unlink)  # keep the benchmark from filling /tmp
+            return response
+        return api._stream_image_response(image_info, prompt_id)
+
+    @api.app.route("/bench/rss")
+    def bench_rss():
+        return api.jsonify({"baseline_kb": baseline_kb, "peak_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+    listener = eventlet.listen(("127.0.0.1", args.port))
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("READY", flush=True)
+    eventlet.wsgi.server(listener, api.app, log_output=False)
+
+
+def bench_stream(args):
+    print_header(f"Image delivery to REST clients ({args.requests} requests per case)")
+    proc, url = start_fake_comfyui()
+    try:
+        for width, height in STREAM_SIZES:
+            print(f"\n   {width}×{height}:")
+            for mode in ("tmpfile", "stream"):
+                port = free_port()
+                server = subprocess.Popen(
+                    [sys.executable, str(HERE / "benchmark_api.py"), "_serve-delivery", "--mode", mode,
+                     "--comfy-url", url, "--port", str(port), "--width", str(width), "--height", str(height)],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                )
+                try:
+                    while server.stdout.readline().strip() != "READY":
+                        if server.poll() is not None:
+                            raise RuntimeError("delivery server failed to start")
+                    ttfb, totals, size = [], [], 0
+                    for _ in range(args.requests):
+                        start = time.perf_counter()
+                        with requests.get(f"http://127.0.0.1:{port}/bench/image", stream=True) as response:
+                            chunks = response.iter_content(64 * 1024)
+                            size = len(next(chunks))
+                            ttfb.append(time.perf_counter() - start)
+                            size += sum(len(chunk) for chunk in chunks)
+                        totals.append(time.perf_counter() - start)
+                    rss = requests.get(f"http://127.0.0.1:{port}/bench/rss").json()
+                finally:
+                    server.kill()
+                print(f"   {mode:8s} {size / 1024 / 1024:5.2f} MB  TTFB p50 {percentile(ttfb, 50) * 1000:7.2f} ms  "
+                      f"total p50 {percentile(totals, 50) * 1000:7.2f} ms  "
+                      f"peak RSS +{(rss['peak_kb'] - rss['baseline_kb']) / 1024:6.1f} MB")
+    finally:
+        proc.kill()
+
+
+# ============================================
+# emit: base64 data URL vs binary SocketIO attachments
+# ============================================
+
+def bench_emit(args):
+    import base64
+    import os
+    import tracemalloc
+    from socketio import packet
+
+    chunk_size = 512 * 1024
+
+    def encode(payload):
+        # What the server does per emit: build the packet and serialize it
+        pkt = packet.Packet(packet.EVENT, data=["image_ready", payload], namespace="/")
+        return pkt.encode()
+
+    def emit_base64(image):
+        encoded = base64.b64encode(image).decode("utf-8")
+        return [encode({"status": "complete", "image_data": f"data:image/png;base64,{encoded}"})]
+
+    def emit_binary(image):
+        return [encode({"status": "complete", "image": image})]
+
+    def emit_chunked(image):
+        view = memoryview(image)
+        frames = []
+        for seq in range(0, len(image), chunk_size):
+            frames.append(encode({"seq": seq // chunk_size, "data": bytes(view[seq:seq + chunk_size])}))
+            frames = frames[-1:]  # frames are handed to the socket one at a time
+        frames.append(encode({"status": "complete"}))
+        return frames
+
+    def wire_bytes(frames):
+        total = 0
+        for frame in frames:
+            parts = frame if isinstance(frame, list) else [frame]
+            total += sum(len(part) for part in parts)
+        return total
+
+    print_header(f"SocketIO image_ready emit cost ({args.repeat} runs, packet encode + memory)")
+    for label, size in (("1536×1536", 3538944), ("2400×1024", 3686400), ("large", 16 << 20)):
+        image = os.urandom(size)
+        print(f"\n   {label} ({size / 1024 / 1024:.1f} MB PNG):")
+        for name, fn in (("base64", emit_base64), ("binary", emit_binary), ("chunked", emit_chunked)):
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                frames = fn(image)
+                times.append(time.perf_counter() - start)
+            tracemalloc.start()
+            frames = fn(image)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            wire = wire_bytes(frames) if name != "chunked" else size
+            print(f"   {name:8s} encode p50 {percentile(times, 50) * 1000:7.2f} ms  "
+                  f"peak extra memory {peak / 1024 / 1024:6.2f} MB  payload {wire / 1024 / 1024:6.2f} MB")
+
+
+# ============================================
+# jobs through the server's scheduler and runner (used by several benchmarks)
+# ============================================
+
+def run_jobs(args):
+    """Subprocess: push jobs through the server's scheduler and runner"""
+    import json
+    import notebook_comfyui_api as api
+    from comfyui_backends import BackendPool, ComfyUIBackend
+    from job_scheduler import Job, JobScheduler
+    from result_cache import ResultCache, workflow_key
+    from workflow_templates import workflow_model
+
+    api.comfy_pool = BackendPool([ComfyUIBackend(url) for url in args.comfy_url.split(",")])
+    api.result_cache = ResultCache(disk_dir=None)
+    api.comfy_pool.check()
+    api.comfy_pool.start()
+    for backend in api.comfy_pool.backends:
+        backend.events.start()
+        backend.events.wait_connected(10)
+    if args.conditioning_cache:
+        api.enable_conditioning_cache()
+    scheduler = JobScheduler(runner=api.run_generation_job, workers=api.comfy_pool.capacity, max_queue=args.jobs,
+                             resident=api.comfy_pool.free_models if args.affinity else None,
+                             max_affinity_wait=args.affinity_wait)
+    scheduler.start()
+
+    if args.validate_models:
+        from model_manifest import ModelInventory
+        api.model_inventory = ModelInventory(args.validate_models)
+        api.model_fetcher = None   # reject missing models instead of fetching them
+
+    jobs, bad, rejections = [], [], []
+    start = time.perf_counter()
+    for i in range(args.jobs):
+        model = {"model": "flux1-schnell.safetensors"} if args.mix and i % args.mix == args.mix - 1 else {}
+        if args.bad_model and i % args.bad_model == args.bad_model - 1:
+            model = {"model": "flux1-krea-dev-fp8.safetensors"}
+        prompt = f"benchmark prompt {i % args.prompts if args.prompts else i}"
+        workflow = api.build_generation_workflow(prompt, 512, 512, steps=args.steps, seed=i, **model)
+        job = Job(affinity=workflow_model(workflow), kind="rest", workflow=workflow, cache_key=workflow_key(workflow),
+                  prompt=prompt)
+        if args.validate_models:
+            checked = time.perf_counter()
+            try:
+                api.check_models(workflow)
+            except api.MissingModelError:
+                rejections.append(time.perf_counter() - checked)
+                continue
+        scheduler.submit(job)
+        jobs.append(job)
+        if model.get("model", "").endswith("fp8.safetensors"):
+            bad.append(job)
+    for job in jobs:
+        job.done.wait()
+    elapsed = time.perf_counter() - start
+    latencies = [job.finished - job.submitted for job in jobs]
+    minority = [job.started - job.submitted for job in jobs if job.affinity == "flux1-schnell.safetensors"]
+    pool = api.comfy_pool.stats()
+    print(json.dumps({
+        "elapsed": elapsed,
+        "errors": sum(job.error is not None for job in jobs),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "per_backend": {backend.name: backend.completed for backend in api.comfy_pool.backends},
+        "model_switches": pool["model_switches"],
+        "model_switch_seconds": pool["model_switch_seconds"],
+        "minority_max_wait": max(minority, default=0.0),
+        "conditioning": api.comfy_pool.backends[0].client.conditioning_cache_stats() if args.conditioning_cache else None,
+        "rejected": len(rejections),
+        "reject_ms": max(rejections, default=0.0) * 1000,
+        "bad_failed_after": max((job.finished - job.submitted for job in bad), default=0.0),
+        "good_failed": sum(job.error is not None for job in jobs if job not in bad),
+    }), flush=True)
+
+
+# ============================================
+# fairness: FIFO vs per-user fair share under a noisy neighbour
+# ============================================
+
+def bench_fairness(args):
+    from job_scheduler import Job, JobScheduler
+
+    print_header(f"Queue wait under a noisy neighbour ({args.noisy_jobs} burst jobs, "
+                 f"{args.quiet_users} quiet users x {args.quiet_jobs} jobs, {args.service_time}s per job)")
+
+    def runner(job):
+        time.sleep(args.service_time)
+        job.result = {}
+
+    for label, fair in (("FIFO", False), ("fair share", True)):
+        scheduler = JobScheduler(runner=runner, workers=1, max_queue=args.noisy_jobs + args.quiet_users * args.quiet_jobs,
+                                 priorities=("high", "normal"), default_priority="normal", fair_share=fair)
+        scheduler.start()
+        noisy = [Job(user_id="noisy") for _ in range(args.noisy_jobs)]
+        for job in noisy:
+            scheduler.submit(job)
+        quiet, high = [], []
+        for round_ in range(args.quiet_jobs):
+            time.sleep(args.service_time * 2)
+            for user in range(args.quiet_users):
+                job = Job(user_id=f"quiet-{user}")
+                scheduler.submit(job)
+                quiet.append(job)
+            job = Job(user_id="vip", priority="high")
+            scheduler.submit(job)
+            high.append(job)
+        for job in noisy + quiet + high:
+            job.done.wait()
+
+        print(f"\n   {label}:")
+        for name, jobs in (("noisy user", noisy), ("quiet users", quiet), ("high tier", high)):
+            waits = [job.started - job.submitted for job in jobs]
+            print(f"   {name:12s} wait p50 {percentile(waits, 50):6.2f}s  p99 {percentile(waits, 99):6.2f}s  "
+                  f"max {max(waits):6.2f}s")
+        tiers = scheduler.stats()["priorities"]
+        print("   per tier:   " + "  ".join(f"{tier} p99 {t['wait_p99']:.2f}s" for tier, t in tiers.items()))
+
+
+# ============================================
+# backends: throughput with 1..N ComfyUI backends
+# ============================================
+
+def bench_backends(args):
+    import json
+    print_header(f"Load balancing across fake ComfyUI backends ({args.jobs} jobs, {args.steps} steps, "
+                 f"{args.step_time}s per step)")
+    procs, urls = [], []
+    try:
+        for _ in range(args.max_backends):
+            proc, url = start_fake_comfyui(args.step_time)
+            procs.append(proc)
+            urls.append(url)
+        baseline = None
+        count = 1
+        while count <= args.max_backends:
+            output = subprocess.run(
+                [sys.executable, str(HERE / "benchmark_api.py"), "_run-jobs", "--comfy-url", ",".join(urls[:count]),
+                 "--jobs", str(args.jobs), "--steps", str(args.steps)],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            rate = args.jobs / result["elapsed"] * 60
+            baseline = baseline or rate
+            print(f"   {count} backend(s) {rate:7.1f} images/min  x{rate / baseline:4.2f}  "
+                  f"latency p50 {result['p50']:6.2f}s  p95 {result['p95']:6.2f}s  errors {result['errors']}  "
+                  f"jobs per backend {sorted(result['per_backend'].values(), reverse=True)}")
+            count *= 2
+    finally:
+        for proc in procs:
+            proc.kill()
+
+
+# ============================================
+# affinity: model switches with and without model-affinity dispatch
+# ============================================
+
+def bench_affinity(args):
+    import json
+    print_header(f"Model affinity ({args.jobs} jobs, every {args.mix}th on a second model, "
+                 f"{args.model_load_time}s per model switch)")
+    proc, url = start_fake_comfyui(args.step_time, ["--model-load-time", str(args.model_load_time)])
+    try:
+        for affinity in (False, True):
+            output = subprocess.run(
+                [sys.executable, str(HERE / "benchmark_api.py"), "_run-jobs", "--comfy-url", url,
+                 "--jobs", str(args.jobs), "--steps", str(args.steps),
+                 "--mix", str(args.mix), "--affinity-wait", str(args.max_wait)] + (["--affinity"] if affinity else []),
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            label = f"affinity (max wait {args.max_wait:g}s)" if affinity else "FIFO"
+            print(f"   {label:24s} {args.jobs / result['elapsed'] * 60:7.1f} images/min  "
+                  f"switches {result['model_switches']:3d} ({result['model_switch_seconds']:6.1f}s loading)  "
+                  f"second-model max wait {result['minority_max_wait']:6.2f}s  errors {result['errors']}")
+    finally:
+        proc.kill()
+
+
+# ============================================
+# templates: deepcopy of the workflow vs precompiled template rendering
+# ============================================
+
+def bench_templates(args):
+    import copy
+    from concurrent.futures import ThreadPoolExecutor
+    import notebook_comfyui_api as api
+    from result_cache import canonical_json
+
+    template = api.get_template()
+    print_header(f"Workflow templates ({args.renders} renders of '{template.name}', slots: "
+                 f"{', '.join(sorted(template.slots))})")
+
+    def deepcopy_build(i):
+        workflow = copy.deepcopy(api.DEFAULT_WORKFLOW)
+        workflow["5"]["inputs"]["width"] = 512 + i % 8
+        workflow["5"]["inputs"]["height"] = 512
+        workflow["6"]["inputs"]["text"] = f"prompt {i}"
+        return workflow
+
+    def template_build(i):
+        return template.render(prompt=f"prompt {i}", width=512 + i % 8, height=512)
+
+    for label, build in (("copy.deepcopy + edit", deepcopy_build), ("template.render", template_build)):
+        start = time.perf_counter()
+        for i in range(args.renders):
+            build(i)
+        elapsed = time.perf_counter() - start
+        print(f"   {label:22s} {elapsed / args.renders * 1e6:7.1f} µs/graph  ({args.renders / elapsed:,.0f} graphs/s)")
+
+    # Cross-request bleed: many threads render and then mutate their graphs;
+    # every graph must still hold exactly its own values
+    pristine = canonical_json(template.render())
+    default_before = canonical_json(api.DEFAULT_WORKFLOW)
+
+    def render_and_check(i):
+        width, height, seed = 256 + i % 97, 256 + i % 89, i
+        workflow = template.render(prompt=f"bleed check {i}", width=width, height=height, seed=seed)
+        time.sleep(0)  # let other threads interleave between render and check
+        expected = {"prompt": f"bleed check {i}", "width": width, "height": height, "seed": seed}
+        ok = all(template.value(workflow, name) == value for name, value in expected.items())
+        for node in workflow.values():   # a client editing its graph must not touch anyone else's
+            node["inputs"]["_scribble"] = i
+            for value in node["inputs"].values():
+                if isinstance(value, list):
+                    value.append(i)
+        return ok
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(render_and_check, range(args.bleed_renders)))
+    bled = results.count(False)
+    template_intact = canonical_json(template.render()) == pristine
+    default_intact = canonical_json(api.DEFAULT_WORKFLOW) == default_before
+    print(f"\n   Bleed check: {args.bleed_renders} renders on {args.threads} threads, "
+          f"{bled} with foreign values, template {'intact' if template_intact and default_intact else 'MODIFIED'}")
+    if bled or not (template_intact and default_intact):
+        sys.exit(1)
+
+
+# ============================================
+# submit: POST /prompt from the graph dict vs the pre-encoded template JSON
+# ============================================
+
+def bench_submit(args):
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+    import notebook_comfyui_api as api
+    from comfyui_client import ComfyUIClient
+    from result_cache import workflow_key
+
+    template = api.get_template()
+
+    def dict_path(i):
+        # what every job used to do: hash the canonical graph, then requests json.dumps it again
+        workflow = template.render(prompt=f"submission {i}", width=512, height=512, steps=1)
+        return workflow_key(workflow), workflow
+
+    def encoded_path(i):
+        prompt_json = template.encode(prompt=f"submission {i}", width=512, height=512, steps=1)
+        return workflow_key(prompt_json), prompt_json
+
+    print_header(f"Prompt submission ({args.submissions} prompts of '{template.name}', {args.threads} threads)")
+    print("   Encode + cache key only:")
+    for label, build in (("graph dict", dict_path), ("pre-encoded JSON", encoded_path)):
+        start = time.perf_counter()
+        for i in range(args.submissions):
+            key, payload = build(i)
+            if not isinstance(payload, bytes):
+                payload = json.dumps({"prompt": payload, "client_id": "x"})  # as requests' json= does
+        elapsed = time.perf_counter() - start
+        print(f"   {label:18s} {args.submissions / elapsed:9,.0f} submissions/s  ({elapsed / args.submissions * 1e6:6.1f} µs each)")
+
+    print("   Through ComfyUIClient.queue_prompt to fake ComfyUI:")
+    proc, url = start_fake_comfyui(0.0)
+    try:
+        client = ComfyUIClient(url)
+        for label, build in (("graph dict", dict_path), ("pre-encoded JSON", encoded_path)):
+            def submit(i):
+                return "prompt_id" in client.queue_prompt(build(i)[1])
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.threads) as pool:
+                queued = sum(pool.map(submit, range(args.submissions)))
+            elapsed = time.perf_counter() - start
+            print(f"   {label:18s} {queued / elapsed:9,.0f} submissions/s  (queued {queued}/{args.submissions})")
+    finally:
+        proc.kill()
+
+
+# ============================================
+# conditioning: CLIPTextEncode vs the cached encoder custom node
+# ============================================
+
+def bench_conditioning(args):
+    import json
+    print_header(f"Conditioning cache ({args.jobs} jobs over {args.prompts} distinct prompts, "
+                 f"{args.encode_time}s per text encode)")
+    proc, url = start_fake_comfyui(args.step_time, ["--encode-time", str(args.encode_time)])
+    try:
+        for cached in (False, True):
+            output = subprocess.run(
+                [sys.executable, str(HERE / "benchmark_api.py"), "_run-jobs", "--comfy-url", url,
+                 "--jobs", str(args.jobs), "--steps", str(args.steps),
+                 "--prompts", str(args.prompts)] + (["--conditioning-cache"] if cached else []),
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            line = (f"   {'CachedCLIPTextEncode' if cached else 'CLIPTextEncode':22s} "
+                    f"{args.jobs / result['elapsed'] * 60:7.1f} images/min  latency p50 {result['p50']:6.2f}s  "
+                    f"errors {result['errors']}")
+            if cached:
+                stats = result["conditioning"]
+                line += (f"\n   {'':22s} hit ratio {stats['hit_ratio']:.2f}  "
+                         f"saved {stats['seconds_saved']:.1f}s ({stats['seconds_saved'] / args.jobs:.2f}s per job)")
+            print(line)
+    finally:
+        proc.kill()
+
+
+# ============================================
+# models: misconfigured jobs failing in ComfyUI vs validated before queueing
+# ============================================
+
+def bench_models(args):
+    import json
+    import shutil
+    import tempfile
+    from model_manifest import load_manifest
+
+    print_header(f"Model validation ({args.jobs} jobs, every {args.bad_model}th names a missing model)")
+    models_dir = Path(tempfile.mkdtemp(prefix="bench-models-"))
+    for entry in load_manifest().bundle("flux-krea-dev"):
+        entry.path(models_dir).parent.mkdir(parents=True, exist_ok=True)
+        entry.path(models_dir).touch()
+    proc, url = start_fake_comfyui(args.step_time, ["--models-dir", str(models_dir)])
+    try:
+        for validate in (False, True):
+            output = subprocess.run(
+                [sys.executable, str(HERE / "benchmark_api.py"), "_run-jobs", "--comfy-url", url,
+                 "--jobs", str(args.jobs), "--steps", str(args.steps), "--bad-model", str(args.bad_model)]
+                + (["--validate-models", str(models_dir)] if validate else []),
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            if validate:
+                print(f"   validated before queueing   bad jobs rejected in {result['reject_ms']:.2f} ms ({result['rejected']}), "
+                      f"good jobs failed {result['good_failed']}")
+            else:
+                print(f"   sent to ComfyUI as is       bad jobs failed after {result['bad_failed_after']:.2f}s in the queue, "
+                      f"good jobs failed {result['good_failed']}")
+    finally:
+        proc.kill()
+        shutil.rmtree(models_dir, ignore_errors=True)
+
+# ============================================
+# fetch: every model downloaded up front vs fetched when a job first needs it
+# ============================================
+
+def run_fetch(args):
+    """Subprocess: jobs through the server's scheduler, with their models downloaded first or on demand"""
+    import json
+    import notebook_comfyui_api as api
+    from comfyui_backends import BackendPool, ComfyUIBackend
+    from job_scheduler import Job, JobScheduler
+    from model_downloader import ModelDownloader
+    from model_fetcher import ModelFetcher
+    from model_manifest import ModelInventory, load_manifest
+    from result_cache import ResultCache, workflow_key
+    from workflow_templates import workflow_model
+
+    api.comfy_pool = BackendPool([ComfyUIBackend(args.comfy_url)])
+    api.result_cache = ResultCache(disk_dir=None)
+    api.comfy_pool.check()
+    api.comfy_pool.start()
+    api.scheduler = JobScheduler(runner=api.run_generation_job, workers=api.comfy_pool.capacity, max_queue=args.jobs)
+    api.scheduler.start()
+    api.model_manifest = load_manifest(args.manifest)
+    api.model_inventory = ModelInventory(args.models_dir)
+    downloader = ModelDownloader(connections=args.connections, progress_interval=0.5)
+    events = []
+    api.model_fetcher = (ModelFetcher(downloader, api.model_manifest, api.model_inventory, args.models_dir,
+                                      on_progress=lambda fetch: events.append(fetch.state))
+                         if args.lazy else None)
+
+    start = time.time()
+    if not args.lazy:
+        downloader.download_all(api.model_manifest.downloads(args.models_dir))   # download_flux_model.py, then serve
+
+    # While serving, the event loop must keep turning (SocketIO, HTTP, ComfyUI events)
+    stall = {"max": 0.0, "running": True}
+
+    def ticker():
+        while stall["running"]:
+            before = time.perf_counter()
+            time.sleep(0.01)
+            stall["max"] = max(stall["max"], time.perf_counter() - before - 0.01)
+
+    threading.Thread(target=ticker, daemon=True).start()
+    jobs, needing = [], []
+    for i in range(args.jobs):
+        model = {"model": args.missing} if i % args.missing_every == args.missing_every - 1 else {}
+        prompt = f"benchmark prompt {i}"
+        workflow = api.build_generation_workflow(prompt, 512, 512, steps=args.steps, seed=i, **model)
+        job = Job(affinity=workflow_model(workflow), kind="rest", workflow=workflow,
+                  cache_key=workflow_key(workflow), prompt=prompt)
+        api.schedule_job(job, api.check_models(workflow))
+        jobs.append(job)
+        if model:
+            needing.append(job)
+    for job in jobs:
+        job.done.wait()
+    stall["running"] = False
+    present = [job.finished - start for job in jobs if job not in needing]
+    stats = api.model_fetcher.stats() if api.model_fetcher else {"started": 1, "joined": 0}
+    print(json.dumps({
+        "errors": sum(job.error is not None for job in jobs),
+        "first_image": min(job.finished for job in jobs) - start,
+        "present_p50": percentile(present, 50),
+        "needing_p50": percentile([job.finished - start for job in needing], 50),
+        "downloads": stats["started"],
+        "joined": stats["joined"],
+        "waiters": len(needing),
+        "progress_events": len(events),
+        "max_stall": stall["max"],
+    }), flush=True)
+
+
+def bench_fetch(args):
+    import json
+    import os
+    import shutil
+    import tempfile
+    from model_downloader import HASH_SUFFIX
+    from model_manifest import load_manifest
+
+    print_header(f"On-demand model fetch ({args.jobs} jobs, every {args.missing_every}th needs a {args.size} MB "
+                 f"model that is not on disk, {args.rate:g} MB/s per connection)")
+    root = Path(tempfile.mkdtemp(prefix="bench-fetch-"))
+    try:
+        missing = "flux1-krea-dev-fp8.safetensors"
+        source = root / "source"
+        source.mkdir()
+        (source / missing).write_bytes(os.urandom(args.size * 1024 * 1024))
+        server, base_url, counters = serve_ranges(source, args.rate)
+        models_dir = root / "models"
+        entries = []
+        for entry in load_manifest().bundle("flux-krea-dev"):
+            entry.path(models_dir).parent.mkdir(parents=True, exist_ok=True)
+            entry.path(models_dir).touch()
+            entries.append({"name": entry.name, "category": entry.category})
+        entries.append({"name": missing, "category": "unet", "url": f"{base_url}/{missing}"})
+        manifest = root / "models_manifest.json"
+        manifest.write_text(json.dumps({"models": entries}))
+        proc, url = start_fake_comfyui(args.step_time, ["--models-dir", str(models_dir)])
+        ok = True
+        try:
+            for lazy in (False, True):
+                for path in (models_dir / "unet" / missing, models_dir / "unet" / (missing + HASH_SUFFIX)):
+                    path.unlink(missing_ok=True)
+                served = counters["bytes"]
+                output = subprocess.run(
+                    [sys.executable, str(HERE / "benchmark_api.py"), "_run-fetch", "--comfy-url", url,
+                     "--manifest", str(manifest), "--models-dir", str(models_dir), "--missing", missing,
+                     "--jobs", str(args.jobs), "--missing-every", str(args.missing_every),
+                     "--steps", str(args.steps), "--connections", str(args.connections)]
+                    + (["--lazy"] if lazy else []),
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                fetched = counters["bytes"] - served
+                label = "fetched on demand" if lazy else "everything up front"
+                print(f"   {label:20s} first image {result['first_image']:5.2f}s  "
+                      f"present-model jobs p50 {result['present_p50']:5.2f}s  "
+                      f"jobs needing the model p50 {result['needing_p50']:5.2f}s  "
+                      f"downloaded {fetched / 1e6:.0f} MB  event loop stalled ≤{result['max_stall'] * 1000:.0f} ms  "
+                      f"errors {result['errors']}")
+                ok &= result["errors"] == 0 and fetched == args.size * 1024 * 1024 and result["downloads"] == 1
+            print(f"   {result['waiters']} jobs waited on {result['downloads']} download "
+                  f"({result['joined']} joined it in flight), {result['progress_events']} progress events")
+        finally:
+            proc.kill()
+            server.shutdown()
+        if not ok:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# ============================================
+# sessions: linear connected_users scan vs the bidirectional session registry
+# ============================================
+
+def bench_sessions(args):
+    import random
+    from session_registry import SessionRegistry
+
+    print_header(f"SocketIO session index ({args.connections:,} simulated connections)")
+    sids = [uuid.uuid4().hex for _ in range(args.connections)]
+    order = random.Random(1).sample(sids, len(sids))   # disconnect in random order
+
+    # The old handlers: {user_id: sid}, disconnect scans every entry for the sid
+    connected_users = {}
+    start = time.perf_counter()
+    for sid in sids:
+        connected_users[str(uuid.uuid4())] = sid
+    connect = time.perf_counter() - start
+    start = time.perf_counter()
+    for sid in order:
+        for uid, user_sid in list(connected_users.items()):
+            if user_sid == sid:
+                del connected_users[uid]
+                break
+    disconnect = time.perf_counter() - start
+    print(f"   {'dict + linear scan':20s} connect {connect / len(sids) * 1e6:8.1f} µs  "
+          f"disconnect {disconnect / len(sids) * 1e6:8.1f} µs  (total {connect + disconnect:6.2f}s)")
+
+    sessions = SessionRegistry()
+    start = time.perf_counter()
+    for sid in sids:
+        sessions.connect(sid)
+    connect = time.perf_counter() - start
+    start = time.perf_counter()
+    for sid in order:
+        sessions.disconnect(sid)
+    disconnect = time.perf_counter() - start
+    print(f"   {'SessionRegistry':20s} connect {connect / len(sids) * 1e6:8.1f} µs  "
+          f"disconnect {disconnect / len(sids) * 1e6:8.1f} µs  (total {connect + disconnect:6.2f}s)")
+
+    # Worker threads looking sessions up while connections churn
+    sessions = SessionRegistry()
+    users = [sessions.connect(sid)[0] for sid in sids]
+    stop = threading.Event()
+    lookups = [0] * args.threads
+
+    def worker(index):
+        rng = random.Random()
+        while not stop.is_set():
+            sessions.sids(rng.choice(users))
+            lookups[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    for sid, user_id in zip(order, users):
+        sessions.disconnect(sid)
+        sessions.connect(sid, user_id=user_id)
+    churn = time.perf_counter() - start
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f"   {'with ' + str(args.threads) + ' lookup threads':20s} reconnect {churn / len(sids) * 1e6:6.1f} µs  "
+          f"({sum(lookups):,} concurrent lookups, {len(sessions):,} users afterwards)")
+
+
+# ============================================
+# download: one file at a time over one connection vs parallel ranges
+# ============================================
+
+def serve_ranges(directory, rate, published=None):
+    """HTTP server for ``directory`` with Range support, ``rate`` MB/s per connection
+
+    ``published`` maps file names to the sha256 announced for them the way
+    Hugging Face does (X-Linked-ETag / X-Linked-Size).
+    Returns (server, base_url, counters); counters["bytes"] counts bytes sent.
+    """
+    import http.server
+    import re
+
+    counters = {"bytes": 0}
+    lock = threading.Lock()
+
+    class RangeHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            path = Path(directory) / self.path.lstrip("/")
+            if not path.is_file():
+                self.send_error(404)
+                return
+            size = path.stat().st_size
+            begin, end = 0, size - 1
+            match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if match:
+                begin = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {begin}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", f'"{size}-{int(path.stat().st_mtime)}"')
+            if published and path.name in published:
+                self.send_header("X-Linked-ETag", f'"{published[path.name]}"')
+                self.send_header("X-Linked-Size", str(size))
+            self.send_header("Content-Length", str(end - begin + 1))
+            self.end_headers()
+            block = 64 * 1024
+            with open(path, "rb") as f:
+                f.seek(begin)
+                remaining = end - begin + 1
+                while remaining > 0:
+                    data = f.read(min(block, remaining))
+                    try:
+                        self.wfile.write(data)
+                    except OSError:
+                        return
+                    remaining -= len(data)
+                    with lock:
+                        counters["bytes"] += len(data)
+                    time.sleep(len(data) / (rate * 1e6))
+
+    class RangeServer(http.server.ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            pass  # clients dropping connections is part of the test
+
+    server = RangeServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", counters
+
+
+def bench_download(args):
+    import hashlib
+    import os
+    import shutil
+    import tempfile
+    from model_downloader import ModelDownloader
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print_header(f"Model download ({'+'.join(map(str, sizes))} MB, {args.rate:g} MB/s per connection)")
+    root = Path(tempfile.mkdtemp(prefix="bench-download-"))
+    try:
+        source = root / "source"
+        source.mkdir()
+        digests = {}
+        for i, size in enumerate(sizes):
+            data = os.urandom(size * 1024 * 1024)
+            (source / f"model{i}.safetensors").write_bytes(data)
+            digests[f"model{i}.safetensors"] = hashlib.sha256(data).hexdigest()
+        server, base_url, counters = serve_ranges(source, args.rate, published=digests)
+
+        def run(label, target, **options):
+            files = [(f"{base_url}/{name}", target / name) for name in digests]
+            served = counters["bytes"]
+            start = time.perf_counter()
+            ModelDownloader(progress_interval=3600, **options).download_all(files)
+            elapsed = time.perf_counter() - start
+            intact = all(hashlib.sha256((target / name).read_bytes()).hexdigest() == digest
+                         for name, digest in digests.items())
+            print(f"   {label:34s} {elapsed:6.2f}s  {sum(sizes) / elapsed:6.1f} MB/s  "
+                  f"fetched {(counters['bytes'] - served) / 1e6:6.1f} MB  {'sha256 ok' if intact else 'CORRUPT'}")
+            return intact
+
+        ok = run("sequential, 1 connection (wget)", root / "sequential", connections=1, max_files=1)
+        ok &= run(f"parallel, {args.connections} ranges x all files", root / "parallel", connections=args.connections)
+
+        # Interrupted download: kill a downloader subprocess part way, then resume
+        target = root / "resumed"
+        child = subprocess.Popen([sys.executable, "-c", (
+            "import sys; sys.path.insert(0, sys.argv[1]); from model_downloader import ModelDownloader; "
+            "ModelDownloader(connections=int(sys.argv[3]), progress_interval=0.2)"
+            ".download_all([(sys.argv[2] + '/' + n, sys.argv[4] + '/' + n) for n in sys.argv[5:]])"),
+            str(HERE), base_url, str(args.connections), str(target), *digests],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        import json
+        checkpointed = 0
+        while checkpointed < sum(sizes) * 1024 * 1024 / 2 and child.poll() is None:
+            time.sleep(0.05)
+            try:
+                checkpointed = sum(sum(json.loads(path.read_text())["done"]) for path in target.glob("*.part.json"))
+            except (OSError, ValueError):
+                pass
+        child.kill()
+        child.wait()
+        print(f"   killed the downloader with {checkpointed / 1e6:.1f} MB checkpointed")
+        ok &= run("resumed after kill", target, connections=args.connections)
+        server.shutdown()
+        if not ok:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# ============================================
+# verify: SHA-256 while streaming vs a second pass, and sidecar-cached checks
+# ============================================
+
+def bench_verify(args):
+    import os
+    import shutil
+    import tempfile
+    from model_downloader import HASH_SUFFIX, IntegrityError, ModelDownloader, file_sha256
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    total = sum(sizes)
+    print_header(f"Model integrity ({'+'.join(map(str, sizes))} MB, {args.rate:g} MB/s per connection)")
+    root = Path(tempfile.mkdtemp(prefix="bench-verify-"))
+    try:
+        source = root / "source"
+        source.mkdir()
+        digests = {}
+        for i, size in enumerate(sizes):
+            path = source / f"model{i}.safetensors"
+            path.write_bytes(os.urandom(size * 1024 * 1024))
+            digests[path.name] = file_sha256(path)
+        server, base_url, _ = serve_ranges(source, args.rate, published=digests)
+        target = root / "models"
+        files = [(f"{base_url}/{name}", target / name) for name in digests]
+        downloader = ModelDownloader(connections=args.connections, progress_interval=3600)
+
+        start = time.perf_counter()
+        downloader.download_all(files)
+        streamed = time.perf_counter() - start
+        start = time.perf_counter()
+        second_pass = {name: file_sha256(target / name) for name in digests}
+        rehash = time.perf_counter() - start
+        ok = second_pass == digests
+        print(f"   download, hashed while streaming   {streamed:6.2f}s  (verified when the last byte lands)")
+        print(f"   a separate hash pass afterwards    +{rehash:5.2f}s  ({total / rehash:.0f} MB/s, page cache warm)")
+
+        for sidecar in target.glob(f"*{HASH_SUFFIX}"):
+            sidecar.unlink()
+        start = time.perf_counter()
+        for url, dest in files:
+            downloader.verify(url, dest)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        for url, dest in files:
+            downloader.verify(url, dest)
+        cached = time.perf_counter() - start
+        print(f"   startup check without sidecar      {cold * 1000:8.1f} ms  (re-hash)")
+        print(f"   startup check with sidecar         {cached * 1000:8.1f} ms  ({cold / cached:.0f}x faster)")
+
+        # A truncated file is rejected on its size, without reading it
+        victim = target / "model0.safetensors"
+        with open(victim, "rb+") as f:
+            f.truncate(victim.stat().st_size // 2)
+        start = time.perf_counter()
+        try:
+            downloader.verify(files[0][0], victim, sizes[0] * 1024 * 1024, digests[victim.name])
+            ok = False
+            print("   truncated file                     NOT DETECTED")
+        except IntegrityError:
+            print(f"   truncated file                     rejected in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        # A corrupted download never reaches its final name
+        with open(source / "model1.safetensors", "rb+") as f:
+            f.seek(12345)
+            byte = f.read(1)
+            f.seek(12345)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        corrupt = root / "corrupt" / "model1.safetensors"
+        try:
+            downloader.download(f"{base_url}/model1.safetensors", corrupt)
+            ok = False
+            print("   corrupted download                 NOT DETECTED")
+        except IntegrityError:
+            leftovers = [path.name for path in corrupt.parent.iterdir()]
+            ok &= not leftovers
+            print(f"   corrupted download                 rejected, left behind: {leftovers or 'nothing'}")
+        server.shutdown()
+        if not ok:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# ============================================
+# store: a model copy per ComfyUI tree vs links into the content-addressed store
+# ============================================
+
+def bench_store(args):
+    import os
+    import shutil
+    import tempfile
+    from model_store import ModelStore
+
+    print_header(f"Model store ({args.size} MB model, {args.trees} ComfyUI trees)")
+    root = Path(tempfile.mkdtemp(prefix="bench-store-"))
+
+    def disk_used(*directories):
+        inodes = {}
+        for directory in directories:
+            for path in Path(directory).rglob("*"):
+                if path.is_file() and not path.is_symlink():
+                    stat = path.stat()
+                    inodes[(stat.st_dev, stat.st_ino)] = stat.st_blocks * 512
+        return sum(inodes.values())
+
+    try:
+        model = root / "flux1-krea-dev.safetensors"
+        model.write_bytes(os.urandom(args.size * 1024 * 1024))
+        os.sync()
+
+        start = time.perf_counter()
+        for i in range(args.trees):
+            dest = root / "copies" / f"ComfyUI{i}" / "models" / "unet" / model.name
+            dest.parent.mkdir(parents=True)
+            shutil.copyfile(model, dest)
+        copied = time.perf_counter() - start
+        print(f"   copy per tree          {copied:8.3f}s  {disk_used(root / 'copies') / 1e6:8.0f} MB on disk")
+        shutil.rmtree(root / "copies")
+
+        store = ModelStore(root / "store")
+        start = time.perf_counter()
+        sha256 = store.add(model)
+        added = time.perf_counter() - start
+        ok = True
+        for mode in ("hardlink", "symlink"):
+            linker = ModelStore(root / "store", mode=mode)
+            start = time.perf_counter()
+            for i in range(args.trees):
+                linker.materialize(sha256, root / mode / f"ComfyUI{i}" / "models" / "unet" / model.name)
+            elapsed = time.perf_counter() - start
+            ok &= all((root / mode / f"ComfyUI{i}" / "models" / "unet" / model.name).stat().st_size == model.stat().st_size
+                      for i in range(args.trees))
+            print(f"   store + {mode:9s}      {elapsed:8.3f}s  {disk_used(root / 'store', root / mode) / 1e6:8.0f} MB on disk "
+                  f"({copied / elapsed:.0f}x faster)")
+        print(f"   (adding the model to the store once: {added:.3f}s, hashed)")
+
+        stats = store.stats()
+        print(f"   index: {stats['blobs']} blob, {stats['references']} references, "
+              f"{stats['bytes_saved'] / 1e6:.0f} MB saved by sharing")
+        model.unlink()
+        for mode in ("hardlink", "symlink"):
+            shutil.rmtree(root / mode)
+        deleted, freed = store.gc()
+        ok &= deleted == 1 and not store.has(sha256)
+        print(f"   gc after removing every tree: {deleted} blob, {freed / 1e6:.0f} MB freed")
+        if not ok:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ComfyUI API benchmarks (uses fake_comfyui.py)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("events", help="completion detection via /ws vs /history polling")
+    p.add_argument("--jobs", type=int, default=40)
+    p.add_argument("--steps", type=int, default=4)
+    p.add_argument("--step-time", type=float, default=0.01)
+    p.set_defaults(func=bench_events)
+
+    p = sub.add_parser("client", help="bare requests vs pooled keep-alive ComfyUIClient")
+    p.add_argument("--requests", type=int, default=500)
+    p.add_argument("--threads", type=int, default=8)
+    p.set_defaults(func=bench_client)
+
+    p = sub.add_parser("stream", help="REST image delivery: /tmp copy vs proxied stream")
+    p.add_argument("--requests", type=int, default=5)
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser("emit", help="SocketIO image_ready: base64 vs binary attachments")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_emit)
+
+    p = sub.add_parser("fairness", help="queue wait p50/p99 with FIFO vs per-user fair share")
+    p.add_argument("--noisy-jobs", type=int, default=50)
+    p.add_argument("--quiet-users", type=int, default=5)
+    p.add_argument("--quiet-jobs", type=int, default=2)
+    p.add_argument("--service-time", type=float, default=0.05)
+    p.set_defaults(func=bench_fairness)
+
+    p = sub.add_parser("backends", help="images/min with 1, 2, 4... ComfyUI backends behind the pool")
+    p.add_argument("--jobs", type=int, default=24)
+    p.add_argument("--max-backends", type=int, default=4)
+    p.add_argument("--steps", type=int, default=10)
+    p.add_argument("--step-time", type=float, default=0.05)
+    p.set_defaults(func=bench_backends)
+
+    p = sub.add_parser("affinity", help="model switches with FIFO vs model-affinity dispatch")
+    p.add_argument("--jobs", type=int, default=30)
+    p.add_argument("--mix", type=int, default=3, help="every Nth job uses the second model")
+    p.add_argument("--steps", type=int, default=10)
+    p.add_argument("--step-time", type=float, default=0.02)
+    p.add_argument("--model-load-time", type=float, default=2.0)
+    p.add_argument("--max-wait", type=float, default=30.0)
+    p.set_defaults(func=bench_affinity)
+
+    p = sub.add_parser("templates", help="deepcopy vs template rendering, plus a cross-request bleed check")
+    p.add_argument("--renders", type=int, default=20000)
+    p.add_argument("--bleed-renders", type=int, default=20000)
+    p.add_argument("--threads", type=int, default=8)
+    p.set_defaults(func=bench_templates)
+
+    p = sub.add_parser("submit", help="POST /prompt from graph dicts vs pre-encoded template JSON")
+    p.add_argument("--submissions", type=int, default=2000)
+    p.add_argument("--threads", type=int, default=4)
+    p.set_defaults(func=bench_submit)
+
+    p = sub.add_parser("conditioning", help="text encoding with and without the conditioning cache node")
+    p.add_argument("--jobs", type=int, default=30)
+    p.add_argument("--prompts", type=int, default=10, help="distinct prompts, cycled")
+    p.add_argument("--steps", type=int, default=10)
+    p.add_argument("--step-time", type=float, default=0.02)
+    p.add_argument("--encode-time", type=float, default=0.5)
+    p.set_defaults(func=bench_conditioning)
+
+    p = sub.add_parser("sessions", help="connect/disconnect cost: linear scan vs session registry")
+    p.add_argument("--connections", type=int, default=10000)
+    p.add_argument("--threads", type=int, default=4)
+    p.set_defaults(func=bench_sessions)
+
+    p = sub.add_parser("download", help="sequential single-connection vs parallel ranged, resumable downloads")
+    p.add_argument("--sizes", default="96,48,16", help="comma-separated file sizes in MB")
+    p.add_argument("--rate", type=float, default=16.0, help="server MB/s per connection")
+    p.add_argument("--connections", type=int, default=8)
+    p.set_defaults(func=bench_download)
+
+    p = sub.add_parser("verify", help="SHA-256 while streaming vs a second pass, and sidecar-cached startup checks")
+    p.add_argument("--sizes", default="512,256", help="comma-separated file sizes in MB")
+    p.add_argument("--rate", type=float, default=64.0, help="server MB/s per connection")
+    p.add_argument("--connections", type=int, default=8)
+    p.set_defaults(func=bench_verify)
+
+    p = sub.add_parser("store", help="per-tree model copies vs content-addressed store links")
+    p.add_argument("--size", type=int, default=512, help="model size in MB")
+    p.add_argument("--trees", type=int, default=3)
+    p.set_defaults(func=bench_store)
+
+    p = sub.add_parser("models", help="misconfigured jobs: failing in ComfyUI vs validated before queueing")
+    p.add_argument("--jobs", type=int, default=24)
+    p.add_argument("--bad-model", type=int, default=8, help="every Nth job loads a model that does not exist")
+    p.add_argument("--steps", type=int, default=8)
+    p.add_argument("--step-time", type=float, default=0.05)
+    p.set_defaults(func=bench_models)
+
+    p = sub.add_parser("fetch", help="models downloaded before serving vs fetched when a job first needs them")
+    p.add_argument("--jobs", type=int, default=24)
+    p.add_argument("--missing-every", type=int, default=4, help="every Nth job loads the model that is not on disk")
+    p.add_argument("--size", type=int, default=256, help="size of that model in MB")
+    p.add_argument("--rate", type=float, default=16, help="MB/s per connection")
+    p.add_argument("--connections", type=int, default=4)
+    p.add_argument("--steps", type=int, default=8)
+    p.add_argument("--step-time", type=float, default=0.05)
+    p.set_defaults(func=bench_fetch)
+
+    p = sub.add_parser("_run-jobs")  # internal: subprocess used by 'backends', 'affinity', 'conditioning' and 'models'
+    p.add_argument("--comfy-url", help="comma-separated for several backends")
+    p.add_argument("--jobs", type=int)
+    p.add_argument("--steps", type=int)
+    p.add_argument("--mix", type=int, default=0)
+    p.add_argument("--affinity", action="store_true")
+    p.add_argument("--affinity-wait", type=float, default=60.0)
+    p.add_argument("--prompts", type=int, default=0, help="distinct prompts, cycled (0 = all different)")
+    p.add_argument("--conditioning-cache", action="store_true")
+    p.add_argument("--bad-model", type=int, default=0, help="every Nth job loads a model that does not exist")
+    p.add_argument("--validate-models", help="models dir to check each job against before it is queued")
+    p.set_defaults(func=run_jobs)
+
+    p = sub.add_parser("_serve-delivery")  # internal: subprocess used by 'stream'
+    p.add_argument("--mode", choices=["tmpfile", "stream"])
+    p.add_argument("--comfy-url")
+    p.add_argument("--port", type=int)
+    p.add_argument("--width", type=int)
+    p.add_argument("--height", type=int)
+    p.set_defaults(func=serve_delivery)
+
+    p = sub.add_parser("_run-fetch")  # internal: subprocess used by 'fetch'
+    p.add_argument("--comfy-url")
+    p.add_argument("--manifest")
+    p.add_argument("--models-dir")
+    p.add_argument("--missing")
+    p.add_argument("--jobs", type=int)
+    p.add_argument("--missing-every", type=int)
+    p.add_argument("--steps", type=int)
+    p.add_argument("--connections", type=int)
+    p.add_argument("--lazy", action="store_true")
+    p.set_defaults(func=run_fetch)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Load balancing across several ComfyUI instances
+A container with several GPUs runs one ComfyUI per GPU, and more instances
+may run in other containers. The pool hands each prompt to the healthy
+backend with the least outstanding work, preferring one that already has
+the prompt's model loaded, and counts model switches (a different model
+loaded where another was resident) with the time their loader nodes took.
+A background thread polls every backend's /system_stats and /queue; a
+backend that stops answering is drained (gets no new prompts) until it
+answers again.
+
+Usage:
+    pool = BackendPool([ComfyUIBackend("http://localhost:8188"),
+                        ComfyUIBackend("http://localhost:8189")])
+    pool.start()
+    backend = pool.acquire(model="flux1-schnell.safetensors")
+    try:
+        backend.client.queue_prompt(workflow)
+    finally:
+        pool.release(backend, model="flux1-schnell.safetensors")
+"""
+
+import threading
+import time
+
+from comfyui_client import ComfyUIClient, ComfyUIEventListener
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+class NoBackendAvailable(Exception):
+    """Raised when no healthy ComfyUI backend had a free slot in time"""
+
+
+class ComfyUIBackend:
+    """One ComfyUI instance: HTTP client, /ws listener and health state
+
+    ``supervisor`` is the ComfyUISupervisor of a locally started instance
+    (None for instances started elsewhere). ``capacity`` is how many
+    prompts this API keeps in flight on it at once. ``client_options`` are
+    passed to ComfyUIClient.
+    """
+
+    def __init__(self, url, name=None, supervisor=None, capacity=1, **client_options):
+        self.client = ComfyUIClient(url, **client_options)
+        self.events = ComfyUIEventListener(self.client.base_url, self.client.client_id)
+        self.name = name or self.client.base_url.split("://", 1)[-1]
+        self.supervisor = supervisor
+        self.capacity = capacity
+        self.healthy = False
+        self.outstanding = 0       # prompts this API has in flight here
+        self.queue_depth = 0       # running + pending on ComfyUI (all clients) at the last check
+        self.model = None          # model of the last prompt run here (what ComfyUI has loaded)
+        self.failures = 0
+        self.last_check = None
+        self.vram_free = None
+        self.completed = 0
+        self.model_switches = 0
+        self.model_switch_seconds = 0.0
+
+    @property
+    def url(self):
+        return self.client.base_url
+
+    @property
+    def restarts(self):
+        """Restarts of a supervised instance (prompts from before a restart are lost)"""
+        return self.supervisor.restarts if self.supervisor else 0
+
+    @property
+    def load(self):
+        """Outstanding work: our prompts, or ComfyUI's whole queue if other clients use it too"""
+        return max(self.outstanding, self.queue_depth)
+
+    def stats(self):
+        stats = {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "capacity": self.capacity,
+            "queue_depth": self.queue_depth,
+            "model": self.model,
+            "model_switches": self.model_switches,
+            "model_switch_seconds": round(self.model_switch_seconds, 2),
+            "completed": self.completed,
+            "vram_free": self.vram_free,
+            "events_connected": self.events.connected,
+        }
+        if self.supervisor:
+            stats["process"] = self.supervisor.stats()
+        return stats
+
+
+class BackendPool:
+    """Least-outstanding-work dispatch over ComfyUI backends with health checks
+
+    A backend is marked unhealthy after ``unhealthy_after`` failed checks in
+    a row (at once if its supervised process is down) and healthy again
+    after one successful check.
+    """
+
+    def __init__(self, backends, check_interval=2.0, check_timeout=(1, 3), unhealthy_after=3):
+        if not backends:
+            raise ValueError("at least one ComfyUI backend is required")
+        self.backends = list(backends)
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.unhealthy_after = unhealthy_after
+        self.dispatched = 0
+        self.resident_hits = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @property
+    def capacity(self):
+        """Prompts the pool can run at once (size the scheduler's workers to this)"""
+        return sum(backend.capacity for backend in self.backends)
+
+    def start(self):
+        """Start the health-check thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._check_loop, daemon=True)
+            self._thread.start()
+
+    def get(self, name):
+        """Backend by name, or None"""
+        return next((backend for backend in self.backends if backend.name == name), None)
+
+    def healthy(self):
+        return [backend for backend in self.backends if backend.healthy]
+
+    def free_models(self):
+        """Models loaded on a healthy backend with a free slot (for the scheduler's affinity)"""
+        with self._cond:
+            return {backend.model for backend in self._free_backends() if backend.model is not None}
+
+    def acquire(self, model=None, timeout=300):
+        """Reserve a slot on the best backend for a prompt and return the backend
+
+        Among healthy backends with a free slot, one that already has
+        ``model`` loaded wins; ties go to the least loaded. Blocks until a
+        slot frees up; raises NoBackendAvailable after ``timeout`` seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._free_backends(), timeout):
+                raise NoBackendAvailable(f"no healthy ComfyUI backend had a free slot within {timeout}s")
+            backend = min(self._free_backends(), key=lambda b: (model is None or b.model != model, b.load))
+            backend.outstanding += 1
+            self.dispatched += 1
+            if model is not None and backend.model == model:
+                self.resident_hits += 1
+            return backend
+
+    def release(self, backend, model=None, lost=False, load_seconds=None):
+        """Give back a slot
+
+        ``model`` is what the finished prompt left loaded and
+        ``load_seconds`` how long its model loader node ran (None if it was
+        cached or not observed). ``lost`` means the prompt died with the
+        backend (restart or outage), which also took its loaded model.
+        """
+        with self._cond:
+            backend.outstanding -= 1
+            if lost:
+                backend.model = None
+            else:
+                backend.completed += 1
+                if model is not None and model != backend.model:
+                    if backend.model is not None:
+                        backend.model_switches += 1
+                        backend.model_switch_seconds += load_seconds or 0.0
+                        log(f"🔀 {backend.name} switched model {backend.model} -> {model}"
+                            + (f" ({load_seconds:.1f}s loading)" if load_seconds else ""))
+                    backend.model = model
+            self._cond.notify_all()
+
+    def check(self):
+        """Poll every backend once (also run periodically by the health thread)"""
+        for backend in self.backends:
+            self._check(backend)
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "backends": {backend.name: backend.stats() for backend in self.backends},
+                "healthy": len(self.healthy()),
+                "capacity": self.capacity,
+                "dispatched": self.dispatched,
+                "resident_model_hits": self.resident_hits,
+                "model_switches": sum(backend.model_switches for backend in self.backends),
+                "model_switch_seconds": round(sum(backend.model_switch_seconds for backend in self.backends), 2),
+            }
+
+    # ------------------------------------------------------------------
+    # internals
+    # ------------------------------------------------------------------
+
+    def _free_backends(self):
+        """Healthy backends with a free slot (called with the lock held)"""
+        return [backend for backend in self.backends
+                if backend.healthy and backend.outstanding < backend.capacity]
+
+    def _check_loop(self):
+        while True:
+            self.check()
+            time.sleep(self.check_interval)
+
+    def _check(self, backend):
+        supervisor = backend.supervisor
+        try:
+            if supervisor is not None and not supervisor.running:
+                raise RuntimeError("process is not running")
+            stats = backend.client.system_stats(timeout=self.check_timeout)
+            queue = backend.client.get_queue()
+        except Exception as e:
+            backend.failures += 1
+            down = supervisor is not None and not supervisor.running
+            if backend.healthy and (down or backend.failures >= self.unhealthy_after):
+                backend.healthy = False
+                log(f"🚧 ComfyUI backend {backend.name} is unhealthy ({e}) - draining it")
+            return
+        devices = stats.get("devices") or [{}]
+        backend.vram_free = devices[0].get("vram_free")
+        backend.queue_depth = len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+        backend.failures = 0
+        backend.last_check = time.time()
+        if not backend.healthy:
+            backend.healthy = True
+            log(f"✅ ComfyUI backend {backend.name} is healthy")
@@ -0,0 +1,383 @@
+"""
+ComfyUI client helpers shared by the API server
+Pooled keep-alive HTTP client for ComfyUI's REST API, plus a listener on its
+/ws event stream so callers can wait for a prompt without polling /history.
+
+Usage:
+    comfy = ComfyUIClient("http://localhost:8188")
+    events = ComfyUIEventListener(comfy.base_url, comfy.client_id)
+    events.start()
+    prompt_id = comfy.queue_prompt(workflow)["prompt_id"]
+    waiter = events.wait(prompt_id, timeout=30)
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+class ComfyUIClient:
+    """Pooled keep-alive HTTP client for one ComfyUI instance
+
+    All calls share one ``requests.Session`` so TCP connections are reused,
+    every call has a (connect, read) timeout, and failed calls are retried a
+    bounded number of times with jittered exponential backoff. Requests that
+    are not idempotent (POST /prompt) are only retried when the connection
+    could not be established, so a prompt is never queued twice.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, base_url, client_id=None, pool_size=16, connect_timeout=3.05,
+                 read_timeout=30, retries=2, backoff=0.25):
+        self.base_url = base_url.rstrip("/")
+        self.client_id = client_id or str(uuid.uuid4())
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, timeout=None, retries=None, idempotent=True, **kwargs):
+        """Send a request, retrying transient failures with jittered backoff"""
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}",
+                                                timeout=timeout or self.timeout, **kwargs)
+                if response.status_code not in self.RETRY_STATUSES or attempt == retries:
+                    return response
+                response.close()
+            except requests.ConnectTimeout:
+                if attempt == retries:
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == retries or not idempotent:
+                    raise
+            time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def system_stats(self, timeout=(1, 5), retries=0):
+        response = self.request("GET", "/system_stats", timeout=timeout, retries=retries)
+        response.raise_for_status()
+        return response.json()
+
+    def queue_prompt(self, workflow):
+        """Queue a workflow; returns ComfyUI's reply (prompt_id or node_errors)
+
+        ``workflow`` is a graph dict or its already-encoded JSON bytes (see
+        WorkflowTemplate.encode), which are sent without re-encoding.
+        """
+        if isinstance(workflow, bytes):
+            body = b'{"prompt":' + workflow + b',"client_id":' + json.dumps(self.client_id).encode("utf-8") + b"}"
+            return self.request("POST", "/prompt", data=body, idempotent=False,
+                                headers={"Content-Type": "application/json"}).json()
+        payload = {"prompt": workflow, "client_id": self.client_id}
+        return self.request("POST", "/prompt", json=payload, idempotent=False).json()
+
+    def object_info(self, node_class):
+        """Input/output spec of one node class ({} if ComfyUI does not have it)"""
+        response = self.request("GET", f"/object_info/{node_class}")
+        return response.json() if response.status_code == 200 else {}
+
+    def conditioning_cache_stats(self):
+        """Counters of the CachedCLIPTextEncode custom node (comfyui_conditioning_cache.py)"""
+        response = self.request("GET", "/conditioning_cache/stats")
+        response.raise_for_status()
+        return response.json()
+
+    def history(self, prompt_id):
+        return self.request("GET", f"/history/{prompt_id}").json()
+
+    def get_queue(self):
+        return self.request("GET", "/queue").json()
+
+    def delete_queued(self, prompt_ids):
+        """Remove prompts that have not started yet from ComfyUI's queue"""
+        self.request("POST", "/queue", json={"delete": list(prompt_ids)}).raise_for_status()
+
+    def interrupt(self, prompt_id=None):
+        """Interrupt the running prompt (newer ComfyUI only if it is ``prompt_id``)"""
+        body = {"prompt_id": prompt_id} if prompt_id else {}
+        self.request("POST", "/interrupt", json=body).raise_for_status()
+
+    def get_image(self, filename, subfolder, folder_type):
+        with self.open_image(filename, subfolder, folder_type) as response:
+            return response.content
+
+    def open_image(self, filename, subfolder, folder_type):
+        """Start a streaming GET /view; the caller must close the response"""
+        params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+        response = self.request("GET", "/view", params=params, timeout=(self.timeout[0], 120), stream=True)
+        if response.status_code != 200:
+            response.close()
+        response.raise_for_status()
+        return response
+
+
+PREVIEW_IMAGE = 1                 # [event][image type][image bytes]
+PREVIEW_IMAGE_WITH_METADATA = 4   # [event][metadata length][metadata JSON][image bytes]
+PREVIEW_IMAGE_TYPES = {1: "image/jpeg", 2: "image/png"}
+
+
+def decode_preview_frame(raw):
+    """Parse a binary ComfyUI websocket frame into a preview dict, or None
+
+    Returns ``{"image", "mime_type", "node", "prompt_id"}``; node and
+    prompt_id are only known for frames sent with metadata.
+    """
+    if len(raw) < 8:
+        return None
+    event = int.from_bytes(raw[:4], "big")
+    if event == PREVIEW_IMAGE:
+        image_type = int.from_bytes(raw[4:8], "big")
+        return {"image": bytes(raw[8:]), "mime_type": PREVIEW_IMAGE_TYPES.get(image_type, "image/jpeg"),
+                "node": None, "prompt_id": None}
+    if event == PREVIEW_IMAGE_WITH_METADATA:
+        length = int.from_bytes(raw[4:8], "big")
+        try:
+            metadata = json.loads(raw[8:8 + length])
+        except ValueError:
+            return None
+        return {"image": bytes(raw[8 + length:]), "mime_type": metadata.get("image_type", "image/jpeg"),
+                "node": metadata.get("node_id"), "prompt_id": metadata.get("prompt_id")}
+    return None
+
+
+class PromptWaiter:
+    """Execution state of one prompt, filled in from websocket messages"""
+
+    def __init__(self, prompt_id):
+        self.prompt_id = prompt_id
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = False
+        self.images = []
+        self.outputs = {}
+        self.error = None
+        self.on_event = None
+        self.cancelled = False
+
+
+class ComfyUIEventListener:
+    """Single shared listener on ComfyUI's /ws?clientId=... socket
+
+    ComfyUI only sends execution messages to the client_id a prompt was
+    queued with, so every prompt must be queued with ``self.client_id``.
+    Messages are routed to per-prompt waiters; waiters are created on
+    demand so a message that arrives before ``wait`` is called is not lost.
+    """
+
+    def __init__(self, base_url, client_id, finished_ttl=600):
+        self.base_url = base_url.rstrip("/")
+        self.client_id = client_id
+        self.ws_url = self.base_url.replace("http://", "ws://", 1).replace("https://", "wss://", 1)
+        self.ws_url = f"{self.ws_url}/ws?clientId={client_id}"
+        self.finished_ttl = finished_ttl
+        self.connected = False
+        self._waiters = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._last_prune = time.time()
+        self._running = None  # prompt currently executing (older ComfyUI omits prompt_id in progress)
+
+    @property
+    def available(self):
+        """True if websocket-client is installed"""
+        return websocket is not None
+
+    def start(self):
+        """Start the background listener thread"""
+        if not self.available:
+            log("⚠️  websocket-client not installed - falling back to /history polling")
+            return False
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stopped = True
+
+    def wait_connected(self, timeout=10):
+        """Block until the socket is connected (or timeout)"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.connected, timeout)
+
+    def wait(self, prompt_id, timeout=None):
+        """Wait for a prompt to finish
+
+        Returns the finished (or cancelled) PromptWaiter, or None if the
+        timeout expired or the socket dropped first (the caller should then
+        check /history).
+        """
+        with self._cond:
+            waiter = self._waiter(prompt_id)
+            self._cond.wait_for(lambda: waiter.done or waiter.cancelled or not self.connected, timeout)
+            return waiter if waiter.done or waiter.cancelled else None
+
+    def cancel(self, prompt_id):
+        """Release anyone waiting on a prompt that was cancelled
+
+        A prompt nobody tracks any more (e.g. after ``forget``) is left
+        alone: creating a waiter for it would never finish and leak.
+        """
+        with self._cond:
+            waiter = self._waiters.get(prompt_id)
+            if waiter is None:
+                return
+            waiter.cancelled = True
+            self._cond.notify_all()
+
+    def watch(self, prompt_id, callback):
+        """Call ``callback(msg_type, data)`` for the prompt's executing/progress messages
+
+        Binary preview frames are passed as msg_type "preview" with
+        ``{"image": bytes, "mime_type": ..., "node": node_id or None}``.
+        The callback runs on the listener thread and must not block.
+        """
+        with self._cond:
+            self._waiter(prompt_id).on_event = callback
+
+    def forget(self, prompt_id):
+        """Drop the state kept for a prompt"""
+        with self._cond:
+            self._waiters.pop(prompt_id, None)
+
+    def _waiter(self, prompt_id):
+        waiter = self._waiters.get(prompt_id)
+        if waiter is None:
+            waiter = self._waiters[prompt_id] = PromptWaiter(prompt_id)
+        return waiter
+
+    def _set_connected(self, connected):
+        with self._cond:
+            self.connected = connected
+            self._cond.notify_all()
+
+    def _run(self):
+        backoff = 1
+        while not self._stopped:
+            ws = None
+            try:
+                ws = websocket.create_connection(self.ws_url, timeout=10)
+                ws.settimeout(None)
+                self._set_connected(True)
+                log(f"🔌 ComfyUI event stream connected ({self.ws_url})")
+                backoff = 1
+                while not self._stopped:
+                    message = ws.recv()
+                    if isinstance(message, str):
+                        self._handle_message(message)
+                    elif message:
+                        self._handle_binary(message)
+            except Exception as e:
+                if self.connected:
+                    log(f"⚠️  ComfyUI event stream lost: {e}")
+            finally:
+                self._set_connected(False)
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+            if not self._stopped:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+
+    def _handle_message(self, raw):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+        msg_type = message.get("type")
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if not prompt_id and msg_type == "progress":
+            prompt_id = self._running
+        if not prompt_id:
+            return
+
+        notify = None
+        with self._cond:
+            waiter = self._waiter(prompt_id)
+            if msg_type == "execution_start":
+                waiter.started = time.time()
+                self._running = prompt_id
+            elif msg_type == "progress" or (msg_type == "executing" and data.get("node") is not None):
+                notify = waiter.on_event
+            elif msg_type == "executed":
+                output = data.get("output") or {}
+                images = output.get("images") or []
+                waiter.images.extend(images)
+                if images:
+                    waiter.outputs.setdefault(data.get("node"), []).extend(images)
+            elif msg_type in ("execution_error", "execution_interrupted"):
+                waiter.error = {
+                    "status_str": "error",
+                    "completed": False,
+                    "messages": [[msg_type, data]],
+                }
+                self._finish(waiter)
+            elif msg_type == "execution_success":
+                self._finish(waiter)
+            elif msg_type == "executing" and data.get("node") is None:
+                # ComfyUI signals the end of a prompt with node=None
+                self._finish(waiter)
+            self._prune()
+        if notify is not None:
+            try:
+                notify(msg_type, data)
+            except Exception as e:
+                log(f"⚠️  Progress callback failed for prompt {prompt_id}: {e}")
+
+    def _handle_binary(self, raw):
+        """Route a binary preview frame to the watcher of its prompt"""
+        preview = decode_preview_frame(raw)
+        if preview is None:
+            return
+        prompt_id = preview.pop("prompt_id", None) or self._running
+        with self._cond:
+            waiter = self._waiters.get(prompt_id) if prompt_id else None
+            notify = waiter.on_event if waiter is not None and not waiter.done else None
+        if notify is not None:
+            try:
+                notify("preview", preview)
+            except Exception as e:
+                log(f"⚠️  Preview callback failed for prompt {prompt_id}: {e}")
+
+    def _finish(self, waiter):
+        if self._running == waiter.prompt_id:
+            self._running = None
+        if not waiter.done:
+            waiter.done = True
+            waiter.finished = time.time()
+            self._cond.notify_all()
+
+    def _prune(self):
+        """Forget finished prompts nobody collected (called with the lock held)"""
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for prompt_id, waiter in list(self._waiters.items()):
+            if waiter.done and now - waiter.finished > self.finished_ttl:
+                del self._waiters[prompt_id]
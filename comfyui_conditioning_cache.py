@@ -0,0 +1,300 @@
+"""
+ComfyUI custom node: CLIPTextEncode with a conditioning cache
+The negative prompt is the same on every request and many positive prompts
+repeat, but ComfyUI only reuses a node's output while it stays in its own
+execution cache (the previous prompt), so T5-XXL + CLIP-L encode the same
+text again and again. CachedCLIPTextEncode keeps conditioning tensors in a
+memory LRU backed by an on-disk LRU, keyed by (encoder set, text), and
+reports hits and the encode time they saved on
+GET /conditioning_cache/stats.
+
+The API server copies this file into ComfyUI/custom_nodes/ and rewrites
+CLIPTextEncode nodes to CachedCLIPTextEncode when CONDITIONING_CACHE is on.
+The cache itself has no torch import at module level, so fake_comfyui.py
+can use it without a GPU.
+
+Usage:
+    cp comfyui_conditioning_cache.py /root/ComfyUI/custom_nodes/
+    # graph node:
+    {"class_type": "CachedCLIPTextEncode",
+     "inputs": {"clip": ["4", 0], "text": "...", "encoder": "DualCLIPLoader:clip_l.safetensors,t5xxl_fp16.safetensors,flux"}}
+"""
+
+import collections
+import hashlib
+import os
+import threading
+import time
+
+CACHE_DIR = os.environ.get("CONDITIONING_CACHE_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "conditioning"))
+MEMORY_BYTES = int(os.environ.get("CONDITIONING_CACHE_MEMORY_MB", "1024")) << 20
+DISK_BYTES = int(os.environ.get("CONDITIONING_CACHE_DISK_MB", "8192")) << 20
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+def conditioning_key(encoder, text):
+    """SHA-256 of (encoder set, text)"""
+    return hashlib.sha256(f"{encoder}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _nbytes(value):
+    """Bytes held by the tensors in a conditioning structure"""
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return value.element_size() * value.nelement()
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    return 64
+
+
+def _to_cpu(value):
+    """Copy of a conditioning structure with every tensor on the CPU"""
+    if hasattr(value, "cpu") and callable(value.cpu):
+        return value.cpu()
+    if isinstance(value, dict):
+        return {k: _to_cpu(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_cpu(v) for v in value)
+    return value
+
+
+class ConditioningCache:
+    """Two-tier (memory + disk) LRU of conditioning keyed by conditioning_key
+
+    Each entry remembers how long its encode took; a hit adds that time
+    (minus the disk load time for disk hits) to ``seconds_saved``.
+    ``save``/``load`` serialize values for the disk tier (torch.save and
+    torch.load by default); without a disk_dir only memory is used.
+    """
+
+    def __init__(self, memory_bytes=MEMORY_BYTES, disk_dir=None, disk_bytes=DISK_BYTES, save=None, load=None):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.disk_dir = disk_dir
+        self._save = save or _torch_save
+        self._load = load or _torch_load
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()   # key -> (value, size, encode_seconds)
+        self._memory_size = 0
+        self._disk = collections.OrderedDict()     # key -> size, oldest first
+        self._disk_size = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.encode_seconds = 0.0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def get(self, key):
+        """Cached conditioning or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self.seconds_saved += entry[2]
+                return entry[0]
+            on_disk = key in self._disk
+        if on_disk:
+            start = time.perf_counter()
+            try:
+                value, encode_seconds = self._load(self._path(key))
+            except Exception as e:
+                log(f"⚠️  Conditioning cache entry {key[:12]} unreadable: {e}")
+                self._drop_disk(key)
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                    self.seconds_saved += max(0.0, encode_seconds - (time.perf_counter() - start))
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                self._put_memory(key, value, encode_seconds)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value, encode_seconds):
+        """Store conditioning that took ``encode_seconds`` to compute"""
+        value = _to_cpu(value)
+        with self._lock:
+            self.encode_seconds += encode_seconds
+        self._put_memory(key, value, encode_seconds)
+        if self.disk_dir:
+            path = self._path(key)
+            try:
+                self._save((value, encode_seconds), path + ".tmp")
+                os.replace(path + ".tmp", path)
+                size = os.path.getsize(path)
+            except Exception as e:
+                log(f"⚠️  Could not write conditioning cache entry {key[:12]}: {e}")
+                return
+            with self._lock:
+                self._disk_size += size - self._disk.pop(key, 0)
+                self._disk[key] = size
+                evicted = self._evict_disk()
+            for old in evicted:
+                _remove(self._path(old))
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+                "seconds_saved": round(self.seconds_saved, 3),
+                "encode_seconds": round(self.encode_seconds, 3),
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_size,
+            }
+
+    # ------------------------------------------------------------------
+    # internals
+    # ------------------------------------------------------------------
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pt")
+
+    def _put_memory(self, key, value, encode_seconds):
+        size = _nbytes(value)
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= old[1]
+            self._memory[key] = (value, size, encode_seconds)
+            self._memory_size += size
+            while self._memory_size > self.memory_bytes:
+                _, (_, old_size, _) = self._memory.popitem(last=False)
+                self._memory_size -= old_size
+
+    def _evict_disk(self):
+        """Drop the oldest disk entries over budget (lock held); returns their keys"""
+        evicted = []
+        while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            evicted.append(key)
+        return evicted
+
+    def _drop_disk(self, key):
+        with self._lock:
+            self._disk_size -= self._disk.pop(key, 0)
+        _remove(self._path(key))
+
+    def _scan_disk(self):
+        """Index entries left by a previous run, oldest first"""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if name.endswith(".tmp"):
+                _remove(path)
+            elif name.endswith(".pt"):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-3], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        for key in self._evict_disk():
+            _remove(self._path(key))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _torch_save(value, path):
+    import torch
+    torch.save(value, path)
+
+
+def _torch_load(path):
+    import torch
+    try:
+        return torch.load(path, map_location="cpu", weights_only=True)
+    except TypeError:  # torch < 1.13
+        return torch.load(path, map_location="cpu")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide cache (created on first use)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ConditioningCache(disk_dir=CACHE_DIR)
+            log(f"🧠 Conditioning cache: {len(_cache._disk)} entries on disk in {CACHE_DIR}")
+        return _cache
+
+
+class CachedCLIPTextEncode:
+    """CLIPTextEncode that looks up (encoder, text) in the conditioning cache first
+
+    ``encoder`` names the text encoder files the clip input was loaded from;
+    the API fills it in from the graph's CLIP loader node.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "clip": ("CLIP",),
+                "text": ("STRING", {"multiline": True}),
+                "encoder": ("STRING", {"default": ""}),
+            }
+        }
+
+    RETURN_TYPES = ("CONDITIONING",)
+    FUNCTION = "encode"
+    CATEGORY = "conditioning"
+
+    def encode(self, clip, text, encoder):
+        cache = get_cache()
+        key = conditioning_key(encoder, text)
+        conditioning = cache.get(key) if encoder else None
+        if conditioning is not None:
+            return (conditioning,)
+        start = time.perf_counter()
+        tokens = clip.tokenize(text)
+        if hasattr(clip, "encode_from_tokens_scheduled"):
+            conditioning = clip.encode_from_tokens_scheduled(tokens)
+        else:
+            cond, pooled = clip.encode_from_tokens(tokens, return_pooled=True)
+            conditioning = [[cond, {"pooled_output": pooled}]]
+        if encoder:
+            cache.put(key, conditioning, time.perf_counter() - start)
+        return (conditioning,)
+
+
+NODE_CLASS_MAPPINGS = {"CachedCLIPTextEncode": CachedCLIPTextEncode}
+NODE_DISPLAY_NAME_MAPPINGS = {"CachedCLIPTextEncode": "CLIP Text Encode (cached)"}
+
+try:
+    from aiohttp import web
+    from server import PromptServer
+
+    @PromptServer.instance.routes.get("/conditioning_cache/stats")
+    async def conditioning_cache_stats(request):
+        return web.json_response(get_cache().stats())
+except Exception:  # not running inside ComfyUI
+    pass
@@ -0,0 +1,177 @@
+"""
+Supervisor for the ComfyUI subprocess
+ComfyUI writes a lot of log output. If nobody reads its stdout/stderr
+pipes, the OS pipe buffer (~64 KB) fills up and ComfyUI blocks on its next
+write, which looks like a generation that hangs forever. The supervisor
+drains the merged output on a background thread into a bounded ring buffer
+of recent lines, notices when the process exits, and restarts it with
+exponential backoff.
+
+Usage:
+    supervisor = ComfyUISupervisor(["python", "main.py", "--port", "8188"], cwd="/root/ComfyUI",
+                                   ready_check=lambda: comfy.system_stats() and True)
+    supervisor.start()
+    supervisor.wait_ready(timeout=60)
+    supervisor.tail(200)      # last log lines
+"""
+
+import collections
+import subprocess
+import threading
+import time
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+class ComfyUISupervisor:
+    """Runs ComfyUI, drains its output and restarts it when it dies
+
+    ``ready_check()`` should return truthy once ComfyUI answers HTTP; it may
+    raise while the process is still starting. ``on_restart()`` is called
+    after a crashed process has been replaced and is ready again.
+    """
+
+    MAX_LINE_LENGTH = 4096
+
+    def __init__(self, cmd, cwd=None, ready_check=None, on_restart=None, log_lines=2000,
+                 backoff=1.0, max_backoff=60.0, stable_after=60.0, echo=False):
+        self.cmd = cmd
+        self.cwd = cwd
+        self.ready_check = ready_check
+        self.on_restart = on_restart
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after   # uptime after which a crash resets the backoff
+        self.echo = echo                   # also print ComfyUI's output to our stdout
+        self.restarts = 0
+        self.last_exit_code = None
+        self.last_crash = None
+        self.process = None
+        self.ready = threading.Event()
+        self._lines = collections.deque(maxlen=log_lines)
+        self._lines_lock = threading.Lock()
+        self._stopped = False
+        self._spawned_at = None
+
+    def start(self):
+        """Spawn ComfyUI and the monitor thread (returns immediately)"""
+        self._spawn()
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def stop(self):
+        """Terminate ComfyUI and do not restart it"""
+        self._stopped = True
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+    def wait_ready(self, timeout=None):
+        """Block until ComfyUI answers ready_check (True) or timeout (False)"""
+        return self.ready.wait(timeout)
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def tail(self, lines=200):
+        """The last ``lines`` lines ComfyUI printed"""
+        with self._lines_lock:
+            if lines >= len(self._lines):
+                return list(self._lines)
+            return list(self._lines)[-lines:]
+
+    def stats(self):
+        return {
+            "pid": self.process.pid if self.process else None,
+            "running": self.running,
+            "ready": self.ready.is_set(),
+            "uptime": round(time.time() - self._spawned_at, 1) if self.running else 0.0,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "last_crash": self.last_crash,
+            "log_lines": len(self._lines),
+        }
+
+    # ------------------------------------------------------------------
+    # internals
+    # ------------------------------------------------------------------
+
+    def _spawn(self):
+        self.ready.clear()
+        self._append(f"--- supervisor: starting {' '.join(self.cmd)} ---")
+        self.process = subprocess.Popen(
+            self.cmd,
+            cwd=self.cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        self._spawned_at = time.time()
+        threading.Thread(target=self._drain, args=(self.process,), daemon=True).start()
+        threading.Thread(target=self._probe_ready, args=(self.process,), daemon=True).start()
+
+    def _drain(self, process):
+        """Read output until EOF so ComfyUI never blocks on a full pipe"""
+        for raw in iter(process.stdout.readline, b""):
+            line = raw.decode("utf-8", errors="replace").rstrip()
+            self._append(line)
+            if self.echo:
+                log(f"[ComfyUI] {line}")
+        process.stdout.close()
+
+    def _append(self, line):
+        if len(line) > self.MAX_LINE_LENGTH:
+            line = line[:self.MAX_LINE_LENGTH] + " …"
+        with self._lines_lock:
+            self._lines.append(line)
+
+    def _probe_ready(self, process):
+        """Poll ready_check until it passes or the process exits"""
+        while not self._stopped and process.poll() is None:
+            try:
+                if self.ready_check is None or self.ready_check():
+                    if process is self.process:
+                        self.ready.set()
+                    return
+            except Exception:
+                pass
+            time.sleep(0.5)
+
+    def _monitor(self):
+        delay = self.backoff
+        while not self._stopped:
+            process = self.process
+            code = process.wait()
+            if self._stopped:
+                return
+            uptime = time.time() - self._spawned_at
+            self.ready.clear()
+            self.last_exit_code = code
+            self.last_crash = time.time()
+            if uptime >= self.stable_after:
+                delay = self.backoff
+            log(f"💥 ComfyUI exited with code {code} after {uptime:.0f}s - restarting in {delay:g}s")
+            for line in self.tail(20):
+                log(f"   | {line}")
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+            if self._stopped:
+                return
+            self.restarts += 1
+            try:
+                self._spawn()
+            except OSError as e:
+                log(f"❌ Failed to restart ComfyUI: {e}")
+                continue
+            if self.on_restart:
+                threading.Thread(target=self._after_restart, daemon=True).start()
+
+    def _after_restart(self):
+        if self.wait_ready(timeout=300):
+            log(f"✅ ComfyUI restarted (restart #{self.restarts})")
+            try:
+                self.on_restart()
+            except Exception as e:
+                log(f"⚠️  ComfyUI restart callback failed: {e}")
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Fake ComfyUI server for local testing and benchmarks
+Speaks the subset of the ComfyUI HTTP + websocket API used by the API server
+(/prompt, /history, /view, /queue, /interrupt, /system_stats, /ws) and emits
+the same websocket message shapes (including binary preview frames), without
+a GPU.
+
+Usage:
+    python fake_comfyui.py --port 8188 --step-time 0.05 [--previews] [--model-load-time 5]
+                           [--encode-time 0.5] [--models-dir /tmp/models]
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from eventlet import wsgi, websocket
+from eventlet.queue import Queue
+
+from comfyui_conditioning_cache import ConditioningCache, conditioning_key
+from model_manifest import ModelInventory, model_references
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+MODEL_LOADERS = {"UNETLoader": "unet_name", "CheckpointLoaderSimple": "ckpt_name"}
+TEXT_ENCODERS = ("CLIPTextEncode", "CachedCLIPTextEncode")
+
+
+class FakeComfyUI:
+    """In-process state of the fake server"""
+
+    def __init__(self, step_time=0.05, node_time=0.001, previews=False, preview_bytes=24 * 1024,
+                 model_load_time=0.0, encode_time=None, models_dir=None):
+        self.step_time = step_time
+        self.node_time = node_time
+        self.previews = previews                # send a preview frame after every sampler step
+        self.preview_bytes = preview_bytes
+        self.model_load_time = model_load_time  # loader node cost when the model is not the loaded one
+        self.loaded_model = None
+        self.encode_time = node_time if encode_time is None else encode_time  # per text encoder node
+        self.conditioning_cache = ConditioningCache()   # backs the fake CachedCLIPTextEncode (memory only)
+        self.last_encodes = set()   # encoder nodes of the previous prompt (ComfyUI's own output cache)
+        self.models = ModelInventory(models_dir) if models_dir else None   # rejects prompts naming other files
+        self.queue = Queue()
+        self.pending = []           # [number, prompt_id, prompt, extra, outputs]
+        self.running = None
+        self.history = {}
+        self.images = {}            # filename -> size in bytes
+        self.clients = {}           # client_id -> set of websockets
+        self.counter = 0
+        self.interrupted = False
+
+    # ------------------------------------------------------------------
+    # websocket
+    # ------------------------------------------------------------------
+
+    def send(self, client_id, msg_type, data):
+        message = json.dumps({"type": msg_type, "data": data})
+        targets = self.clients.get(client_id, ()) if client_id else [
+            ws for sockets in self.clients.values() for ws in sockets
+        ]
+        for ws in list(targets):
+            try:
+                ws.send(message)
+            except Exception:
+                pass
+
+    def send_preview(self, client_id):
+        """Binary PREVIEW_IMAGE frame: event 1, image type 1 (JPEG), image bytes"""
+        frame = (1).to_bytes(4, "big") + (1).to_bytes(4, "big") + b"\xff\xd8" + os.urandom(self.preview_bytes - 2)
+        for ws in list(self.clients.get(client_id, ())):
+            try:
+                ws.send(frame)
+            except Exception:
+                pass
+
+    def queue_status(self):
+        remaining = len(self.pending) + (1 if self.running else 0)
+        return {"status": {"exec_info": {"queue_remaining": remaining}}}
+
+    def ws_handler(self, ws):
+        query = parse_qs(ws.environ.get("QUERY_STRING", ""))
+        client_id = query.get("clientId", [uuid.uuid4().hex])[0]
+        self.clients.setdefault(client_id, set()).add(ws)
+        try:
+            ws.send(json.dumps({"type": "status", "data": dict(self.queue_status(), sid=client_id)}))
+            while ws.wait() is not None:
+                pass
+        finally:
+            self.clients.get(client_id, set()).discard(ws)
+
+    # ------------------------------------------------------------------
+    # execution
+    # ------------------------------------------------------------------
+
+    def image_size(self, prompt):
+        """Rough PNG size for the requested latent (~1.5 bytes/pixel)"""
+        for node in prompt.values():
+            if node.get("class_type") == "EmptyLatentImage":
+                inputs = node["inputs"]
+                return int(inputs.get("width", 1024) * inputs.get("height", 1024) * 1.5)
+        return 1024 * 1024
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            if item not in self.pending:
+                continue  # deleted from the queue
+            self.pending.remove(item)
+            self.running = item
+            try:
+                self.execute(item)
+            finally:
+                self.running = None
+                self.interrupted = False
+                self.send(None, "status", self.queue_status())
+
+    def execute(self, item):
+        number, prompt_id, prompt, extra, _ = item
+        client_id = extra.get("client_id")
+        self.send(client_id, "execution_start", {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)})
+        self.send(client_id, "execution_cached", {"nodes": [], "prompt_id": prompt_id})
+
+        outputs = {}
+        encodes = set()
+        for node_id, node in prompt.items():
+            if self.interrupted:
+                data = {"prompt_id": prompt_id, "node_id": node_id, "node_type": node.get("class_type"), "executed": []}
+                self.send(client_id, "execution_interrupted", data)
+                self.history[prompt_id] = {
+                    "prompt": [number, prompt_id, prompt, extra, []],
+                    "outputs": {},
+                    "status": {"status_str": "error", "completed": False, "messages": [["execution_interrupted", data]]},
+                }
+                return
+            class_type = node.get("class_type")
+            if class_type in MODEL_LOADERS:
+                model = node["inputs"].get(MODEL_LOADERS[class_type])
+                if model == self.loaded_model:
+                    continue  # cached: ComfyUI does not execute it again
+                self.loaded_model = model
+            if class_type in TEXT_ENCODERS:
+                signature = json.dumps([class_type, node["inputs"]], sort_keys=True)
+                encodes.add(signature)
+                if signature in self.last_encodes:
+                    continue  # same node as in the previous prompt: ComfyUI reuses its output
+            self.send(client_id, "executing", {"node": node_id, "display_node": node_id, "prompt_id": prompt_id})
+            if class_type in MODEL_LOADERS:
+                eventlet.sleep(self.model_load_time)
+            elif class_type in TEXT_ENCODERS:
+                self.encode(node)
+            elif class_type == "KSampler":
+                steps = int(node["inputs"].get("steps", 1))
+                for step in range(1, steps + 1):
+                    if self.interrupted:
+                        break
+                    eventlet.sleep(self.step_time)
+                    self.send(client_id, "progress", {"value": step, "max": steps, "prompt_id": prompt_id, "node": node_id})
+                    if self.previews:
+                        self.send_preview(client_id)
+            else:
+                eventlet.sleep(self.node_time)
+            if class_type == "SaveImage":
+                filename = f"{node['inputs'].get('filename_prefix', 'ComfyUI')}_{self.counter:05d}_.png"
+                self.counter += 1
+                self.images[filename] = self.image_size(prompt)
+                outputs[node_id] = {"images": [{"filename": filename, "subfolder": "", "type": "output"}]}
+                self.send(client_id, "executed", {"node": node_id, "display_node": node_id, "output": outputs[node_id], "prompt_id": prompt_id})
+
+        self.last_encodes = encodes
+        success = {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)}
+        self.history[prompt_id] = {
+            "prompt": [number, prompt_id, prompt, extra, list(outputs)],
+            "outputs": outputs,
+            "status": {"status_str": "success", "completed": True, "messages": [["execution_success", success]]},
+        }
+        self.send(client_id, "execution_success", success)
+        self.send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+
+    def encode(self, node):
+        """Text encoder: encode_time, unless a CachedCLIPTextEncode hits its cache"""
+        if node["class_type"] == "CLIPTextEncode":
+            eventlet.sleep(self.encode_time)
+            return
+        key = conditioning_key(node["inputs"].get("encoder", ""), node["inputs"].get("text", ""))
+        if self.conditioning_cache.get(key) is None:
+            eventlet.sleep(self.encode_time)
+            self.conditioning_cache.put(key, "conditioning", self.encode_time)
+
+    def validate_models(self, prompt):
+        """ComfyUI's "Value not in list" node_errors for model files missing from --models-dir"""
+        node_errors = {}
+        if self.models is None:
+            return node_errors
+        for node_id, class_type, input_name, name, category in model_references(prompt):
+            if not self.models.has(category, name):
+                node_errors.setdefault(node_id, {"errors": [], "class_type": class_type})["errors"].append({
+                    "type": "value_not_in_list", "message": "Value not in list",
+                    "details": f"{input_name}: '{name}' not in list"})
+        return node_errors
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    def image_bytes(self, size):
+        """Pseudo-PNG payload of the given size"""
+        block = PNG_SIGNATURE + os.urandom(65536 - len(PNG_SIGNATURE))
+        full, rest = divmod(size, len(block))
+        for _ in range(full):
+            yield block
+        if rest:
+            yield block[:rest]
+
+    def app(self, environ, start_response):
+        path = environ["PATH_INFO"]
+        method = environ["REQUEST_METHOD"]
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+
+        def reply(body, status="200 OK"):
+            payload = json.dumps(body).encode()
+            start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(payload)))])
+            return [payload]
+
+        def read_json():
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            return json.loads(environ["wsgi.input"].read(length) or b"{}")
+
+        if path == "/ws":
+            return websocket.WebSocketWSGI(self.ws_handler)(environ, start_response)
+        if path == "/system_stats":
+            return reply({
+                "system": {"os": "posix", "python_version": "fake", "comfyui_version": "fake"},
+                "devices": [{"name": "fake-gpu", "type": "cuda", "vram_total": 24 << 30, "vram_free": 20 << 30}],
+            })
+        if path == "/prompt" and method == "POST":
+            body = read_json()
+            node_errors = self.validate_models(body["prompt"])
+            if node_errors:
+                return reply({"error": {"type": "prompt_outputs_failed_validation",
+                                        "message": "Prompt outputs failed validation", "details": ""},
+                              "node_errors": node_errors}, "400 Bad Request")
+            prompt_id = str(uuid.uuid4())
+            item = [self.counter, prompt_id, body["prompt"], {"client_id": body.get("client_id")}, []]
+            self.counter += 1
+            self.pending.append(item)
+            self.queue.put(item)
+            self.send(None, "status", self.queue_status())
+            return reply({"prompt_id": prompt_id, "number": item[0], "node_errors": {}})
+        if path.startswith("/object_info/"):
+            node_class = path[len("/object_info/"):]
+            known = node_class in TEXT_ENCODERS + tuple(MODEL_LOADERS) + ("KSampler", "SaveImage")
+            return reply({node_class: {"name": node_class}} if known else {})
+        if path == "/conditioning_cache/stats":
+            return reply(self.conditioning_cache.stats())
+        if path.startswith("/history/"):
+            prompt_id = path[len("/history/"):]
+            entry = self.history.get(prompt_id)
+            return reply({prompt_id: entry} if entry else {})
+        if path == "/queue" and method == "GET":
+            running = [self.running[:4]] if self.running else []
+            return reply({"queue_running": running, "queue_pending": [item[:4] for item in self.pending]})
+        if path == "/queue" and method == "POST":
+            body = read_json()
+            if body.get("clear"):
+                self.pending.clear()
+            for prompt_id in body.get("delete", []):
+                self.pending[:] = [item for item in self.pending if item[1] != prompt_id]
+            return reply({})
+        if path == "/interrupt" and method == "POST":
+            if self.running:
+                self.interrupted = True
+            return reply({})
+        if path == "/view":
+            filename = query.get("filename", [""])[0]
+            size = self.images.get(filename)
+            if size is None:
+                start_response("404 Not Found", [("Content-Type", "text/plain")])
+                return [b"not found"]
+            start_response("200 OK", [("Content-Type", "image/png"), ("Content-Length", str(size))])
+            return self.image_bytes(size)
+
+        start_response("404 Not Found", [("Content-Type", "text/plain")])
+        return [b"not found"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake ComfyUI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--step-time", type=float, default=0.05, help="seconds per sampler step")
+    parser.add_argument("--node-time", type=float, default=0.001, help="seconds per non-sampler node")
+    parser.add_argument("--previews", action="store_true", help="send a binary preview frame per sampler step")
+    parser.add_argument("--model-load-time", type=float, default=0.0,
+                        help="seconds a model loader node takes when it loads a different model")
+    parser.add_argument("--encode-time", type=float, default=None,
+                        help="seconds per text encoder node (CachedCLIPTextEncode: cache misses only)")
+    parser.add_argument("--models-dir", help="reject prompts whose loaders name files missing from this models dir")
+    args = parser.parse_args()
+
+    server = FakeComfyUI(step_time=args.step_time, node_time=args.node_time, previews=args.previews,
+                         model_load_time=args.model_load_time, encode_time=args.encode_time,
+                         models_dir=args.models_dir)
+    eventlet.spawn_n(server.worker)
+    print(f"🧪 Fake ComfyUI listening on http://{args.host}:{args.port}", flush=True)
+    wsgi.server(eventlet.listen((args.host, args.port)), server.app, log_output=False)
+
+
+if __name__ == "__main__":
+    main()
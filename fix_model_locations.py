@@ -1,19 +1,28 @@
 #!/usr/bin/env python3
 """
 Fix Model File Locations for ComfyUI
-Moves FLUX model files to correct directories
+Moves model files found in the wrong models/ folder to the one
+models_manifest.json assigns them
+With MODEL_STORE set, the files are then adopted into the shared
+content-addressed store (model_store.py) and replaced by links to it
 """
 
 import os
 import shutil
-from pathlib import Path
+
+from model_manifest import load_manifest
+
+# Shared content-addressed model store (optional)
+MODEL_STORE = os.environ.get("MODEL_STORE")
 
 # Directories
 COMFYUI_DIR = "/root/ComfyUI"
-CHECKPOINTS_DIR = f"{COMFYUI_DIR}/models/checkpoints"
-UNET_DIR = f"{COMFYUI_DIR}/models/unet"
-VAE_DIR = f"{COMFYUI_DIR}/models/vae"
-CLIP_DIR = f"{COMFYUI_DIR}/models/clip"
+MODELS_DIR = f"{COMFYUI_DIR}/models"
+
+# Models to place: a bundle of models_manifest.json
+MODEL_BUNDLE = "flux-krea-dev"
+MANIFEST = load_manifest()
+MODELS = MANIFEST.bundle(MODEL_BUNDLE)
 
 def print_header(text):
     print("\n" + "=" * 70)
@@ -24,61 +33,47 @@ def create_directories():
     """Create necessary directories"""
     print_header("Creating Directories")
     
-    dirs = [UNET_DIR, VAE_DIR, CLIP_DIR]
-    for directory in dirs:
-        Path(directory).mkdir(parents=True, exist_ok=True)
+    for directory in sorted({entry.path(MODELS_DIR).parent for entry in MODELS}):
+        directory.mkdir(parents=True, exist_ok=True)
         print(f"✅ {directory}")
 
 def move_files():
     """Move files to correct locations"""
     print_header("Moving Files to Correct Locations")
     
-    checkpoints_path = Path(CHECKPOINTS_DIR)
-    
-    # Move FLUX UNET model
-    flux_file = checkpoints_path / "flux1-krea-dev.safetensors"
-    if flux_file.exists():
-        dest = Path(UNET_DIR) / "flux1-krea-dev.safetensors"
-        if not dest.exists():
-            print(f"📁 Moving flux1-krea-dev.safetensors: checkpoints/ -> unet/")
-            shutil.move(str(flux_file), str(dest))
-            print(f"   ✅ Moved to {dest}")
-        else:
-            print(f"   ℹ️  flux1-krea-dev.safetensors already in unet/")
-    else:
-        print(f"   ⚠️  flux1-krea-dev.safetensors not found in checkpoints/")
+    misplaced = MANIFEST.misplaced(MODELS_DIR, bundle=MODEL_BUNDLE)
+    for entry, found in misplaced:
+        dest = entry.path(MODELS_DIR)
+        print(f"📁 Moving {entry.name}: {found.parent.name}/ -> {entry.category}/")
+        shutil.move(str(found), str(dest))
+        print(f"   ✅ Moved to {dest}")
+    if not misplaced:
+        print("   ℹ️  Nothing to move")
+
+def adopt_into_store():
+    """Keep each model once in the shared store and link it back into place"""
+    print_header(f"Adopting Models into {MODEL_STORE}")
+    from model_store import ModelStore
     
-    # Move VAE file
-    vae_file = checkpoints_path / "ae.safetensors"
-    if vae_file.exists():
-        dest = Path(VAE_DIR) / "ae.safetensors"
-        if not dest.exists():
-            print(f"📁 Moving ae.safetensors: checkpoints/ -> vae/")
-            shutil.move(str(vae_file), str(dest))
-            print(f"   ✅ Moved to {dest}")
-        else:
-            print(f"   ℹ️  ae.safetensors already in vae/")
-    else:
-        print(f"   ⚠️  ae.safetensors not found in checkpoints/")
+    store = ModelStore(MODEL_STORE)
+    for entry in MODELS:
+        path = entry.path(MODELS_DIR)
+        if path.exists():
+            sha256 = store.add(path)
+            print(f"🔗 {path.name} -> blob {sha256[:12]}")
 
 def verify_locations():
     """Verify all files are in correct locations"""
     print_header("Verifying File Locations")
     
-    checks = {
-        "UNET Model": Path(UNET_DIR) / "flux1-krea-dev.safetensors",
-        "VAE Model": Path(VAE_DIR) / "ae.safetensors",
-        "CLIP Encoder": Path(CLIP_DIR) / "clip_l.safetensors",
-        "T5 Encoder": Path(CLIP_DIR) / "t5xxl_fp16.safetensors",
-    }
-    
     all_good = True
-    for name, filepath in checks.items():
+    for entry in MODELS:
+        filepath = entry.path(MODELS_DIR)
         if filepath.exists():
             size_mb = filepath.stat().st_size / (1024 * 1024)
-            print(f"✅ {name}: {filepath.name} ({size_mb:.0f} MB)")
+            print(f"✅ {entry.description or entry.name}: {entry.category}/{filepath.name} ({size_mb:.0f} MB)")
         else:
-            print(f"❌ {name}: NOT FOUND at {filepath}")
+            print(f"❌ {entry.description or entry.name}: NOT FOUND at {filepath}")
             all_good = False
     
     return all_good
@@ -92,6 +87,8 @@ def main():
     
     create_directories()
     move_files()
+    if MODEL_STORE:
+        adopt_into_store()
     
     if verify_locations():
         print_header("🎉 All Files in Correct Locations!")
@@ -0,0 +1,479 @@
+"""
+Bounded job scheduler for the ComfyUI API server
+A fixed pool of workers (sized to how many prompts the GPU can run at once)
+pulls jobs from a queue with a maximum depth. Submitting to a full queue
+raises QueueFull so the caller can reject the request instead of piling
+prompts onto ComfyUI.
+
+The queue is not FIFO across users: jobs are grouped by priority tier
+(strict priority between tiers) and, within a tier, by user_id, and users
+are served round-robin. One user sending 50 requests therefore delays
+everyone else by at most one job per round, and per-user caps bound how
+many jobs one user may have waiting or running.
+
+With model affinity on, jobs whose model (``affinity``) is already loaded
+on a free backend are dispatched ahead of that order, so model switches are
+amortized over runs of same-model jobs. A job may only jump ahead of jobs
+submitted at most ``max_affinity_wait`` seconds before it, so a job needing
+another model is delayed by at most that much compared to plain order.
+
+Queued jobs can be cancelled outright; running jobs are flagged with
+``cancelled`` and left to the runner, which owns the ComfyUI prompt.
+
+A job that cannot run yet (its models are still being downloaded) can be
+held instead of queued: it is "fetching", takes no queue slot, and is
+queued by ``release`` once it can run.
+
+A scheduler whose workers will never run (ComfyUI failed to start) is
+closed: its waiting jobs fail and new ones are refused with SchedulerClosed.
+
+Usage:
+    scheduler = JobScheduler(runner=run_jobs, workers=1, max_queue=32)
+    scheduler.start()
+    position = scheduler.submit(Job(user_id=user_id, on_position=notify))
+
+    scheduler.hold(job)                  # waiting for something else first
+    scheduler.release(job)               # ... now queue it (or release(job, error=...))
+"""
+
+import collections
+import itertools
+import threading
+import time
+import traceback
+import uuid
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+def percentile(values, pct):
+    """Percentile of a sequence, the sorted value at the rounded index pct% of the way through (0.0 if empty)
+
+    Same method as benchmark_api.percentile, so server and benchmark figures compare.
+    """
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted to a scheduler whose queue is full"""
+
+
+class UserQueueFull(QueueFull):
+    """Raised when the submitting user already has the maximum number of jobs waiting"""
+
+
+class SchedulerClosed(QueueFull):
+    """Raised when a job is submitted to a scheduler that was closed"""
+
+
+class Job:
+    """One generation request waiting for (or holding) a worker
+
+    The runner fills in ``result`` or ``error``. ``on_position(job, position)``
+    is called whenever the job's 1-based place in the queue changes and
+    ``on_done(job)`` once it has finished. ``priority`` names a scheduler tier
+    (None for the scheduler's default). ``affinity`` is the model the job
+    needs loaded (None if unknown). ``cancelled`` is set by
+    ``JobScheduler.cancel``; runners should stop work for such jobs.
+    """
+
+    __slots__ = ("id", "user_id", "on_position", "on_done", "priority", "affinity", "params",
+                 "state", "position", "submitted", "started", "finished", "result", "error", "done",
+                 "progress", "cancelled")
+
+    def __init__(self, user_id=None, on_position=None, on_done=None, priority=None, affinity=None, **params):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.on_position = on_position
+        self.on_done = on_done
+        self.priority = priority
+        self.affinity = affinity
+        self.params = params
+        self.state = "queued"
+        self.position = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.cancelled = False
+        self.done = threading.Event()
+
+
+class JobScheduler:
+    """Fixed-size worker pool in front of ComfyUI with a bounded fair-share queue
+
+    ``runner(job)`` is called with each job in turn and must set its
+    ``result`` or ``error``.
+
+    ``priorities`` lists the tiers from highest to lowest. With
+    ``fair_share`` off every job shares one bucket, which is plain FIFO
+    within a tier. ``max_user_queue`` caps a user's waiting jobs (further
+    submits raise UserQueueFull) and ``max_user_running`` caps how many of
+    a user's jobs run at once; None disables a cap.
+
+    ``resident()`` returns the affinity keys (model names) loaded on a
+    backend that could take a job right now; None turns model affinity off.
+    Queue positions reported to clients ignore affinity.
+    """
+
+    def __init__(self, runner, workers=1, max_queue=32,
+                 priorities=("normal",), default_priority=None, fair_share=True,
+                 max_user_queue=None, max_user_running=None, resident=None, max_affinity_wait=60.0,
+                 wait_samples=1000):
+        self.runner = runner
+        self.workers = workers
+        self.max_queue = max_queue
+        self.priorities = tuple(priorities)
+        self.default_priority = default_priority or self.priorities[0]
+        self.fair_share = fair_share
+        self.max_user_queue = max_user_queue
+        self.max_user_running = max_user_running
+        self.resident = resident
+        self.max_affinity_wait = max_affinity_wait
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.closed = None          # the reason, once closed
+        self.affinity_hits = 0      # jobs dispatched ahead of their turn because their model was loaded
+        self.affinity_overdue = 0   # dispatches where max_affinity_wait stopped such a jump
+        self._queued = 0
+        # tier -> {user key: deque of jobs}; dict order is the round-robin order
+        self._tiers = {tier: collections.OrderedDict() for tier in self.priorities}
+        self._user_queued = collections.Counter()
+        self._user_running = collections.Counter()
+        self._held = set()
+        self._user_held = collections.Counter()
+        self._tier_completed = collections.Counter()
+        self._waits = {tier: collections.deque(maxlen=wait_samples) for tier in self.priorities}
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads (jobs submitted earlier wait in the queue)"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job):
+        """Queue a job and return its 1-based position
+
+        Raises QueueFull if ``max_queue`` jobs are already waiting,
+        UserQueueFull if the job's user is at ``max_user_queue``,
+        SchedulerClosed once ``close`` was called, and ValueError for an
+        unknown priority.
+        """
+        self._check_priority(job)
+        key = self._user_key(job)
+        with self._cond:
+            self._check_open()
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"queue is full ({self.max_queue} jobs waiting)")
+            self._check_user_queue(key)
+            self._tiers[job.priority].setdefault(key, collections.deque()).append(job)
+            self._user_queued[key] += 1
+            self._queued += 1
+            job.position = self._dispatch_order().index(job) + 1
+            self._cond.notify()
+            return job.position
+
+    def hold(self, job):
+        """Accept a job that cannot be queued yet; it stays "fetching" until ``release``
+
+        A held job takes no queue slot but counts against its user's
+        ``max_user_queue``. Raises UserQueueFull, SchedulerClosed and
+        ValueError like ``submit``.
+        """
+        self._check_priority(job)
+        key = self._user_key(job)
+        with self._cond:
+            self._check_open()
+            self._check_user_queue(key)
+            self._held.add(job)
+            self._user_held[key] += 1
+            job.state = "fetching"
+
+    def release(self, job, error=None):
+        """Queue a held job, or finish it with ``error``; returns its position, or None if it finished
+
+        If the queue filled up while the job was held it is finished with
+        the QueueFull message. Releasing a job that was cancelled meanwhile
+        does nothing.
+        """
+        with self._cond:
+            if job not in self._held:
+                return None
+            self._unhold(job)
+            if error is None:
+                job.state = "queued"
+                try:
+                    return self.submit(job)
+                except QueueFull as e:
+                    error = str(e)
+        job.error = error
+        self._finish(job)
+        return None
+
+    def cancel(self, job):
+        """Cancel a job
+
+        A queued or held job is removed and finished as cancelled ("queued"
+        or "fetching" is returned). A running job is only flagged; its
+        runner must notice ``job.cancelled`` ("running"). Returns None if
+        the job had already finished.
+        """
+        with self._cond:
+            if job.done.is_set():
+                return None
+            job.cancelled = True
+            if job in self._held:
+                self._unhold(job)
+                state, waiting = "fetching", []
+            else:
+                key = self._user_key(job)
+                bucket = self._tiers.get(job.priority, {}).get(key)
+                if not bucket or job not in bucket:
+                    return "running"
+                self._remove(job, running=False)
+                state, waiting = "queued", self._dispatch_order()
+                self._cond.notify_all()
+            self.cancelled += 1
+        job.error = "cancelled"
+        self._finish(job)
+        self._notify_positions(waiting)
+        return state
+
+    def close(self, reason):
+        """Refuse new jobs and finish every queued or held job with ``reason`` as its error
+
+        For a scheduler whose workers will never run. Running jobs are left
+        to their runner. Returns the jobs it finished.
+        """
+        with self._cond:
+            self.closed = reason
+            jobs = self._dispatch_order()
+            for job in jobs:
+                self._remove(job, running=False)
+            for job in list(self._held):
+                self._unhold(job)
+                jobs.append(job)
+        for job in jobs:
+            job.error = reason
+            self._finish(job)
+        return jobs
+
+    def stats(self):
+        with self._cond:
+            tiers = {}
+            for tier in self.priorities:
+                waits = list(self._waits[tier])
+                tiers[tier] = {
+                    "queued": sum(len(bucket) for bucket in self._tiers[tier].values()),
+                    "completed": self._tier_completed[tier],
+                    "wait_p50": round(percentile(waits, 50), 3),
+                    "wait_p95": round(percentile(waits, 95), 3),
+                    "wait_p99": round(percentile(waits, 99), 3),
+                    "wait_max": round(max(waits), 3) if waits else 0.0,
+                }
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queued": self._queued,
+                "fetching": len(self._held),
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "closed": self.closed,
+                "fair_share": self.fair_share,
+                "users_waiting": len(self._user_queued),
+                "affinity_hits": self.affinity_hits,
+                "affinity_overdue": self.affinity_overdue,
+                "priorities": tiers,
+            }
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(self._has_runnable)
+                job = self._next_job()
+                self.running += 1
+                self._waits[job.priority].append(time.time() - job.submitted)
+                waiting = self._dispatch_order()
+            self._notify_positions(waiting)
+            self._run(job)
+            with self._cond:
+                self.running -= 1
+                self.completed += 1
+                self.cancelled += job.cancelled
+                self._tier_completed[job.priority] += 1
+                key = self._user_key(job)
+                self._user_running[key] -= 1
+                if self._user_running[key] <= 0:
+                    del self._user_running[key]
+                # A user below its running cap may have jobs to release
+                self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # queue internals (called with the lock held)
+    # ------------------------------------------------------------------
+
+    def _user_key(self, job):
+        return job.user_id if self.fair_share else None
+
+    def _check_priority(self, job):
+        job.priority = job.priority or self.default_priority
+        if job.priority not in self._tiers:
+            raise ValueError(f"unknown priority '{job.priority}' (expected one of {', '.join(self.priorities)})")
+
+    def _check_open(self):
+        if self.closed is not None:
+            self.rejected += 1
+            raise SchedulerClosed(f"not accepting jobs: {self.closed}")
+
+    def _check_user_queue(self, key):
+        """Raise UserQueueFull if the user has ``max_user_queue`` jobs waiting (queued or held)"""
+        if self.max_user_queue is not None and self._user_queued[key] + self._user_held[key] >= self.max_user_queue:
+            self.rejected += 1
+            raise UserQueueFull(f"user already has {self.max_user_queue} jobs waiting")
+
+    def _unhold(self, job):
+        key = self._user_key(job)
+        self._held.discard(job)
+        self._user_held[key] -= 1
+        if self._user_held[key] <= 0:
+            del self._user_held[key]
+
+    def _can_run(self, key):
+        return self.max_user_running is None or self._user_running[key] < self.max_user_running
+
+    def _has_runnable(self):
+        return any(self._can_run(key) for buckets in self._tiers.values() for key in buckets)
+
+    def _dispatch_order(self):
+        """Queued jobs in the order they would be dispatched (ignoring running caps)
+
+        Highest tier first; within a tier one job per user per round.
+        """
+        order = []
+        for tier in self.priorities:
+            for round_jobs in itertools.zip_longest(*self._tiers[tier].values()):
+                order.extend(job for job in round_jobs if job is not None)
+        return order
+
+    def _next_job(self):
+        """Pop the next job: first eligible user of the highest non-empty tier
+
+        With model affinity, a job of that tier whose model is resident may
+        go first (see _affinity_job).
+        """
+        for buckets in self._tiers.values():
+            eligible = [bucket for key, bucket in buckets.items() if self._can_run(key)]
+            if not eligible:
+                continue
+            job = self._affinity_job(eligible) if self.resident else None
+            job = job or eligible[0][0]
+            key = self._user_key(job)
+            self._remove(job)
+            if key in buckets:
+                buckets.move_to_end(key)  # this user goes to the back of the round
+            return job
+        return None
+
+    def _affinity_job(self, eligible):
+        """Job to dispatch for model affinity from a tier's eligible buckets, or None
+
+        The first job in round-robin order whose model is resident, unless
+        it was submitted more than ``max_affinity_wait`` after the oldest
+        waiting job. None falls back to plain round-robin.
+        """
+        resident = self.resident()
+        if not resident:
+            return None
+        oldest = min(bucket[0].submitted for bucket in eligible)
+        bounded = False
+        for round_jobs in itertools.zip_longest(*eligible):
+            for job in round_jobs:
+                if job is None or job.affinity not in resident:
+                    continue
+                if job.submitted - oldest > self.max_affinity_wait:
+                    bounded = True
+                    continue
+                if job is not eligible[0][0]:
+                    self.affinity_hits += 1
+                return job
+        if bounded:
+            self.affinity_overdue += 1
+        return None
+
+    def _remove(self, job, running=True):
+        """Take a specific queued job out of its bucket (to run it, or to drop it)"""
+        key = self._user_key(job)
+        buckets = self._tiers[job.priority]
+        bucket = buckets[key]
+        bucket.remove(job)
+        if not bucket:
+            del buckets[key]
+        self._dequeued(job, key, running)
+
+    def _dequeued(self, job, key, running=True):
+        self._queued -= 1
+        self._user_queued[key] -= 1
+        if self._user_queued[key] <= 0:
+            del self._user_queued[key]
+        if running:
+            self._user_running[key] += 1
+
+    # ------------------------------------------------------------------
+    # execution
+    # ------------------------------------------------------------------
+
+    def _run(self, job):
+        job.state = "running"
+        job.position = 0
+        job.started = time.time()
+        try:
+            self.runner(job)
+        except Exception as e:
+            log(f"❌ Job {job.id[:8]}... failed: {e}")
+            log(traceback.format_exc())
+            if job.error is None and job.result is None:
+                job.error = str(e)
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        if job.cancelled:
+            job.state = "cancelled"
+        else:
+            job.state = "error" if job.error is not None else "done"
+        job.finished = time.time()
+        job.done.set()
+        if job.on_done:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                log(f"⚠️  Job done callback failed for job {job.id[:8]}...: {e}")
+
+    def _notify_positions(self, waiting):
+        """Tell every queued job its new place after the head was dequeued"""
+        for position, job in enumerate(waiting, start=1):
+            if job.position == position:
+                continue
+            job.position = position
+            if job.on_position:
+                try:
+                    job.on_position(job, position)
+                except Exception as e:
+                    log(f"⚠️  Queue position callback failed for job {job.id[:8]}...: {e}")
@@ -0,0 +1,113 @@
+"""
+In-process store of generation jobs for the asynchronous REST API
+Clients submit with POST /jobs and come back later with the job id, so the
+server has to remember every job until its result has been collected or
+has gone stale. Finished jobs are kept for a TTL and then evicted; the
+workflow graph is dropped as soon as a job finishes, so a finished job
+costs a few hundred bytes and one server can track thousands of them.
+
+Usage:
+    store = JobStore(ttl=3600, max_jobs=10000)
+    scheduler.submit(job)     # rejected jobs (QueueFull) are never stored
+    store.add(job)            # after submit: the job may already have finished
+    job = store.get(job_id)   # None once evicted
+    store.wait(job, timeout=30)
+"""
+
+import collections
+import threading
+import time
+
+
+class JobStore:
+    """Job id -> Job map with TTL eviction of finished jobs
+
+    Unfinished jobs are never evicted (the scheduler's queue bounds them).
+    Finished jobs are evicted ``ttl`` seconds after they finish, or oldest
+    first once more than ``max_jobs`` are stored.
+    """
+
+    # Per-request parameters that are only needed until the job has run
+    RELEASED_PARAMS = ("workflow", "prompt_json", "fetches")
+
+    def __init__(self, ttl=3600, max_jobs=10000):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._finished = collections.OrderedDict()  # job_id -> expiry time, oldest first
+        self._active_by_user = {}                    # user_id -> {job_id: job} of unfinished jobs
+
+    def add(self, job):
+        """Track a job; it is compacted and scheduled for eviction when it finishes
+
+        Jobs are added after the scheduler accepted them, so a fast job
+        may already be finished here; it is then marked finished at once.
+        """
+        job.on_done = self._job_done
+        with self._lock:
+            self._jobs[job.id] = job
+            if job.done.is_set():
+                self._mark_finished(job)
+            else:
+                self._active_by_user.setdefault(job.user_id, {})[job.id] = job
+            self._evict()
+
+    def get(self, job_id):
+        """The job with this id, or None if it is unknown or expired"""
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def active(self, user_id):
+        """Unfinished jobs submitted by a user"""
+        with self._lock:
+            return list(self._active_by_user.get(user_id, {}).values())
+
+    def wait(self, job, timeout):
+        """Block until the job finishes or timeout passes; True if finished"""
+        return job.done.wait(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "jobs": len(self._jobs),
+                "finished": len(self._finished),
+                "active": len(self._jobs) - len(self._finished),
+                "evicted": self.evicted,
+                "ttl": self.ttl,
+                "max_jobs": self.max_jobs,
+            }
+
+    # ------------------------------------------------------------------
+    # internals (called with the lock held unless noted)
+    # ------------------------------------------------------------------
+
+    def _job_done(self, job):
+        """Scheduler callback once a job's result or error is set (not locked)"""
+        with self._lock:
+            if job.id in self._jobs:
+                self._mark_finished(job)
+            self._evict()
+
+    def _mark_finished(self, job):
+        active = self._active_by_user.get(job.user_id)
+        if active is not None:
+            active.pop(job.id, None)
+            if not active:
+                del self._active_by_user[job.user_id]
+        for name in self.RELEASED_PARAMS:
+            job.params.pop(name, None)
+        self._finished[job.id] = time.time() + self.ttl
+        self._finished.move_to_end(job.id)
+
+    def _evict(self):
+        now = time.time()
+        while self._finished:
+            job_id, expires = next(iter(self._finished.items()))
+            if expires > now and len(self._jobs) <= self.max_jobs:
+                break
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+            self.evicted += 1
@@ -0,0 +1,498 @@
+"""
+Parallel, resumable HTTP downloader for model files
+Each file is fetched with several concurrent HTTP range requests straight
+into ``<dest>.part`` next to its final location, and renamed into place
+only when complete, so ComfyUI never sees a half-written model. Progress of
+every range is checkpointed to ``<dest>.part.json``; an interrupted
+download continues from where each range stopped instead of starting over.
+Several files download at the same time.
+
+Servers without range support (or without a Content-Length) get a single
+plain GET that restarts from zero.
+
+Every file is SHA-256 hashed while it downloads, not in a second pass
+afterwards, and checked against the expected size and hash: the ones given
+by the caller, or else those Hugging Face publishes for the file
+(X-Linked-Size / X-Linked-ETag). A mismatch raises IntegrityError and the
+file is never moved into place. The verified hash is cached in
+``<dest>.sha256.json`` with the file's size and mtime, so files that are
+already present are checked again without reading them.
+
+With a ``store`` (model_store.ModelStore) files are downloaded into the
+store and linked into place, and a file whose expected hash is already in
+the store is linked without downloading anything.
+
+Usage:
+    downloader = ModelDownloader(headers={"Authorization": f"Bearer {token}"})
+    downloader.download_all([
+        ("https://huggingface.co/.../flux1-krea-dev.safetensors", "/root/ComfyUI/models/unet/flux1-krea-dev.safetensors"),
+        ("https://huggingface.co/.../ae.safetensors", "/root/ComfyUI/models/vae/ae.safetensors", size, sha256),
+    ])
+    downloader.verify(url, dest)             # IntegrityError on a truncated or corrupt file
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+class DownloadError(Exception):
+    """Raised when a file could not be downloaded completely"""
+
+
+class IntegrityError(DownloadError):
+    """Raised when a file's size or SHA-256 does not match what is expected"""
+
+
+HASH_SUFFIX = ".sha256.json"
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+def file_sha256(path, chunk_size=8 * 1024 * 1024):
+    """SHA-256 of a file, read in chunks"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return sha.hexdigest()
+            sha.update(chunk)
+
+
+def cached_sha256(path):
+    """The hash recorded for ``path`` by record_sha256, if the file is unchanged since; else None
+
+    The file counts as unchanged while its size and mtime match the record.
+    """
+    path = Path(path)
+    try:
+        stat = path.stat()
+        record = json.loads(path.with_name(path.name + HASH_SUFFIX).read_text())
+        if record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+            return record["sha256"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def record_sha256(path, sha256):
+    """Remember a verified hash next to the file, keyed by its current size and mtime"""
+    path = Path(path)
+    stat = path.stat()
+    sidecar = path.with_name(path.name + HASH_SUFFIX)
+    tmp = sidecar.with_name(sidecar.name + ".tmp")
+    tmp.write_text(json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}))
+    os.replace(tmp, sidecar)
+
+
+class ModelDownloader:
+    """Downloads files with ``connections`` parallel ranges each
+
+    Ranges are ``segment_size`` bytes (fewer, larger ones for small files);
+    a failed range is retried ``retries`` times from its last written byte.
+    ``progress_interval`` is how often (seconds) progress is checkpointed
+    and logged. ``store`` is an optional model_store.ModelStore.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, headers=None, connections=8, segment_size=64 * 1024 * 1024, retries=5,
+                 timeout=(10, 60), progress_interval=5.0, max_files=4, store=None):
+        self.headers = dict(headers or {})
+        self.connections = connections
+        self.segment_size = segment_size
+        self.retries = retries
+        self.timeout = timeout
+        self.progress_interval = progress_interval
+        self.max_files = max_files
+        self.store = store
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_files * 2, pool_maxsize=connections * max_files)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fork(self):
+        """A downloader with the same settings and its own HTTP session, for use on another OS thread"""
+        return ModelDownloader(self.headers, self.connections, self.segment_size, self.retries, self.timeout,
+                               self.progress_interval, self.max_files, self.store)
+
+    def download_all(self, files):
+        """Download [(url, dest[, size[, sha256]]), ...] concurrently; returns {dest: "downloaded" | "present" | "linked"}
+
+        Raises DownloadError (after the others finished) if any file failed.
+        """
+        results, errors = {}, {}
+        with ThreadPoolExecutor(max(1, min(self.max_files, len(files)))) as pool:
+            futures = {pool.submit(self.download, *entry): entry[1] for entry in files}
+            for future, dest in futures.items():
+                try:
+                    results[dest] = future.result()
+                except Exception as e:
+                    errors[dest] = e
+                    log(f"❌ {Path(dest).name}: {e}")
+        if errors:
+            raise DownloadError(f"{len(errors)} of {len(files)} file(s) failed: "
+                                + ", ".join(Path(dest).name for dest in errors))
+        return results
+
+    def download(self, url, dest, size=None, sha256=None, progress=None):
+        """Download one file to ``dest`` and verify it; returns "downloaded", "present" or "linked"
+
+        ``size`` and ``sha256`` are the expected values; without them the
+        ones the server publishes are used, if any. A file that is already
+        present is verified instead (see ``verify``); one already in the
+        store is linked to ``dest`` ("linked"). Raises IntegrityError on a
+        mismatch. ``progress(bytes_done, bytes_total)`` is called when the
+        transfer starts and then every ``progress_interval`` seconds.
+        """
+        dest = Path(dest)
+        sha256 = sha256.lower() if sha256 else None
+        if dest.exists():
+            self.verify(url, dest, size, sha256)
+            return "present"
+        if self.store is not None and self.store.has(sha256):
+            return self._link(sha256, dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if self.store is not None:
+            staging = self.store.incoming(f"{hashlib.sha256(url.encode()).hexdigest()[:16]}-{dest.name}")
+        else:
+            staging = dest
+        part = staging.with_name(staging.name + ".part")
+        state_path = staging.with_name(staging.name + ".part.json")
+
+        source, length, etag, ranges, published = self._probe(url)
+        size = size or published["size"] or length
+        sha256 = sha256 or published["sha256"]
+        if length is not None and size != length:   # fail before fetching anything
+            raise IntegrityError(f"{dest.name}: server has {length} bytes, expected {size}")
+        if self.store is not None and self.store.has(sha256):
+            return self._link(sha256, dest)
+        start = time.time()
+        if length and ranges:
+            state = self._load_state(state_path, url, length, etag, part)
+            resumed = sum(state["done"])
+            log(f"📥 {dest.name}: {length / 1e9:.2f} GB in {len(state['segments'])} range(s), "
+                f"{self.connections} connection(s)"
+                + (f" - resuming at {resumed / length:.0%}" if resumed else ""))
+            if progress:
+                progress(resumed, length)
+            digest = self._download_ranges(source, part, state, state_path, dest.name, progress)
+        else:
+            log(f"📥 {dest.name}: server does not support ranges - single stream")
+            resumed = 0
+            if progress:
+                progress(0, size)
+            digest = self._download_whole(url, part, size, progress)
+        if sha256 and digest != sha256:
+            part.unlink(missing_ok=True)
+            state_path.unlink(missing_ok=True)
+            raise IntegrityError(f"{dest.name}: sha256 {digest} does not match expected {sha256} - discarded")
+        if self.store is not None:
+            self.store.put(part, digest)
+            self.store.materialize(digest, dest)
+        else:
+            os.replace(part, dest)
+            record_sha256(dest, digest)
+        state_path.unlink(missing_ok=True)
+        elapsed = time.time() - start
+        fetched = dest.stat().st_size - resumed
+        log(f"✅ {dest.name} done in {elapsed:.0f}s ({fetched / max(elapsed, 1e-6) / 1e6:.1f} MB/s), "
+            f"sha256 {digest[:12]} {'verified' if sha256 else '(nothing to check against)'}")
+        return "downloaded"
+
+    def verify(self, url, dest, size=None, sha256=None):
+        """Check a downloaded file's size and SHA-256; returns the hash or raises IntegrityError
+
+        The size is checked first, so a truncated file fails without being
+        read. A hash cached by a previous verification is trusted while the
+        file's size and mtime are unchanged; otherwise the file is hashed
+        (and the result cached). Without an expected ``sha256`` the one the
+        server publishes for ``url`` is used, if a hash has to be computed
+        or the cache cannot vouch for the file on its own. With a store, a
+        file linked from it is known by its blob's hash, and any other
+        verified file is adopted into the store.
+        """
+        dest = Path(dest)
+        actual_size = dest.stat().st_size
+        if size is not None and actual_size != size:
+            raise IntegrityError(f"{dest.name}: {actual_size} bytes on disk, expected {size}")
+        sha256 = sha256.lower() if sha256 else None
+        stored = self.store.lookup(dest) if self.store is not None else None
+        digest = stored or cached_sha256(dest)
+        if digest is not None and (sha256 is None or digest == sha256):
+            if self.store is not None and not stored:
+                self.store.add(dest, digest)
+            log(f"✅ {dest.name} present ({actual_size / 1e9:.2f} GB), sha256 {digest[:12]} verified earlier")
+            return digest
+        if sha256 is None and url:
+            _, length, _, _, published = self._probe(url)
+            sha256 = published["sha256"]
+            expected_size = published["size"] or length
+            if expected_size is not None and actual_size != expected_size:
+                raise IntegrityError(f"{dest.name}: {actual_size} bytes on disk, server has {expected_size}")
+        if digest is None:
+            start = time.time()
+            log(f"🔍 Hashing {dest.name} ({actual_size / 1e9:.2f} GB)...")
+            digest = file_sha256(dest)
+            log(f"   {dest.name}: sha256 {digest[:12]} in {time.time() - start:.0f}s")
+        if sha256 and digest != sha256:
+            raise IntegrityError(f"{dest.name}: sha256 {digest} does not match expected {sha256} - "
+                                 f"delete it and download again")
+        if self.store is not None:
+            self.store.add(dest, digest)
+        else:
+            record_sha256(dest, digest)
+        return digest
+
+    # ------------------------------------------------------------------
+    # internals
+    # ------------------------------------------------------------------
+
+    def _link(self, sha256, dest):
+        kind = self.store.materialize(sha256, dest)
+        log(f"🔗 {dest.name}: {kind} to stored blob {sha256[:12]}, nothing to download")
+        return "linked"
+
+    def _probe(self, url):
+        """(source, size, etag, supports_ranges, published) of the resource
+
+        ``source`` is (url, headers) for the range requests: the URL after
+        redirects (e.g. Hugging Face -> its CDN), so every range does not
+        go through the redirect again. Its signed URL carries the
+        authorization, so the Authorization header is not sent there.
+        ``published`` is {"size", "sha256"} as announced by the server
+        (Hugging Face's X-Linked-Size / X-Linked-ETag for LFS files), each
+        None if not announced.
+        """
+        response = self.session.get(url, headers=dict(self.headers, Range="bytes=0-0"), stream=True,
+                                    timeout=self.timeout, allow_redirects=True)
+        try:
+            response.raise_for_status()
+            headers = self.headers
+            if response.history and response.url.split("/")[2] != url.split("/")[2]:
+                headers = {k: v for k, v in self.headers.items() if k.lower() != "authorization"}
+            source = (response.url, headers)
+            etag = response.headers.get("ETag")
+            published = {"size": None, "sha256": None}
+            for hop in (*response.history, response):
+                linked = hop.headers.get("X-Linked-ETag", "").strip().strip('"').lower()
+                linked = linked[2:].strip('"') if linked.startswith("w/") else linked
+                if _SHA256.fullmatch(linked):
+                    published["sha256"] = linked
+                if hop.headers.get("X-Linked-Size", "").isdigit():
+                    published["size"] = int(hop.headers["X-Linked-Size"])
+            if response.status_code == 206:
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                return source, (int(total) if total.isdigit() else None), etag, True, published
+            length = response.headers.get("Content-Length")
+            return source, (int(length) if length and length.isdigit() else None), etag, False, published
+        finally:
+            response.close()
+
+    def _load_state(self, state_path, url, size, etag, part):
+        """Checkpointed range progress, or a fresh plan if it does not match this file"""
+        try:
+            state = json.loads(state_path.read_text())
+            if (state["size"] == size and state["etag"] == etag and part.exists()
+                    and part.stat().st_size == size):
+                return state
+        except (OSError, ValueError, KeyError):
+            pass
+        # at least one range per connection, none larger than segment_size
+        segment = max(self.CHUNK_SIZE, min(self.segment_size, -(-size // self.connections)))
+        segments = [[offset, min(offset + segment, size)] for offset in range(0, size, segment)]
+        with open(part, "wb") as f:
+            f.truncate(size)   # sparse on most filesystems; ranges are written in place
+        state = {"url": url, "size": size, "etag": etag, "segments": segments, "done": [0] * len(segments)}
+        self._save_state(state_path, state)
+        return state
+
+    def _save_state(self, state_path, state):
+        tmp = state_path.with_name(state_path.name + ".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, state_path)
+
+    def _download_ranges(self, source, part, state, state_path, name, progress=None):
+        """Fetch the missing ranges; returns the file's SHA-256"""
+        lock = threading.Lock()
+        failures = []
+        todo = [i for i, (begin, end) in enumerate(state["segments"]) if begin + state["done"][i] < end]
+        stop = threading.Event()
+        hasher = _StreamHasher(part, state, lock)
+
+        def checkpoint():
+            with lock:
+                self._save_state(state_path, state)
+
+        def reporter():
+            last = sum(state["done"])
+            while not stop.wait(self.progress_interval):
+                checkpoint()
+                done = sum(state["done"])
+                log(f"   {name}: {done / state['size']:.0%} "
+                    f"({(done - last) / self.progress_interval / 1e6:.1f} MB/s)")
+                last = done
+                if progress:
+                    progress(done, state["size"])
+
+        def worker(index):
+            try:
+                self._fetch_segment(source, part, state, index, lock, hasher)
+            except Exception as e:
+                failures.append(e)
+
+        def catch_up():
+            while not stop.wait(0.2):
+                hasher.catch_up()
+
+        threading.Thread(target=reporter, daemon=True).start()
+        catcher = threading.Thread(target=catch_up, daemon=True)
+        catcher.start()
+        try:
+            with ThreadPoolExecutor(self.connections) as pool:
+                list(pool.map(worker, todo))
+        finally:
+            stop.set()
+            checkpoint()
+        if failures:
+            raise DownloadError(f"{len(failures)} range(s) failed, progress kept for resume: {failures[0]}")
+        catcher.join()
+        hasher.catch_up()
+        with open(part, "rb+") as f:
+            os.fsync(f.fileno())
+        return hasher.hexdigest()
+
+    def _fetch_segment(self, source, part, state, index, lock, hasher):
+        """Fetch one range into the .part file, retrying from the last written byte"""
+        url, source_headers = source
+        begin, end = state["segments"][index]
+        for attempt in range(self.retries + 1):
+            offset = begin + state["done"][index]
+            if offset >= end:
+                return
+            try:
+                headers = dict(source_headers, Range=f"bytes={offset}-{end - 1}")
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        raise DownloadError(f"range request answered {response.status_code}")
+                    # unbuffered: bytes counted as done must already be in the file if we are killed
+                    with open(part, "rb+", buffering=0) as f:
+                        f.seek(offset)
+                        for chunk in response.iter_content(self.CHUNK_SIZE):
+                            view = memoryview(chunk)[:end - offset]
+                            hasher.feed(offset, view)
+                            while view:
+                                written = f.write(view)
+                                view = view[written:]
+                                offset += written
+                            with lock:
+                                state["done"][index] = offset - begin
+                            if offset >= end:
+                                break
+                if offset >= end:
+                    return
+                raise DownloadError(f"range {begin}-{end} ended early at {offset}")
+            except (requests.RequestException, DownloadError, OSError):
+                if attempt == self.retries:
+                    raise
+                time.sleep(min(30, 2 ** attempt))
+
+    def _download_whole(self, url, part, size, progress=None):
+        """Fetch the file in one GET; returns its SHA-256"""
+        for attempt in range(self.retries + 1):
+            try:
+                with self.session.get(url, headers=self.headers, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    written = 0
+                    sha = hashlib.sha256()
+                    reported = time.monotonic()
+                    with open(part, "wb") as f:
+                        for chunk in response.iter_content(self.CHUNK_SIZE):
+                            f.write(chunk)
+                            sha.update(chunk)
+                            written += len(chunk)
+                            if progress and time.monotonic() - reported >= self.progress_interval:
+                                reported = time.monotonic()
+                                progress(written, size)
+                        f.flush()
+                        os.fsync(f.fileno())
+                if size is None or written == size:
+                    return sha.hexdigest()
+                raise DownloadError(f"got {written} of {size} bytes")
+            except (requests.RequestException, DownloadError, OSError):
+                if attempt == self.retries:
+                    raise
+                time.sleep(min(30, 2 ** attempt))
+
+
+class _StreamHasher:
+    """SHA-256 of a .part file whose ranges arrive out of order
+
+    The hash advances through the file in order. The range being written at
+    the hash position is hashed from memory as it arrives (``feed``); bytes
+    that other ranges wrote further ahead are hashed by ``catch_up`` once the
+    position reaches them, read back while still in the page cache. So the
+    hash is complete a moment after the last byte, without a second pass
+    over the file. On resume, ``catch_up`` hashes the bytes written before
+    the interruption while the rest downloads.
+    """
+
+    def __init__(self, part, state, state_lock):
+        self.part = part
+        self.state = state
+        self.state_lock = state_lock
+        self.position = 0
+        self._begins = [begin for begin, _ in state["segments"]]
+        self._sha = hashlib.sha256()
+        self._lock = threading.Lock()
+
+    def feed(self, offset, data):
+        """Hash ``data`` (about to be written at ``offset``) if it is next in line"""
+        with self._lock:
+            if offset == self.position:
+                self._sha.update(data)
+                self.position += len(data)
+
+    def catch_up(self):
+        """Hash bytes already written at the hash position, reading them from the file"""
+        with open(self.part, "rb") as f:
+            while True:
+                with self._lock:
+                    position = self.position
+                end = self._written_end(position)
+                if end <= position:
+                    return
+                f.seek(position)
+                data = f.read(min(ModelDownloader.CHUNK_SIZE, end - position))
+                with self._lock:
+                    if self.position == position:   # a feed() may have got there first
+                        self._sha.update(data)
+                        self.position += len(data)
+
+    def hexdigest(self):
+        with self._lock:
+            if self.position != self.state["size"]:
+                raise DownloadError(f"hashed {self.position} of {self.state['size']} bytes")
+            return self._sha.hexdigest()
+
+    def _written_end(self, position):
+        """End of the bytes written contiguously from ``position``"""
+        index = bisect.bisect_right(self._begins, position) - 1
+        if index < 0 or position >= self.state["segments"][index][1]:
+            return position
+        with self.state_lock:
+            return self._begins[index] + self.state["done"][index]
@@ -0,0 +1,220 @@
+"""
+On-demand model downloads for the API server
+Instead of downloading every model before the server starts, a job whose
+workflow loads a manifest model that is not on disk is held (job state
+"fetching") while the model is downloaded, and queued once it is there.
+Fetches are single-flight: however many jobs wait for a model, it is
+downloaded once, and every waiter is released when that one download
+finishes. Jobs whose models are all present are queued as usual meanwhile.
+
+Each download runs on a real OS thread, even under eventlet's monkey
+patching: hashing, writing and fsyncing gigabytes would otherwise stall the
+server's event loop (SocketIO, HTTP, ComfyUI events) for seconds at a time.
+The download thread only sets plain attributes of its ModelFetch; progress
+callbacks and waiter releases happen back on the calling side.
+
+Only models listed in models_manifest.json with a URL are fetched; a
+workflow loading any other missing file (unknown, or in the wrong folder)
+is still rejected with MissingModelError. A failed fetch fails the jobs
+waiting for it, and the next job needing the model tries again.
+
+Usage:
+    fetcher = ModelFetcher(ModelDownloader(headers), load_manifest(), ModelInventory(models_dir),
+                           models_dir, on_progress=notify)
+    entries = fetcher.missing(workflow)          # [] when every model is present
+    fetches = fetcher.fetch(entries, waiter=job)
+    for fetch in fetches:
+        fetch.done.wait()
+"""
+
+import threading
+import time
+
+from model_manifest import CATEGORY_FOLDERS, MODELS_DIR, MissingModelError, missing_models, model_references
+
+try:
+    from eventlet import patcher
+except ImportError:
+    patcher = None
+
+# Unpatched threading: its threads are OS threads, not greenlets on the server's hub
+os_threading = patcher.original("threading") if patcher is not None else threading
+
+POLL_INTERVAL = 0.1   # Seconds between checks of a download thread's progress
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+class ModelFetch:
+    """One model download and the waiters (jobs) released when it ends
+
+    ``state`` is "downloading", then "done" or "error" (with ``error``
+    set) once ``done`` is set.
+    """
+
+    def __init__(self, entry, dest):
+        self.entry = entry
+        self.dest = dest
+        self.waiters = []
+        self.state = "downloading"
+        self.bytes_done = 0
+        self.bytes_total = entry.size
+        self.result = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self.done = threading.Event()
+
+    def snapshot(self):
+        """JSON-ready progress of the download"""
+        snapshot = {
+            "model": self.entry.name,
+            "category": self.entry.category,
+            "state": self.state,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "percent": round(100 * self.bytes_done / self.bytes_total, 1) if self.bytes_total else None,
+            "elapsed": round((self.finished or time.time()) - self.started, 1),
+        }
+        if self.error is not None:
+            snapshot["error"] = self.error
+        return snapshot
+
+
+class ModelFetcher:
+    """Single-flight downloads of the manifest models workflows need
+
+    ``downloader`` is a model_downloader.ModelDownloader (its
+    ``progress_interval`` paces the progress callbacks) and ``inventory``
+    the model_manifest.ModelInventory the API server checks workflows
+    against. ``on_progress(fetch)`` is called from the fetch's watcher
+    thread (a green thread under eventlet, never the OS download thread)
+    as a fetch advances and once it ends.
+    """
+
+    def __init__(self, downloader, manifest, inventory, models_dir=MODELS_DIR, on_progress=None):
+        self.downloader = downloader
+        self.manifest = manifest
+        self.inventory = inventory
+        self.models_dir = models_dir
+        self.on_progress = on_progress
+        self.started = 0        # downloads started
+        self.joined = 0         # waiters that joined a download already in flight
+        self.completed = 0
+        self.failed = 0
+        self.bytes_fetched = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}    # destination path -> ModelFetch
+
+    def missing(self, workflow):
+        """Manifest entries of the models a workflow loads that are not on disk ([] if none)
+
+        Raises MissingModelError, listing every problem, if a missing file
+        cannot be fetched: it is not in the manifest (or has no URL), is
+        loaded from the wrong folder, or sits in another models folder.
+        """
+        entries, fetchable = {}, True
+        for _, _, _, name, category in model_references(workflow):
+            if self.inventory.has(category, name):
+                continue
+            entry = self.manifest.by_name.get(name)
+            if (entry is None or not entry.url or entry.category not in CATEGORY_FOLDERS.get(category, (category,))
+                    or any(name in names for names in self.inventory.files().values())):
+                fetchable = False
+            else:
+                entries[name] = entry
+        if not fetchable:
+            raise MissingModelError(missing_models(workflow, self.inventory, self.manifest))
+        return list(entries.values())
+
+    def fetch(self, entries, waiter=None):
+        """A ModelFetch per entry: the download in flight for it, or a newly started one
+
+        ``waiter`` (e.g. the job) is added to each fetch's waiters.
+        """
+        fetches = []
+        with self._lock:
+            for entry in entries:
+                dest = entry.path(self.models_dir)
+                fetch = self._in_flight.get(dest)
+                if fetch is None:
+                    fetch = self._in_flight[dest] = ModelFetch(entry, dest)
+                    self.started += 1
+                    threading.Thread(target=self._run, args=(fetch,), daemon=True).start()
+                else:
+                    self.joined += 1
+                if waiter is not None:
+                    fetch.waiters.append(waiter)
+                fetches.append(fetch)
+        return fetches
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": [fetch.snapshot() for fetch in self._in_flight.values()],
+                "started": self.started,
+                "joined": self.joined,
+                "completed": self.completed,
+                "failed": self.failed,
+                "bytes_fetched": self.bytes_fetched,
+            }
+
+    # ------------------------------------------------------------------
+    # internals
+    # ------------------------------------------------------------------
+
+    def _run(self, fetch):
+        entry = fetch.entry
+        log(f"📥 Fetching {entry.category}/{entry.name} on demand ({len(fetch.waiters)} job(s) waiting)")
+        # Its own HTTP session: green locks must not be shared with another OS thread
+        thread = os_threading.Thread(target=self._download, args=(fetch, self.downloader.fork()), daemon=True)
+        thread.start()
+        reported = (fetch.bytes_done, fetch.bytes_total)
+        while thread.is_alive():   # polled, never joined: join() would block the event loop
+            time.sleep(POLL_INTERVAL)
+            if fetch.state == "downloading" and (fetch.bytes_done, fetch.bytes_total) != reported:
+                reported = (fetch.bytes_done, fetch.bytes_total)
+                self._notify(fetch)
+        fetch.finished = time.time()
+        self.inventory.invalidate()
+        if fetch.state == "done":
+            log(f"✅ {entry.name} {fetch.result} in {fetch.finished - fetch.started:.1f}s, "
+                f"releasing {len(fetch.waiters)} job(s)")
+        self._notify(fetch)   # before the waiters are released, so this is their last fetch event
+        with self._lock:
+            del self._in_flight[fetch.dest]
+            if fetch.state == "done":
+                self.completed += 1
+                if fetch.result == "downloaded":
+                    self.bytes_fetched += fetch.bytes_total
+            else:
+                self.failed += 1
+            fetch.done.set()
+
+    def _download(self, fetch, downloader):
+        """Download thread: fetch the file, recording progress and the outcome on ``fetch``"""
+        entry = fetch.entry
+        try:
+            fetch.result = downloader.download(entry.url, fetch.dest, entry.size, entry.sha256,
+                                               progress=lambda done, total: self._progress(fetch, done, total))
+            fetch.bytes_done = fetch.bytes_total = fetch.dest.stat().st_size
+            fetch.state = "done"
+        except Exception as e:
+            fetch.error = str(e)
+            fetch.state = "error"
+            log(f"❌ On-demand fetch of {entry.name} failed: {e}")
+
+    def _progress(self, fetch, done, total):
+        fetch.bytes_done = done
+        fetch.bytes_total = total or fetch.bytes_total
+
+    def _notify(self, fetch):
+        if self.on_progress is None:
+            return
+        try:
+            self.on_progress(fetch)
+        except Exception as e:
+            log(f"⚠️  Model fetch progress callback failed for {fetch.entry.name}: {e}")
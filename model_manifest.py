@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Declarative model manifest shared by the downloader, file placement and workflow validation
+models_manifest.json lists every model file once: its name, the
+ComfyUI/models category folder it belongs in, where to download it, which
+bundles (sets of files a workflow needs) it is part of, and optionally its
+size and sha256. download_flux_model.py downloads a bundle from it,
+fix_model_locations.py moves files the manifest finds in the wrong folder,
+and the API server checks every model a workflow loads against what is on
+disk before the job is queued, so a misconfigured job fails in
+milliseconds instead of after waiting for (and wasting) GPU time.
+
+Usage:
+    manifest = load_manifest()
+    files = manifest.downloads("/root/ComfyUI/models", bundle="flux-krea-dev")   # for ModelDownloader.download_all
+    inventory = ModelInventory("/root/ComfyUI/models")
+    problems = missing_models(workflow, inventory, manifest)
+
+    python model_manifest.py status [--bundle flux-krea-dev]
+    python model_manifest.py check workflows/flux_workflow.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+MANIFEST_PATH = Path(__file__).resolve().parent / "models_manifest.json"
+MODELS_DIR = "/root/ComfyUI/models"
+
+# Category folder -> every folder ComfyUI reads that category from
+CATEGORY_FOLDERS = {
+    "checkpoints": ("checkpoints",),
+    "unet": ("unet", "diffusion_models"),
+    "diffusion_models": ("diffusion_models", "unet"),
+    "vae": ("vae",),
+    "clip": ("clip", "text_encoders"),
+    "text_encoders": ("text_encoders", "clip"),
+    "clip_vision": ("clip_vision",),
+    "loras": ("loras",),
+    "controlnet": ("controlnet",),
+    "upscale_models": ("upscale_models",),
+    "style_models": ("style_models",),
+}
+
+# Loader inputs naming a model file -> its category; (class_type, input)
+# entries override the input name alone
+MODEL_INPUTS = {
+    "ckpt_name": "checkpoints",
+    "unet_name": "unet",
+    "vae_name": "vae",
+    "clip_name": "clip",
+    "clip_name1": "clip",
+    "clip_name2": "clip",
+    "clip_name3": "clip",
+    "lora_name": "loras",
+    "control_net_name": "controlnet",
+    "style_model_name": "style_models",
+    ("CLIPVisionLoader", "clip_name"): "clip_vision",
+    ("UpscaleModelLoader", "model_name"): "upscale_models",
+}
+
+MODEL_EXTENSIONS = (".safetensors", ".ckpt", ".pt", ".pt2", ".pth", ".bin", ".sft", ".gguf")
+
+
+class ManifestError(ValueError):
+    """Raised for a malformed manifest"""
+
+
+class MissingModelError(ValueError):
+    """Raised when a workflow loads model files that are not on disk"""
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__("; ".join(problems))
+
+
+def model_category(class_type, input_name):
+    """Category of the model file a node input names, or None if it names none"""
+    return MODEL_INPUTS.get((class_type, input_name)) or MODEL_INPUTS.get(input_name)
+
+
+class ModelEntry:
+    """One model file of the manifest"""
+
+    def __init__(self, name, category, url=None, bundles=(), size=None, sha256=None, description=""):
+        self.name = name
+        self.category = category
+        self.url = url
+        self.bundles = tuple(bundles)
+        self.size = size
+        self.sha256 = sha256
+        self.description = description
+
+    def path(self, models_dir=MODELS_DIR):
+        return Path(models_dir) / self.category / self.name
+
+    def to_dict(self):
+        return {key: value for key, value in vars(self).items() if value not in (None, (), "")}
+
+
+class ModelManifest:
+    """The manifest's entries, by name and by bundle"""
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.by_name = {}
+        for entry in self.entries:
+            if entry.name in self.by_name:
+                raise ManifestError(f"{entry.name} is listed twice")
+            self.by_name[entry.name] = entry
+
+    def bundle(self, name=None):
+        """Entries of a bundle (all entries for None); raises ManifestError for an unknown bundle"""
+        if name is None:
+            return list(self.entries)
+        entries = [entry for entry in self.entries if name in entry.bundles]
+        if not entries:
+            bundles = sorted({bundle for entry in self.entries for bundle in entry.bundles})
+            raise ManifestError(f"Unknown bundle '{name}' (available: {', '.join(bundles)})")
+        return entries
+
+    def downloads(self, models_dir=MODELS_DIR, bundle=None):
+        """[(url, dest, size, sha256), ...] for ModelDownloader.download_all"""
+        return [(entry.url, str(entry.path(models_dir)), entry.size, entry.sha256)
+                for entry in self.bundle(bundle) if entry.url]
+
+    def misplaced(self, models_dir=MODELS_DIR, bundle=None):
+        """[(entry, found_at), ...] for entries missing from their folder but present in another one"""
+        models_dir = Path(models_dir)
+        found = []
+        for entry in self.bundle(bundle):
+            if any((models_dir / folder / entry.name).exists() for folder in CATEGORY_FOLDERS[entry.category]):
+                continue
+            for folder in sorted(CATEGORY_FOLDERS):
+                candidate = models_dir / folder / entry.name
+                if candidate.is_file():
+                    found.append((entry, candidate))
+                    break
+        return found
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """ModelManifest from a JSON file; raises ManifestError"""
+    try:
+        data = json.loads(Path(path).read_text())
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"Cannot read model manifest {path}: {e}") from None
+    entries = []
+    for i, item in enumerate(data.get("models", []) if isinstance(data, dict) else ()):
+        if not isinstance(item, dict) or not item.get("name") or not item.get("category"):
+            raise ManifestError(f"{path}: model #{i + 1} needs a name and a category")
+        if item["category"] not in CATEGORY_FOLDERS:
+            raise ManifestError(f"{path}: {item['name']} has unknown category '{item['category']}'")
+        unknown = set(item) - {"name", "category", "url", "bundles", "size", "sha256", "description"}
+        if unknown:
+            raise ManifestError(f"{path}: {item['name']} has unknown field(s) {', '.join(sorted(unknown))}")
+        entries.append(ModelEntry(**item))
+    return ModelManifest(entries)
+
+
+class ModelInventory:
+    """Model files present under a ComfyUI models directory, by folder
+
+    Scans are cached for ``ttl`` seconds; a lookup that misses rescans once
+    (at most every ``min_rescan`` seconds), so a file that was just added
+    is found.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, ttl=30.0, min_rescan=1.0):
+        self.models_dir = Path(models_dir)
+        self.ttl = ttl
+        self.min_rescan = min_rescan
+        self.scans = 0
+        self._lock = threading.Lock()
+        self._files = None
+        self._scanned = 0.0
+
+    def files(self, refresh=False):
+        """{folder: set of names relative to the folder}"""
+        with self._lock:
+            now = time.monotonic()
+            stale = self._files is None or now - self._scanned > self.ttl
+            if stale or (refresh and now - self._scanned > self.min_rescan):
+                self._files = self._scan()
+                self._scanned = now
+                self.scans += 1
+            return self._files
+
+    def invalidate(self):
+        """Forget the last scan (e.g. after adding a file): the next lookup rescans"""
+        with self._lock:
+            self._files = None
+
+    def has(self, category, name):
+        """Whether ``name`` is in one of the category's folders (rescanning once on a miss)"""
+        folders = CATEGORY_FOLDERS.get(category, (category,))
+        for refresh in (False, True):
+            files = self.files(refresh=refresh)
+            if any(name in files.get(folder, ()) for folder in folders):
+                return True
+        return False
+
+    def _scan(self):
+        files = {}
+        for folder in CATEGORY_FOLDERS:
+            directory = self.models_dir / folder
+            names = set()
+            for root, _, filenames in os.walk(directory, followlinks=True):
+                relative = os.path.relpath(root, directory)
+                for filename in filenames:
+                    if filename.endswith(MODEL_EXTENSIONS):
+                        names.add(filename if relative == "." else f"{relative}/{filename}")
+            files[folder] = names
+        return files
+
+
+def model_references(workflow):
+    """[(node_id, class_type, input_name, file name, category), ...] for every model file a graph loads"""
+    references = []
+    for node_id, node in workflow.items():
+        class_type = node.get("class_type")
+        for input_name, value in node.get("inputs", {}).items():
+            category = model_category(class_type, input_name) if isinstance(value, str) else None
+            if category is not None:
+                references.append((node_id, class_type, input_name, value, category))
+    return references
+
+
+def missing_models(workflow, inventory, manifest=None):
+    """Problems with the model files a workflow loads (empty list when all are present)
+
+    With a manifest, each problem says how to fix it: where a misplaced
+    file belongs, or that the file can be downloaded.
+    """
+    problems = []
+    for node_id, class_type, input_name, name, category in model_references(workflow):
+        if inventory.has(category, name):
+            continue
+        problem = f"node {node_id} ({class_type}) {input_name} '{name}' is not in models/{category}"
+        entry = manifest.by_name.get(name) if manifest else None
+        if entry is not None and entry.category not in CATEGORY_FOLDERS.get(category, (category,)):
+            problem += f" (the manifest puts it in models/{entry.category}: wrong loader or wrong folder)"
+        elif entry is not None and any(name in names for names in inventory.files().values()):
+            problem += " (it is in another models folder - run fix_model_locations.py)"
+        elif entry is not None and entry.url:
+            problem += f" (download it: bundle {', '.join(entry.bundles) or entry.url})"
+        problems.append(problem)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model manifest status and workflow checks")
+    parser.add_argument("--manifest", default=str(MANIFEST_PATH))
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("status", help="which manifest models are present")
+    p.add_argument("--bundle")
+    p = sub.add_parser("check", help="check the models workflow JSON files load")
+    p.add_argument("workflows", nargs="+")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    inventory = ModelInventory(args.models_dir)
+    ok = True
+    if args.command == "status":
+        for entry in manifest.bundle(args.bundle):
+            present = inventory.has(entry.category, entry.name)
+            ok &= present
+            print(f"{'✅' if present else '❌'} {entry.category}/{entry.name}  [{', '.join(entry.bundles)}]")
+        for entry, found in manifest.misplaced(args.models_dir, args.bundle):
+            print(f"⚠️  {entry.name} is in {found.parent}, belongs in {entry.path(args.models_dir).parent}")
+    else:
+        for path in args.workflows:
+            problems = missing_models(json.loads(Path(path).read_text()), inventory, manifest)
+            ok &= not problems
+            print(f"{'✅' if not problems else '❌'} {path}")
+            for problem in problems:
+                print(f"   {problem}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
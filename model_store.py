@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Content-addressed model store shared by several ComfyUI trees
+Every model file is kept once, as ``blobs/<sha256>``, in a store directory
+(for example on a Modal volume mounted into every container). ComfyUI's
+models/<category> directories only hold links to the blobs: a hard link
+when the store is on the same filesystem, a symlink otherwise. Creating or
+moving one is O(1) whatever the file size, and three ComfyUI trees on one
+volume share a single 35 GB copy.
+
+``index.json`` records, per blob, its size and the paths linked to it
+(its references). ``gc`` drops references whose path is gone or now holds
+something else, and deletes blobs nothing references any more. The index
+is updated under an exclusive lock, so several processes or containers
+can share the store.
+
+Usage:
+    store = ModelStore("/vol/model-store")
+    store.add("/root/ComfyUI/models/unet/flux1-krea-dev.safetensors")   # adopt (dedupe) an existing file
+    store.materialize(sha256, "/root/ComfyUI2/models/unet/flux1-krea-dev.safetensors")
+    store.gc()
+
+    python model_store.py --store /vol/model-store add /root/ComfyUI/models/*/*.safetensors
+    python model_store.py --store /vol/model-store status
+    python model_store.py --store /vol/model-store gc [--dry-run]
+"""
+
+import argparse
+import contextlib
+import errno
+import fcntl
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from model_downloader import HASH_SUFFIX, cached_sha256, file_sha256
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+class ModelStore:
+    """Blobs named by SHA-256, materialized into model directories by link
+
+    ``mode`` is "hardlink", "symlink" or "auto" (a hard link, or a symlink
+    where the filesystem cannot hard link to the store).
+    """
+
+    def __init__(self, root, mode="auto"):
+        if mode not in ("auto", "hardlink", "symlink"):
+            raise ValueError(f"unknown link mode: {mode}")
+        self.root = Path(root).resolve()
+        self.mode = mode
+        self.blobs = self.root / "blobs"
+        self.incoming_dir = self.root / "incoming"
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        self.incoming_dir.mkdir(exist_ok=True)
+        self._index_path = self.root / "index.json"
+        self._lock_path = self.root / "index.lock"
+
+    def blob_path(self, sha256):
+        return self.blobs / sha256
+
+    def has(self, sha256):
+        return bool(sha256) and self.blob_path(sha256).is_file()
+
+    def incoming(self, name):
+        """Where to download a file before ``put`` (on the store's filesystem, so ``put`` is a rename)"""
+        return self.incoming_dir / name
+
+    def put(self, path, sha256):
+        """Move a verified file into the store as blob ``sha256``; returns the blob path
+
+        If the blob already exists the file is deleted instead.
+        """
+        blob = self.blob_path(sha256)
+        path = Path(path)
+        with self._index() as index:
+            if blob.is_file():
+                path.unlink()
+            else:
+                try:
+                    os.replace(path, blob)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    tmp = self.incoming(f"{sha256}.tmp")
+                    shutil.copyfile(path, tmp)
+                    os.replace(tmp, blob)
+                    path.unlink()
+                os.chmod(blob, 0o444)   # every link shares this inode: keep it read-only
+            index["blobs"].setdefault(sha256, {"size": blob.stat().st_size, "refs": {}})
+        return blob
+
+    def materialize(self, sha256, dest):
+        """Link ``dest`` to blob ``sha256`` (replacing whatever is there); returns "hardlink" or "symlink"
+
+        Atomic: ``dest`` is either the old file or the new link at any time.
+        """
+        blob = self.blob_path(sha256)
+        if not blob.is_file():
+            raise FileNotFoundError(f"blob {sha256} is not in the store")
+        dest = Path(dest).absolute()
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.link")
+        with contextlib.suppress(FileNotFoundError):
+            tmp.unlink()
+        kind = "symlink"
+        if self.mode != "symlink":
+            try:
+                os.link(blob, tmp)
+                kind = "hardlink"
+            except OSError as e:
+                if self.mode == "hardlink" or e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+        if kind == "symlink":
+            os.symlink(blob, tmp)
+        os.replace(tmp, dest)
+        with self._index() as index:
+            for entry in index["blobs"].values():
+                entry["refs"].pop(str(dest), None)
+            entry = index["blobs"].setdefault(sha256, {"size": blob.stat().st_size, "refs": {}})
+            entry["refs"][str(dest)] = kind
+        with contextlib.suppress(FileNotFoundError):
+            dest.with_name(dest.name + HASH_SUFFIX).unlink()   # the blob name is the hash
+        return kind
+
+    def add(self, path, sha256=None):
+        """Adopt an existing model file: store it (once) and replace it with a link; returns its sha256
+
+        A file whose content is already in the store is simply replaced by
+        a link to the existing blob, freeing its space.
+        """
+        path = Path(path).absolute()
+        known = self.lookup(path)
+        if known:
+            with self._index() as index:   # e.g. a link moved with mv: record its new path
+                index["blobs"][known]["refs"][str(path)] = "symlink" if path.is_symlink() else "hardlink"
+            return known
+        sha256 = sha256 or cached_sha256(path) or file_sha256(path)
+        if self.has(sha256):
+            self.materialize(sha256, path)
+            return sha256
+        blob = self.blob_path(sha256)
+        try:
+            os.link(path, blob)   # same filesystem: the file itself becomes the blob
+            os.chmod(blob, 0o444)
+            with self._index() as index:
+                entry = index["blobs"].setdefault(sha256, {"size": blob.stat().st_size, "refs": {}})
+                entry["refs"][str(path)] = "hardlink"
+        except FileExistsError:
+            self.materialize(sha256, path)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            tmp = self.incoming(f"{sha256}.tmp")
+            shutil.copyfile(path, tmp)
+            self.put(tmp, sha256)
+            self.materialize(sha256, path)
+        with contextlib.suppress(FileNotFoundError):
+            path.with_name(path.name + HASH_SUFFIX).unlink()
+        return sha256
+
+    def lookup(self, path):
+        """sha256 of the blob ``path`` is linked to, or None
+
+        Links moved since they were made (not referenced under ``path``)
+        are found too.
+        """
+        path = Path(path).absolute()
+        with self._index(write=False) as index:
+            for sha256, entry in index["blobs"].items():
+                if str(path) in entry["refs"] and self._links_to(path, sha256):
+                    return sha256
+            for sha256 in index["blobs"]:
+                if self._links_to(path, sha256):
+                    return sha256
+        return None
+
+    def release(self, path):
+        """Remove a materialized link and its reference (the blob stays until ``gc``)"""
+        path = Path(path).absolute()
+        with self._index() as index:
+            for sha256, entry in index["blobs"].items():
+                if entry["refs"].pop(str(path), None) is not None and self._links_to(path, sha256):
+                    path.unlink()
+
+    def gc(self, dry_run=False):
+        """Drop stale references and delete unreferenced blobs; returns (blobs deleted, bytes freed)
+
+        A blob that still has hard links the index does not know about is
+        kept.
+        """
+        deleted, freed = 0, 0
+        with self._index(write=not dry_run) as index:
+            for sha256 in list(index["blobs"]):
+                entry = index["blobs"][sha256]
+                entry["refs"] = {path: kind for path, kind in entry["refs"].items()
+                                 if self._links_to(Path(path), sha256)}
+                blob = self.blob_path(sha256)
+                if entry["refs"] or (blob.exists() and blob.stat().st_nlink > 1):
+                    continue
+                size = blob.stat().st_size if blob.exists() else 0
+                log(f"🗑️  {'Would delete' if dry_run else 'Deleting'} blob {sha256[:12]} ({size / 1e9:.2f} GB)")
+                if not dry_run:
+                    with contextlib.suppress(FileNotFoundError):
+                        blob.unlink()
+                    del index["blobs"][sha256]
+                deleted += 1
+                freed += size
+        return deleted, freed
+
+    def stats(self):
+        with self._index(write=False) as index:
+            blobs = index["blobs"]
+            stored = sum(entry["size"] for entry in blobs.values())
+            linked = sum(entry["size"] * len(entry["refs"]) for entry in blobs.values())
+            return {
+                "blobs": len(blobs),
+                "bytes_stored": stored,
+                "references": sum(len(entry["refs"]) for entry in blobs.values()),
+                "bytes_linked": linked,
+                "bytes_saved": max(0, linked - stored),
+                "unreferenced": sum(1 for entry in blobs.values() if not entry["refs"]),
+            }
+
+    # ------------------------------------------------------------------
+    # internals
+    # ------------------------------------------------------------------
+
+    @contextlib.contextmanager
+    def _index(self, write=True):
+        """The index, under an exclusive (or shared, for ``write=False``) lock; saved on exit"""
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            try:
+                index = json.loads(self._index_path.read_text())
+            except FileNotFoundError:
+                index = {"blobs": {}}
+            yield index
+            if write:
+                tmp = self._index_path.with_name("index.json.tmp")
+                tmp.write_text(json.dumps(index, indent=1, sort_keys=True))
+                os.replace(tmp, self._index_path)
+
+    def _links_to(self, path, sha256):
+        """Whether ``path`` is (a link to) blob ``sha256``"""
+        blob = self.blob_path(sha256)
+        try:
+            if path.is_symlink():
+                return Path(os.readlink(path)) == blob
+            return os.path.samefile(path, blob)
+        except OSError:
+            return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed model store")
+    parser.add_argument("--store", default=os.environ.get("MODEL_STORE"), help="store directory (default: $MODEL_STORE)")
+    parser.add_argument("--mode", default="auto", choices=("auto", "hardlink", "symlink"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("add", help="move model files into the store and link them back")
+    p.add_argument("paths", nargs="+")
+    p = sub.add_parser("link", help="materialize a blob at a path")
+    p.add_argument("sha256")
+    p.add_argument("dest")
+    sub.add_parser("status", help="blobs, references and space saved")
+    p = sub.add_parser("gc", help="delete blobs no model directory links to")
+    p.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    if not args.store:
+        parser.error("--store or $MODEL_STORE is required")
+
+    store = ModelStore(args.store, mode=args.mode)
+    if args.command == "add":
+        for path in args.paths:
+            if Path(path).is_file():
+                sha256 = store.add(path)
+                log(f"✅ {path} -> {sha256[:12]}")
+            else:
+                log(f"⚠️  Skipping {path}: not a file")
+    elif args.command == "link":
+        log(f"✅ {args.dest}: {store.materialize(args.sha256, args.dest)} to {args.sha256[:12]}")
+    elif args.command == "gc":
+        deleted, freed = store.gc(dry_run=args.dry_run)
+        log(f"✅ {deleted} blob(s), {freed / 1e9:.2f} GB {'reclaimable' if args.dry_run else 'freed'}")
+    stats = store.stats()
+    log(f"📦 {args.store}: {stats['blobs']} blob(s), {stats['bytes_stored'] / 1e9:.2f} GB stored, "
+        f"{stats['references']} link(s), {stats['bytes_saved'] / 1e9:.2f} GB saved by sharing")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
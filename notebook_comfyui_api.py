@@ -1,6 +1,8 @@
 """
 ComfyUI API Server for Modal Notebooks with SocketIO Support
-Paste this file into your Modal notebook and run it!
+Copy the whole project directory into your Modal notebook and run it from
+there: the server imports its sibling modules (comfyui_*.py, job_*.py,
+model_*.py, ...) and reads models_manifest.json and workflows/ next to it.
 
 Usage in Modal Notebook:
     python notebook_comfyui_api.py
@@ -15,13 +17,27 @@ import sys
 import json
 import uuid
 import requests
-import subprocess
 import time
 import threading
 import base64
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file
+from io import BytesIO
+from flask import Flask, Response, request, jsonify, send_file
 from flask_socketio import SocketIO, emit
+from comfyui_backends import BackendPool, ComfyUIBackend
+from comfyui_supervisor import ComfyUISupervisor
+from job_scheduler import Job, JobScheduler, QueueFull, SchedulerClosed, UserQueueFull
+from job_store import JobStore
+from model_downloader import ModelDownloader
+from model_fetcher import ModelFetcher
+from model_manifest import ManifestError, MissingModelError, ModelInventory, load_manifest, missing_models
+from model_store import ModelStore
+from preview_relay import PreviewRelay
+from progress_tracker import ProgressTracker
+from result_cache import ResultCache, workflow_key
+from session_registry import SessionRegistry
+from workflow_templates import (TemplateError, WorkflowTemplate, cached_text_encoders, image_output_node, load_templates,
+                                model_loader_node, validate_workflow, workflow_model)
 
 # Force unbuffered output so logs show immediately in Modal
 sys.stdout.reconfigure(line_buffering=True)
@@ -37,6 +53,202 @@ COMFYUI_DIR = "/root/ComfyUI"
 PORT = 8188
 API_PORT = 5000
 
+# ComfyUI backends, one per GPU. {"port": N} starts a local ComfyUI on that
+# port under a supervisor ("cuda_device" pins it to one GPU); {"url": ...}
+# uses an instance started elsewhere. Each prompt goes to the healthy backend
+# with the least outstanding work, preferring one with its model loaded.
+COMFYUI_BACKENDS = [
+    {"port": PORT},
+    # {"port": 8189, "cuda_device": 1},
+    # {"url": "http://10.0.0.12:8188"},
+]
+BACKEND_CHECK_INTERVAL = 2.0   # Seconds between /system_stats + /queue polls of each backend
+BACKEND_UNHEALTHY_AFTER = 3    # Failed polls in a row before a backend is drained
+BACKEND_WAIT_TIMEOUT = 300     # Seconds a job waits for a healthy backend before failing
+
+# ComfyUI HTTP clients (keep-alive connection pool per backend)
+COMFYUI_POOL_SIZE = 16         # Max pooled connections to ComfyUI
+COMFYUI_CONNECT_TIMEOUT = 3.05 # Seconds to establish a connection
+COMFYUI_READ_TIMEOUT = 30      # Seconds to wait for a response
+COMFYUI_RETRIES = 2            # Retries for transient failures (jittered backoff)
+
+# ComfyUI process supervision: local ComfyUI output is drained into a ring
+# buffer (served at /debug/comfyui-log) and a process that dies is restarted
+# with backoff. Prompts lost in a crash, or on a backend that stops answering,
+# are queued again on a healthy backend.
+COMFYUI_START_TIMEOUT = 60     # Seconds to wait for ComfyUI to answer at startup
+COMFYUI_LOG_LINES = 2000       # Lines of ComfyUI output kept in memory
+COMFYUI_ECHO_LOGS = False      # Also print ComfyUI's output to the API log
+MAX_PROMPT_REQUEUES = 2        # Times a prompt is re-queued after losing its backend
+
+# Job scheduling (bounded worker pool in front of ComfyUI)
+GPU_CONCURRENCY = 1    # Prompts each ComfyUI backend can usefully run at once
+MAX_QUEUE_DEPTH = 32   # Waiting jobs beyond this are rejected with queue_full
+GENERATE_WAIT_TIMEOUT = 1800  # Seconds POST /generate waits for its job before answering 504 (poll /jobs/<id> then)
+
+def comfyui_backend(spec):
+    """ComfyUIBackend for one COMFYUI_BACKENDS entry (supervised if it is local)"""
+    url = spec.get("url") or f"http://localhost:{spec['port']}"
+    backend = ComfyUIBackend(
+        url,
+        capacity=GPU_CONCURRENCY,
+        pool_size=COMFYUI_POOL_SIZE,
+        connect_timeout=COMFYUI_CONNECT_TIMEOUT,
+        read_timeout=COMFYUI_READ_TIMEOUT,
+        retries=COMFYUI_RETRIES,
+    )
+    if "url" not in spec:
+        # --preview-method makes ComfyUI send latent previews over /ws
+        cmd = ["python", "main.py", "--listen", "0.0.0.0", "--port", str(spec["port"]), "--preview-method", "auto"]
+        if spec.get("cuda_device") is not None:
+            cmd += ["--cuda-device", str(spec["cuda_device"])]
+        backend.supervisor = ComfyUISupervisor(
+            cmd,
+            cwd=COMFYUI_DIR,
+            ready_check=lambda: backend.client.system_stats(retries=0) is not None,
+            log_lines=COMFYUI_LOG_LINES,
+            echo=COMFYUI_ECHO_LOGS,
+        )
+    return backend
+
+comfy_pool = BackendPool(
+    [comfyui_backend(spec) for spec in COMFYUI_BACKENDS],
+    check_interval=BACKEND_CHECK_INTERVAL,
+    unhealthy_after=BACKEND_UNHEALTHY_AFTER,
+)
+
+# Fair share: users are served round-robin within a priority tier, and tiers
+# are served strictly highest first. Requests pick a tier with "priority".
+PRIORITY_TIERS = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+MAX_USER_QUEUE = 8     # Waiting jobs per user_id beyond this are rejected with user_queue_full
+MAX_USER_RUNNING = 2   # Jobs per user_id in flight on ComfyUI at once (None = no cap)
+
+# Model affinity: jobs whose model is already loaded on a free backend jump
+# ahead, so switching between e.g. flux1-krea-dev and flux1-schnell (tens of
+# seconds each) happens once per run of jobs instead of once per job. A job
+# never jumps ahead of one submitted more than MODEL_AFFINITY_MAX_WAIT
+# seconds before it, which bounds how long other-model jobs are held back.
+MODEL_AFFINITY = True
+MODEL_AFFINITY_MAX_WAIT = 60
+
+scheduler = JobScheduler(
+    runner=lambda job: run_generation_job(job),
+    workers=comfy_pool.capacity,
+    max_queue=MAX_QUEUE_DEPTH,
+    priorities=PRIORITY_TIERS,
+    default_priority=DEFAULT_PRIORITY,
+    max_user_queue=MAX_USER_QUEUE,
+    max_user_running=MAX_USER_RUNNING,
+    resident=(lambda: comfy_pool.free_models()) if MODEL_AFFINITY else None,
+    max_affinity_wait=MODEL_AFFINITY_MAX_WAIT,
+)
+
+# Per-step progress forwarded from ComfyUI's sampler to the owning clients
+# (updates beyond this rate are dropped; the last step is always sent)
+PROGRESS_EVENTS_PER_SECOND = 2
+
+# Live latent previews relayed from ComfyUI to SocketIO clients that ask for
+# them per request with "previews": true (and ack each generation_preview
+# frame). Each session gets at most PREVIEW_MAX_RATE frames/s and one
+# unacknowledged frame; newer frames replace older ones instead of queueing,
+# so slow clients cannot pile up emit buffers. SOCKETIO_PREVIEWS is the
+# default for requests that do not say
+SOCKETIO_PREVIEWS = False
+PREVIEW_MAX_RATE = 1.0         # Frames per second per session
+PREVIEW_MAX_SIZE = 384         # Longest side of a relayed preview (needs Pillow)
+PREVIEW_FORMAT = "jpeg"        # "jpeg" or "webp"
+PREVIEW_QUALITY = 70
+PREVIEW_ACK_TIMEOUT = 5.0      # Seconds before an unacknowledged frame is written off
+
+# Cancellation: jobs of a SocketIO user who has not reconnected within this
+# many seconds are cancelled (queued jobs dropped, running prompts interrupted)
+ORPHAN_GRACE_PERIOD = 30
+
+# Reconnects: a client that reconnects with auth {"user_id": ...} within this
+# many seconds of its last session closing keeps its user_id and receives
+# the results that finished while it was away
+SESSION_RESUME_TTL = 600
+
+# Warm-up: before /health reports ready, run a tiny throwaway generation so
+# the UNET, text encoders and VAE are loaded before the first real request
+WARMUP_ENABLED = True
+WARMUP_STEPS = 2
+WARMUP_SIZE = 256          # Latent width/height in pixels
+
+# Workflow templates: DEFAULT_WORKFLOW ("default") plus every workflows/*.json,
+# named after the file. Requests pick one with "template"; each is validated
+# once at startup and rendered into a fresh graph per request
+WORKFLOWS_DIR = str(Path(__file__).resolve().parent / "workflows")
+DEFAULT_TEMPLATE = "default"
+
+# Conditioning cache: comfyui_conditioning_cache.py is installed as a ComfyUI
+# custom node and the templates' prompt encoders are swapped for its cached
+# encoder, so the fixed negative prompt and repeated prompts skip T5/CLIP.
+# Stays off if any backend lacks the node
+CONDITIONING_CACHE = True
+CONDITIONING_CACHE_NODE = str(Path(__file__).resolve().parent / "comfyui_conditioning_cache.py")
+conditioning_cache_enabled = False
+
+# Models: models_manifest.json lists every model file, its ComfyUI/models
+# folder and where to download it. Every model a request's workflow loads is
+# checked against the local models folders before the job is queued, so a
+# misconfigured request fails at once (off without a local backend)
+MODELS_MANIFEST = str(Path(__file__).resolve().parent / "models_manifest.json")
+VALIDATE_MODELS = True
+
+# Lazy model fetching: a request loading a manifest model that is not on disk
+# yet is held ("fetching", with model_fetch_progress events) while the model
+# downloads - once, however many jobs wait for it - instead of being rejected.
+# Jobs whose models are present keep flowing. Gated models need HF_TOKEN in
+# the environment; with MODEL_STORE set, files are linked from the shared store
+LAZY_MODEL_FETCH = True
+MODEL_FETCH_CONNECTIONS = 8           # Parallel range requests per model
+MODEL_FETCH_PROGRESS_INTERVAL = 2.0   # Seconds between model_fetch_progress events
+HF_TOKEN = os.environ.get("HF_TOKEN")
+MODEL_STORE = os.environ.get("MODEL_STORE")
+
+# Asynchronous REST jobs (POST /jobs returns an id; results are collected later)
+JOB_TTL = 3600             # Seconds a finished job stays collectable
+MAX_STORED_JOBS = 10000    # Finished jobs beyond this are evicted oldest first
+JOB_LONG_POLL_MAX = 60     # Longest ?wait= a GET /jobs/<id> may block for
+
+job_store = JobStore(ttl=JOB_TTL, max_jobs=MAX_STORED_JOBS)
+
+# Result cache keyed on the hash of the final workflow graph (seed is fixed,
+# so identical graphs produce byte-identical images)
+RESULT_CACHE_DIR = str(Path(__file__).resolve().parent / "result_cache")
+RESULT_CACHE_MEMORY_BYTES = 256 * 1024 * 1024     # In-memory LRU tier
+RESULT_CACHE_DISK_BYTES = 4 * 1024 * 1024 * 1024  # On-disk tier
+
+# How SocketIO clients receive images (clients may override per request with
+# "image_format"):
+#   "base64"  - data:image/png;base64,... string in image_ready (old clients)
+#   "binary"  - raw PNG bytes as a SocketIO binary attachment
+#   "chunked" - image_chunk binary frames with sequence numbers, then image_ready
+SOCKETIO_IMAGE_FORMAT = "base64"
+SOCKETIO_IMAGE_FORMATS = ("base64", "binary", "chunked")
+SOCKETIO_CHUNK_SIZE = 512 * 1024               # Bytes per image_chunk frame
+SOCKETIO_MAX_BINARY_BYTES = 8 * 1024 * 1024    # Larger "binary" images are chunked
+
+# Chunk size used when proxying images from ComfyUI to REST clients
+STREAM_CHUNK_SIZE = 64 * 1024
+
+result_cache = ResultCache(
+    memory_bytes=RESULT_CACHE_MEMORY_BYTES,
+    disk_dir=RESULT_CACHE_DIR,
+    disk_bytes=RESULT_CACHE_DISK_BYTES,
+)
+
+preview_relay = PreviewRelay(
+    send=lambda sid, message, on_ack: socketio.emit('generation_preview', message, to=sid, callback=on_ack),
+    max_rate=PREVIEW_MAX_RATE,
+    max_size=PREVIEW_MAX_SIZE,
+    image_format=PREVIEW_FORMAT,
+    quality=PREVIEW_QUALITY,
+    ack_timeout=PREVIEW_ACK_TIMEOUT,
+)
+
 # Add ComfyUI to path
 sys.path.insert(0, COMFYUI_DIR)
 
@@ -45,8 +257,16 @@ app = Flask(__name__)
 # Initialize SocketIO with CORS support for ngrok URLs
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
 
-# Track connected users {user_id: session_id}
-connected_users = {}
+# Connected SocketIO sessions, indexed by user_id and by sid
+sessions = SessionRegistry(ttl=SESSION_RESUME_TTL)
+
+# Startup state behind /health (readiness) and /health/live (liveness).
+# phase: starting -> spawning -> warming_up -> ready (or failed)
+startup = {"phase": "starting", "ready": False, "started": time.time(), "cold_start": {}}
+
+# Prompts currently on ComfyUI {prompt_id: backend running it}
+running_prompts = {}
+running_prompts_lock = threading.Lock()
 
 # Aspect ratio presets (Fixed pixel budget ~2.4M pixels for consistent quality/speed)
 ASPECT_RATIOS = {
@@ -135,30 +355,286 @@ DEFAULT_WORKFLOW = {
     }
 }
 
+workflow_templates = load_templates(WORKFLOWS_DIR, builtin={DEFAULT_TEMPLATE: DEFAULT_WORKFLOW})
+
+try:
+    model_manifest = load_manifest(MODELS_MANIFEST)
+except ManifestError as e:
+    log(f"⚠️  {e}")
+    model_manifest = None
+model_inventory = (ModelInventory(Path(COMFYUI_DIR) / "models")
+                   if VALIDATE_MODELS and any("port" in backend for backend in COMFYUI_BACKENDS) else None)
+model_fetcher = None
+if LAZY_MODEL_FETCH and model_inventory is not None and model_manifest is not None:
+    model_fetcher = ModelFetcher(
+        ModelDownloader(headers={"Authorization": f"Bearer {HF_TOKEN}"} if HF_TOKEN else None,
+                        connections=MODEL_FETCH_CONNECTIONS, progress_interval=MODEL_FETCH_PROGRESS_INTERVAL,
+                        store=ModelStore(MODEL_STORE) if MODEL_STORE else None),
+        model_manifest, model_inventory, Path(COMFYUI_DIR) / "models",
+        on_progress=lambda fetch: _emit_model_fetch_progress(fetch),
+    )
+
+def check_models(workflow):
+    """Manifest models a workflow needs fetched before it can run ([] when all are on disk)
+    
+    Raises MissingModelError if it loads files that are not on disk and
+    cannot be fetched (or lazy fetching is off).
+    """
+    if model_inventory is None:
+        return []
+    if model_fetcher is not None:
+        return model_fetcher.missing(workflow)
+    problems = missing_models(workflow, model_inventory, model_manifest)
+    if problems:
+        raise MissingModelError(problems)
+    return []
+
+def schedule_job(job, fetch_models=()):
+    """Queue a job, or hold it as "fetching" until ``fetch_models`` are downloaded
+    
+    Returns the queue position (None for a held job, or for one finished
+    with an error because its fetch could not be started). Raises
+    QueueFull like JobScheduler.submit.
+    """
+    if not fetch_models:
+        return scheduler.submit(job)
+    scheduler.hold(job)
+    try:
+        fetches = job.params["fetches"] = model_fetcher.fetch(fetch_models, waiter=job)
+        threading.Thread(target=_release_when_fetched, args=(job, fetches), daemon=True).start()
+    except Exception as e:
+        # Never leave the job held: it would stay "fetching" and keep its user's slot
+        scheduler.release(job, f"model download failed to start: {e}")
+        _fail_job(job, job.error)
+        return None
+    log(f"⏬ Job {job.id[:8]}... waits for {', '.join(entry.name for entry in fetch_models)}")
+    return None
+
+def _release_when_fetched(job, fetches):
+    """Queue a held job once its model fetches end (or fail it if one failed)"""
+    for fetch in fetches:
+        fetch.done.wait()
+    failed = [fetch for fetch in fetches if fetch.error is not None]
+    error = f"model download failed: {failed[0].entry.name}: {failed[0].error}" if failed else None
+    position = scheduler.release(job, error)
+    if job.error is not None and not job.cancelled:
+        _fail_job(job, job.error)
+    elif position is not None:
+        log(f"📥 Job {job.id[:8]}... models fetched, queued at position {position}")
+        if job.params["kind"] == "socketio":
+            _emit_queue_position(job, position)
+
+def get_template(name=None):
+    """Workflow template by name (default template for None); raises TemplateError"""
+    name = name or DEFAULT_TEMPLATE
+    template = workflow_templates.get(name) if isinstance(name, str) else None
+    if template is None:
+        raise TemplateError(f"Unknown template '{name}' (available: {', '.join(sorted(workflow_templates))})")
+    return template
+
 def start_comfyui():
-    """Start ComfyUI in the background"""
-    log("🚀 Starting ComfyUI...")
+    """Start the local ComfyUI backends under their supervisors
+    
+    Returns True once at least one backend answers; backends that come up
+    later join the pool when the health checks see them.
+    """
+    local = [backend for backend in comfy_pool.backends if backend.supervisor]
+    log(f"🚀 Starting ComfyUI ({len(local)} local, {len(comfy_pool.backends) - len(local)} remote backend(s))...")
     
-    # Start ComfyUI
-    cmd = f"cd {COMFYUI_DIR} && python main.py --listen 0.0.0.0 --port {PORT}"
-    subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if CONDITIONING_CACHE and local:
+        install_conditioning_cache_node()
+    
+    # The supervisor drains ComfyUI's output; unread pipes stall it at ~64 KB
+    spawned = time.time()
+    for backend in local:
+        backend.supervisor.start()
     
     # Wait for ComfyUI to start
-    max_attempts = 30
+    max_attempts = COMFYUI_START_TIMEOUT // 2
     for i in range(max_attempts):
-        try:
-            response = requests.get(f"http://localhost:{PORT}/system_stats")
-            if response.status_code == 200:
-                log("✅ ComfyUI is ready!")
-                return True
-        except:
-            pass
+        comfy_pool.check()
+        if all(backend.healthy for backend in comfy_pool.backends):
+            break
         time.sleep(2)
-        log(f"⏳ Waiting for ComfyUI... ({i+1}/{max_attempts})")
+        log(f"⏳ Waiting for ComfyUI... ({len(comfy_pool.healthy())}/{len(comfy_pool.backends)} up, "
+            f"{i+1}/{max_attempts})")
+    
+    up = comfy_pool.healthy()
+    if up:
+        startup["cold_start"]["process_spawn"] = round(time.time() - spawned, 2)
+        log(f"✅ ComfyUI is ready! ({len(up)}/{len(comfy_pool.backends)} backend(s) up "
+            f"in {startup['cold_start']['process_spawn']}s)")
+        return True
     
-    log("❌ ComfyUI failed to start")
+    log("❌ ComfyUI failed to start. Last log lines:")
+    for backend in local:
+        for line in backend.supervisor.tail(20):
+            log(f"   | {line}")
     return False
 
+def install_conditioning_cache_node():
+    """Copy the CachedCLIPTextEncode node into ComfyUI/custom_nodes (if changed)"""
+    target = Path(COMFYUI_DIR) / "custom_nodes" / Path(CONDITIONING_CACHE_NODE).name
+    try:
+        source = Path(CONDITIONING_CACHE_NODE).read_bytes()
+        if not target.exists() or target.read_bytes() != source:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(source)
+            log(f"🧠 Installed conditioning cache node to {target}")
+    except OSError as e:
+        log(f"⚠️  Could not install conditioning cache node: {e}")
+
+def enable_conditioning_cache():
+    """Switch the templates to CachedCLIPTextEncode if every backend has the node
+    
+    Called before the warm-up, so the warm-up already caches the negative
+    prompt. Returns True if the cache is in use.
+    """
+    global workflow_templates, conditioning_cache_enabled
+    missing = []
+    for backend in comfy_pool.backends:
+        try:
+            if "CachedCLIPTextEncode" in backend.client.object_info("CachedCLIPTextEncode"):
+                continue
+        except Exception:
+            pass
+        missing.append(backend.name)
+    if missing:
+        log(f"⚠️  Conditioning cache off: no CachedCLIPTextEncode node on {', '.join(missing)}")
+        return False
+    workflow_templates = load_templates(WORKFLOWS_DIR, builtin={DEFAULT_TEMPLATE: DEFAULT_WORKFLOW},
+                                        transform=cached_text_encoders)
+    conditioning_cache_enabled = True
+    log("🧠 Conditioning cache on: prompt encodings are reused across requests")
+    return True
+
+def build_warmup_workflow():
+    """Default workflow shrunk to a few steps on a small latent
+    
+    It loads exactly the models real requests use, so they are resident
+    when the first user arrives.
+    """
+    return get_template().render(steps=WARMUP_STEPS, width=WARMUP_SIZE, height=WARMUP_SIZE,
+                                 prompt="warm-up", filename_prefix="warmup/ComfyUI_warmup")
+
+def warm_up_comfyui(backend):
+    """Run the warm-up workflow on one backend and return its cold-start breakdown
+    
+    model_load is the time from queueing until the sampler starts (loader
+    nodes and text encoding); first_sample is the sampler plus VAE decode,
+    including moving the UNET onto the GPU. Per-node times are recorded
+    when the event stream is connected. Returns None if the warm-up failed.
+    """
+    log(f"🔥 Warming up ComfyUI {backend.name} ({WARMUP_STEPS} steps @ {WARMUP_SIZE}×{WARMUP_SIZE})...")
+    workflow = build_warmup_workflow()
+    timeline = []  # (time, node_id) for each node ComfyUI starts
+    
+    result = queue_prompt(backend, workflow)
+    if not result or "prompt_id" not in result:
+        log(f"❌ Failed to queue warm-up prompt on {backend.name}: {result}")
+        return None
+    prompt_id = result["prompt_id"]
+    queued = time.time()
+    
+    def on_event(msg_type, data):
+        if msg_type == "executing" and data.get("node"):
+            timeline.append((time.time(), data["node"]))
+    
+    backend.events.watch(prompt_id, on_event)
+    outcome = wait_for_outputs(backend, prompt_id)
+    finished = time.time()
+    if not outcome or "error" in outcome:
+        log(f"❌ Warm-up generation on {backend.name} failed: "
+            f"{comfyui_error_message(outcome['error']) if outcome else 'timeout'}")
+        return None
+    backend.model = workflow_model(workflow)
+    
+    cold_start = {}
+    cold_start["warmup_total"] = round(finished - queued, 2)
+    sampler = get_template().node("steps")
+    sampler_start = next((t for t, node in timeline if node == sampler), None)
+    if sampler_start is not None:
+        cold_start["model_load"] = round(sampler_start - queued, 2)
+        cold_start["first_sample"] = round(finished - sampler_start, 2)
+    nodes = {}
+    for (start, node), (end, _) in zip(timeline, timeline[1:] + [(finished, None)]):
+        class_type = workflow.get(node, {}).get("class_type", node)
+        nodes[class_type] = round(nodes.get(class_type, 0) + end - start, 2)
+    if nodes:
+        cold_start["nodes"] = nodes
+    log(f"✅ Warm-up of {backend.name} done in {cold_start['warmup_total']}s: {json.dumps(cold_start)}")
+    return cold_start
+
+def bring_up():
+    """Start ComfyUI, warm it up and start the workers; /health turns ready at the end
+    
+    Runs in the background so the API answers /health/live (and queues
+    requests) while the models load.
+    """
+    startup["phase"] = "spawning"
+    if not start_comfyui():
+        startup["phase"] = "failed"
+        # No worker will ever run: fail what is waiting and refuse the rest (503)
+        for job in scheduler.close("ComfyUI failed to start"):
+            _fail_job(job, job.error)
+        log("❌ Failed to start ComfyUI. /health/live now reports failure and new jobs are refused")
+        return
+    
+    comfy_pool.start()
+    if CONDITIONING_CACHE:
+        enable_conditioning_cache()
+    if model_inventory is not None:
+        for name, template in sorted(workflow_templates.items()):
+            problems = missing_models(template.render(), model_inventory, model_manifest)
+            try:
+                fetchable = model_fetcher is not None and bool(model_fetcher.missing(template.render()))
+            except MissingModelError:
+                fetchable = False
+            if fetchable:
+                log(f"⏬ Template '{name}': {len(problems)} model(s) will be downloaded when first requested")
+                continue
+            for problem in problems:
+                log(f"⚠️  Template '{name}': {problem}")
+    
+    # Subscribe to each backend's execution events (completion without polling)
+    for backend in comfy_pool.backends:
+        if backend.events.start() and backend.healthy and not backend.events.wait_connected(timeout=10):
+            log(f"⚠️  Event stream of {backend.name} not connected yet - using /history until it is")
+    
+    if WARMUP_ENABLED:
+        # Backends sit on separate GPUs, so they load their models in parallel
+        startup["phase"] = "warming_up"
+        results = {}
+        
+        def warm_up(backend):
+            results[backend.name] = warm_up_comfyui(backend)
+        
+        threads = [threading.Thread(target=warm_up, args=(backend,)) for backend in comfy_pool.healthy()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        warmed = [results[backend.name] for backend in comfy_pool.backends if results.get(backend.name)]
+        if warmed:
+            startup["cold_start"].update(warmed[0])
+            if len(comfy_pool.backends) > 1:
+                startup["cold_start"]["backends"] = results
+        else:
+            log("⚠️  Warm-up failed - accepting traffic anyway, first request will be slow")
+    
+    # Start the generation workers
+    scheduler.start()
+    log(f"👷 Scheduler started: {comfy_pool.capacity} worker(s) on {len(comfy_pool.backends)} ComfyUI backend(s), "
+        f"max queue depth {MAX_QUEUE_DEPTH}")
+    
+    startup["cold_start"]["ready_after"] = round(time.time() - startup["started"], 2)
+    startup["phase"] = "ready"
+    startup["ready"] = True
+    log(f"🟢 Ready for traffic {startup['cold_start']['ready_after']}s after launch")
+    
+    # Send Discord notification
+    send_discord_notification(get_notebook_url())
+
 def send_discord_notification(url):
     """Send Discord notification with API URL"""
     log("📬 Sending Discord notification...")
@@ -203,72 +679,133 @@ def send_discord_notification(url):
     except Exception as e:
         log(f"   ❌ Failed to send Discord notification: {e}")
 
-def queue_prompt(workflow):
-    """Queue a prompt to ComfyUI"""
+def queue_prompt(backend, workflow):
+    """Queue a prompt to a ComfyUI backend"""
     try:
-        p = {"prompt": workflow, "client_id": str(uuid.uuid4())}
-        response = requests.post(f"http://localhost:{PORT}/prompt", json=p)
-        return response.json()
+        return backend.client.queue_prompt(workflow)
     except Exception as e:
         print(f"Error queuing prompt: {e}")
         return None
 
-def get_image(filename, subfolder, folder_type):
-    """Get generated image from ComfyUI"""
-    params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
-    response = requests.get(f"http://localhost:{PORT}/view", params=params)
-    return response.content
+def get_image(image_info):
+    """Get a generated image from the ComfyUI backend that rendered it"""
+    backend = comfy_pool.get(image_info["backend"])
+    return backend.client.get_image(
+        image_info["filename"],
+        image_info.get("subfolder", ""),
+        image_info.get("type", "output")
+    )
+
+def _check_history(backend, prompt_id):
+    """Look up a prompt in /history (fallback when the event stream is down)
+    
+    Returns {"outputs": {node_id: [image, ...]}} once the prompt finished,
+    {"error": status} if it failed, or None while it is still running.
+    """
+    history = backend.client.history(prompt_id)
+    
+    if prompt_id not in history:
+        return None
+    
+    prompt_data = history[prompt_id]
+    
+    # Check for errors in execution
+    status = prompt_data.get("status", {})
+    if "status_str" in status and status["status_str"] == "error":
+        log(f"❌ ComfyUI execution error detected!")
+        log(f"   Error details: {json.dumps(status, indent=2)}")
+        return {"error": status, "prompt_id": prompt_id}
+    
+    # Check if there are error messages
+    if "messages" in status and status["messages"]:
+        log(f"⚠️  ComfyUI messages: {status['messages']}")
+    
+    # Check for outputs
+    outputs = {
+        node_id: node_output["images"]
+        for node_id, node_output in prompt_data.get("outputs", {}).items()
+        if node_output.get("images")
+    }
+    if outputs or status.get("completed"):
+        return {"outputs": outputs, "prompt_id": prompt_id}
+    return None
 
-def wait_for_completion(prompt_id):
-    """Wait for image generation to complete"""
+def wait_for_outputs(backend, prompt_id, cancelled=None, lost=None):
+    """Wait for a prompt to finish and return its images per output node
+    
+    Completion is pushed over ComfyUI's /ws event stream; /history is only
+    polled while the stream is disconnected, or once if a prompt finished
+    without reporting images (e.g. fully cached outputs). ``cancelled()``
+    is checked while polling; with the stream up, backend.events.cancel()
+    releases the wait at once. ``lost()`` returns True once the prompt
+    can no longer finish (the backend restarted or stopped answering).
+    
+    Returns {"outputs": {node_id: [image, ...]}}, {"error": status},
+    {"cancelled": True}, {"lost": True} or None on timeout.
+    """
     max_wait = 900  # Increased to 15 minutes for high-quality generation
     start_time = time.time()
     last_progress_log = 0
     
     log(f"⏳ Waiting for high-quality generation (max {max_wait}s)...")
     
-    while time.time() - start_time < max_wait:
-        elapsed = time.time() - start_time
-        
-        # Log progress every 30 seconds
-        if elapsed - last_progress_log >= 30:
-            log(f"⏱️  Generation in progress... {int(elapsed)}s elapsed (quality mode: 30 steps @ 1536×1536)")
-            last_progress_log = elapsed
-        
-        try:
-            response = requests.get(f"http://localhost:{PORT}/history/{prompt_id}")
-            history = response.json()
+    try:
+        while time.time() - start_time < max_wait:
+            elapsed = time.time() - start_time
+            
+            if cancelled and cancelled():
+                log(f"🛑 Stopped waiting for cancelled prompt {prompt_id}")
+                return {"cancelled": True, "prompt_id": prompt_id}
+            if lost and lost():
+                log(f"💥 Prompt {prompt_id} was lost: ComfyUI backend {backend.name} restarted or stopped answering")
+                return {"lost": True, "prompt_id": prompt_id}
             
-            if prompt_id in history:
-                prompt_data = history[prompt_id]
-                
-                # Check for errors in execution
-                status = prompt_data.get("status", {})
-                if "status_str" in status and status["status_str"] == "error":
+            # Log progress every 30 seconds
+            if elapsed - last_progress_log >= 30:
+                log(f"⏱️  Generation in progress... {int(elapsed)}s elapsed (quality mode: 30 steps @ 1536×1536)")
+                last_progress_log = elapsed
+            
+            if backend.events.connected:
+                remaining = max_wait - elapsed
+                waiter = backend.events.wait(prompt_id, timeout=min(30, remaining))
+                if waiter is None:
+                    # Still running (or the stream dropped) - a cheap /history
+                    # check every 30s covers events missed during a reconnect
+                    pass
+                elif waiter.cancelled:
+                    log(f"🛑 Stopped waiting for cancelled prompt {prompt_id}")
+                    return {"cancelled": True, "prompt_id": prompt_id}
+                elif waiter.error:
                     log(f"❌ ComfyUI execution error detected!")
-                    log(f"   Error details: {json.dumps(status, indent=2)}")
-                    return {"error": status, "prompt_id": prompt_id}
-                
-                # Check if there are error messages
-                if "messages" in status and status["messages"]:
-                    log(f"⚠️  ComfyUI messages: {status['messages']}")
-                
-                # Check for outputs
-                outputs = prompt_data.get("outputs", {})
-                if outputs:
-                    for node_id, node_output in outputs.items():
-                        if "images" in node_output:
-                            log(f"✅ High-quality image generation complete after {int(elapsed)}s!")
-                            return node_output["images"][0]
-        except Exception as e:
-            log(f"⚠️  Error checking history: {e}")
-        
-        time.sleep(1)
+                    log(f"   Error details: {json.dumps(waiter.error, indent=2)}")
+                    return {"error": waiter.error, "prompt_id": prompt_id}
+                elif waiter.outputs:
+                    log(f"✅ High-quality image generation complete after {time.time() - start_time:.1f}s!")
+                    return {"outputs": waiter.outputs, "prompt_id": prompt_id}
+                else:
+                    log("⚠️  Prompt finished without image events, checking history...")
+                    try:
+                        return _check_history(backend, prompt_id)
+                    except Exception as e:
+                        log(f"⚠️  Error checking history: {e}")
+                        return None
+            
+            try:
+                result = _check_history(backend, prompt_id)
+                if result:
+                    if "error" not in result:
+                        log(f"✅ High-quality image generation complete after {int(elapsed)}s!")
+                    return result
+            except Exception as e:
+                log(f"⚠️  Error checking history: {e}")
+            
+            time.sleep(1)
+    finally:
+        backend.events.forget(prompt_id)
     
     # Timeout - try to get the last known status
     try:
-        response = requests.get(f"http://localhost:{PORT}/history/{prompt_id}")
-        history = response.json()
+        history = backend.client.history(prompt_id)
         if prompt_id in history:
             log(f"⚠️  Timeout! Last known status:")
             log(f"   {json.dumps(history[prompt_id].get('status', {}), indent=2)}")
@@ -277,6 +814,25 @@ def wait_for_completion(prompt_id):
     
     return None
 
+def comfyui_error_message(error_details):
+    """Extract a readable message from a ComfyUI error status"""
+    error_msg = "ComfyUI execution failed"
+    
+    # Try to extract useful error message
+    if "messages" in error_details:
+        for msg in error_details.get("messages", []):
+            if isinstance(msg, list) and len(msg) > 1:
+                if msg[0] == "execution_error":
+                    error_data = msg[1]
+                    exception_msg = error_data.get("exception_message", "Unknown error")
+                    node_type = error_data.get("node_type", "Unknown")
+                    error_msg = f"ComfyUI error in {node_type}: {exception_msg}"
+                    break
+                if msg[0] == "execution_interrupted":
+                    error_msg = "ComfyUI execution was interrupted"
+                    break
+    return error_msg
+
 # ============================================
 # SocketIO Event Handlers
 # ============================================
@@ -294,14 +850,16 @@ def catch_all(event, data):
     log(f"🔔 CATCH-ALL: Received event '{event}' with data: {data}")
 
 @socketio.on('connect')
-def handle_connect():
-    """Handle client connection"""
+def handle_connect(auth=None):
+    """Handle client connection (auth or ?user_id= resumes a previous user_id)"""
     try:
-        user_id = str(uuid.uuid4())
-        connected_users[user_id] = request.sid
-        emit('connected', {'user_id': user_id, 'message': 'Connected to ComfyUI API'})
-        log(f"✅ WebSocket connected: User {user_id[:8]}... (sid: {request.sid})")
-        log(f"📊 Total connected users: {len(connected_users)}")
+        requested = auth.get('user_id') if isinstance(auth, dict) else request.args.get('user_id')
+        user_id, resumed = sessions.connect(request.sid, requested if isinstance(requested, str) else None)
+        emit('connected', {'user_id': user_id, 'resumed': resumed, 'message': 'Connected to ComfyUI API'})
+        log(f"✅ WebSocket {'reconnected' if resumed else 'connected'}: User {user_id[:8]}... (sid: {request.sid})")
+        log(f"📊 Total connected users: {len(sessions)}")
+        if resumed:
+            socketio.start_background_task(_deliver_held_results, user_id, request.sid)
     except Exception as e:
         log(f"❌ Error in connect handler: {e}")
         import traceback
@@ -313,12 +871,15 @@ def handle_disconnect(reason=None):
     try:
         # Find and remove user
         disconnect_reason = f" (reason: {reason})" if reason else ""
-        for uid, sid in list(connected_users.items()):
-            if sid == request.sid:
-                del connected_users[uid]
-                log(f"❌ WebSocket disconnected: User {uid[:8]}...{disconnect_reason}")
-                log(f"📊 Remaining connected users: {len(connected_users)}")
-                break
+        preview_relay.forget(request.sid)
+        uid, last = sessions.disconnect(request.sid)
+        if uid is not None:
+            log(f"❌ WebSocket disconnected: User {uid[:8]}...{disconnect_reason}")
+            log(f"📊 Remaining connected users: {len(sessions)}")
+            if last and job_store.active(uid):
+                timer = threading.Timer(ORPHAN_GRACE_PERIOD, _cancel_orphaned_jobs, args=(uid,))
+                timer.daemon = True
+                timer.start()
     except Exception as e:
         log(f"❌ Error in disconnect handler: {e}")
         import traceback
@@ -344,6 +905,10 @@ def _handle_generation_request(data, event_name):
         user_id = data.get('user_id') if isinstance(data, dict) else None
         prompt = data.get('prompt', 'a beautiful landscape') if isinstance(data, dict) else 'a beautiful landscape'
         aspect_ratio = data.get('aspect_ratio', '1:1') if isinstance(data, dict) else '1:1'  # NEW!
+        image_format = data.get('image_format', SOCKETIO_IMAGE_FORMAT) if isinstance(data, dict) else SOCKETIO_IMAGE_FORMAT
+        previews = bool(data.get('previews', SOCKETIO_PREVIEWS)) if isinstance(data, dict) else SOCKETIO_PREVIEWS
+        priority = data.get('priority', DEFAULT_PRIORITY) if isinstance(data, dict) else DEFAULT_PRIORITY
+        template = data.get('template', DEFAULT_TEMPLATE) if isinstance(data, dict) else DEFAULT_TEMPLATE
         
         if not user_id:
             log(f"⚠️ No user_id in data. Data keys: {data.keys() if isinstance(data, dict) else 'N/A'}")
@@ -361,25 +926,114 @@ def _handle_generation_request(data, event_name):
         
         width, height = ASPECT_RATIOS[aspect_ratio]
         
+        if image_format not in SOCKETIO_IMAGE_FORMATS:
+            log(f"⚠️ Invalid image format '{image_format}', defaulting to {SOCKETIO_IMAGE_FORMAT}")
+            image_format = SOCKETIO_IMAGE_FORMAT
+        
+        if priority not in PRIORITY_TIERS:
+            log(f"⚠️ Invalid priority '{priority}', defaulting to {DEFAULT_PRIORITY}")
+            priority = DEFAULT_PRIORITY
+        
+        if not isinstance(template, str) or template not in workflow_templates:
+            log(f"⚠️ Unknown template '{template}' from user {user_id[:8]}...")
+            emit('generation_error', {
+                'status': 'error',
+                'error': 'Unknown template',
+                'message': f"Unknown template '{template}' (available: {', '.join(sorted(workflow_templates))})"
+            })
+            return
+        
         log(f"🎨 SocketIO generation request from user {user_id[:8]}...: '{prompt}'")
         log(f"📐 Aspect ratio: {aspect_ratio} → {width}×{height} ({width*height:,} pixels)")
-        log(f"👤 User session ID: {connected_users.get(user_id, 'NOT FOUND')}")
+        log(f"👤 User session IDs: {', '.join(sessions.sids(user_id)) or 'NOT FOUND'}")
         
-        # Run generation in background thread to keep socket alive
-        log(f"🚀 Starting background generation thread...")
-        threading.Thread(target=generate_and_emit, args=(user_id, prompt, width, height, aspect_ratio), daemon=True).start()
+        # The graph (checked for models) and its pre-encoded JSON (sent as is, hashed for the cache)
+        workflow_template, slots = generation_slots(prompt, width, height, template)
+        workflow = workflow_template.render(**slots)
+        try:
+            fetch_models = check_models(workflow)
+        except MissingModelError as e:
+            log(f"🚫 Rejecting request from user {user_id[:8]}...: {e}")
+            emit('generation_error', {
+                'status': 'error',
+                'error': 'missing_models',
+                'message': 'The server is missing model files this workflow needs',
+                'problems': e.problems
+            })
+            return
+        prompt_json = workflow_template.encode(**slots)
+        cache_key = workflow_key(prompt_json)
+        
+        # Identical workflow already rendered? Answer straight from the cache
+        image_data = result_cache.get(cache_key)
+        if image_data is not None:
+            log(f"⚡ Result cache hit for user {user_id[:8]}... ({cache_key[:12]})")
+            _emit_image(request.sid, user_id, prompt, image_data, 0.0, cached=True, image_format=image_format)
+            return
+        
+        # Hand the job to the scheduler (workers keep the socket free)
+        job = Job(
+            user_id=user_id,
+            on_position=_emit_queue_position,
+            priority=priority,
+            affinity=workflow_model(workflow),
+            kind="socketio",
+            workflow=workflow,
+            prompt_json=prompt_json,
+            cache_key=cache_key,
+            prompt=prompt,
+            aspect_ratio=aspect_ratio,
+            image_format=image_format,
+            previews=previews,
+        )
+        try:
+            position = schedule_job(job, fetch_models)
+        except SchedulerClosed as e:
+            log(f"🚫 Rejecting request from user {user_id[:8]}...: {e}")
+            emit('generation_error', {
+                'status': 'error',
+                'error': 'unavailable',
+                'message': 'The image generator failed to start, please try again later'
+            })
+            return
+        except UserQueueFull as e:
+            log(f"🚫 Rejecting request from user {user_id[:8]}...: {e}")
+            emit('generation_error', {
+                'status': 'error',
+                'error': 'user_queue_full',
+                'message': f'You already have {MAX_USER_QUEUE} images waiting, please wait for them to finish',
+                'max_user_queue': MAX_USER_QUEUE
+            })
+            return
+        except QueueFull as e:
+            log(f"🚫 Rejecting request from user {user_id[:8]}...: {e}")
+            emit('generation_error', {
+                'status': 'error',
+                'error': 'queue_full',
+                'message': 'Server is busy, please try again in a few minutes',
+                'queue_depth': MAX_QUEUE_DEPTH
+            })
+            return
+        job_store.add(job)
+        if position is not None:
+            log(f"📥 Job {job.id[:8]}... queued at position {position}")
         
-        # Send immediate acknowledgment
+        # Send immediate acknowledgment (steps as rendered; None if the template has no steps slot)
+        steps = workflow_template.value(workflow, "steps")
         emit('generation_started', {
             'status': 'started',
             'message': f'Generating high-quality image for: "{prompt}"',
-            'estimated_time': f'120-180 seconds (high quality mode: 30 steps @ {width}×{height})',
+            'estimated_time': f'120-180 seconds (high quality mode: {f"{steps} steps @ " if steps else ""}{width}×{height})',
             'prompt': prompt,
             'quality_mode': 'high',
             'resolution': f'{width}×{height}',
             'aspect_ratio': aspect_ratio,
-            'steps': 30,
-            'total_pixels': width * height
+            'steps': steps,
+            'total_pixels': width * height,
+            'job_id': job.id,
+            'queue_position': position,
+            'priority': priority,
+            'fetching_models': [entry.name for entry in fetch_models]
         })
         log(f"✅ Sent generation_started acknowledgment to user {user_id[:8]}...")
         log(f"✅ Generation task queued for background processing")
@@ -394,6 +1048,60 @@ def _handle_generation_request(data, event_name):
             'message': 'Failed to process generation request'
         })
 
+def _emit_model_fetch_progress(fetch):
+    """Send a model download's progress to the users of the SocketIO jobs waiting for it"""
+    message = fetch.snapshot()
+    if fetch.state == "downloading":
+        percent = f" ({message['percent']:.0f}%)" if message["percent"] is not None else ""
+        message["message"] = f"Downloading model {fetch.entry.name}{percent}..."
+    elif fetch.state == "done":
+        message["message"] = f"Model {fetch.entry.name} is ready"
+    else:
+        message["message"] = f"Downloading model {fetch.entry.name} failed"
+    for job in list(fetch.waiters):
+        if job.cancelled or job.params["kind"] != "socketio":
+            continue
+        for sid in sessions.sids(job.user_id):
+            socketio.emit('model_fetch_progress', dict(message, job_id=job.id), to=sid)
+
+def _emit_queue_position(job, position):
+    """Send a queued job's new place in line to its user"""
+    for sid in sessions.sids(job.user_id):
+        socketio.emit('generation_progress', {
+            'status': 'queued',
+            'message': f'Waiting in queue (position {position})',
+            'job_id': job.id,
+            'queue_position': position
+        }, to=sid)
+
+@socketio.on('cancel_generation')
+def handle_cancel_generation(data):
+    """Cancel one of the user's jobs (event: cancel_generation {user_id, job_id})"""
+    data = data if isinstance(data, dict) else {}
+    job = job_store.get(data.get('job_id') or '')
+    if job is None or job.user_id != data.get('user_id'):
+        emit('generation_error', {
+            'status': 'error',
+            'error': 'not_found',
+            'message': 'Unknown job id',
+            'job_id': data.get('job_id')
+        })
+        return
+    state = cancel_job(job)
+    emit('generation_cancelled', {
+        'status': 'cancelled' if state else job.state,
+        'job_id': job.id,
+        'was': state
+    })
+
+def _cancel_orphaned_jobs(user_id):
+    """Grace period over: cancel the jobs of a user who did not come back"""
+    if sessions.is_connected(user_id):
+        return
+    for job in job_store.active(user_id):
+        if cancel_job(job):
+            log(f"🛑 Cancelled job {job.id[:8]}... (user {user_id[:8]}... gone for {ORPHAN_GRACE_PERIOD}s)")
+
 @socketio.on('generate_image')
 def handle_generate_image(data):
     """Handle real-time image generation request via WebSocket (event: generate_image)"""
@@ -404,137 +1112,513 @@ def handle_generate(data):
     """Handle real-time image generation request via WebSocket (event: generate)"""
     _handle_generation_request(data, 'generate')
 
-def generate_and_emit(user_id, prompt, width=1536, height=1536, aspect_ratio="1:1"):
-    """Generate image and emit to specific user"""
-    try:
-        log(f"⌛ Starting generation for user {user_id[:8]}...")
-        log(f"📐 Resolution: {width}×{height} (aspect ratio: {aspect_ratio})")
-        
-        # Enhance prompt with quality keywords
-        enhanced_prompt = f"{prompt}, high quality, detailed, sharp focus, professional, 8k uhd, masterpiece"
-        log(f"✨ Enhanced prompt: '{enhanced_prompt}'")
-        
-        # Update workflow with enhanced prompt and dynamic dimensions
-        workflow = DEFAULT_WORKFLOW.copy()
-        
-        # Set dynamic dimensions
-        if "5" in workflow:
-            workflow["5"]["inputs"]["width"] = width
-            workflow["5"]["inputs"]["height"] = height
-            log(f"✅ Workflow updated with {width}×{height} dimensions")
-        
-        # Set enhanced prompt
-        if "6" in workflow:
-            workflow["6"]["inputs"]["text"] = enhanced_prompt
-        
-        # Queue the prompt
-        result = queue_prompt(workflow)
-        if not result or "prompt_id" not in result:
-            raise Exception("Failed to queue prompt")
-        
-        prompt_id = result["prompt_id"]
-        log(f"✅ Queued prompt {prompt_id} for user {user_id[:8]}...")
-        
-        # Send progress update
-        sid = connected_users.get(user_id)
-        if sid:
-            socketio.emit('generation_progress', {
-                'status': 'processing',
-                'message': 'Image is being generated...',
-                'prompt_id': prompt_id
+def generation_slots(prompt, width, height, template=None, **params):
+    """(template, slot values) for a request: quality-enhanced prompt and dimensions
+    
+    Extra ``params`` fill other template slots (seed, steps, model...);
+    raises TemplateError for an unknown template or slot.
+    """
+    # Enhance prompt with quality keywords
+    enhanced_prompt = f"{prompt}, high quality, detailed, sharp focus, professional, 8k uhd, masterpiece"
+    
+    template = get_template(template)
+    slots = {name: value for name, value in (("prompt", enhanced_prompt), ("width", width), ("height", height))
+             if name in template.slots}
+    slots.update(params)
+    return template, slots
+
+def build_generation_workflow(prompt, width, height, template=None, **params):
+    """A template rendered for a request (a new graph on every call; jobs keep theirs while queued)"""
+    template, slots = generation_slots(prompt, width, height, template, **params)
+    return template.render(**slots)
+
+def _emit_image(sid, user_id, prompt, image_data, elapsed, cached=False, image_format=SOCKETIO_IMAGE_FORMAT):
+    """Send a finished image to one SocketIO session"""
+    message = {
+        'status': 'complete',
+        'prompt': prompt,
+        'generation_time': elapsed,
+        'size_bytes': len(image_data),
+        'cached': cached,
+        'image_format': image_format,
+        'mime_type': 'image/png'
+    }
+    
+    if image_format == "binary" and len(image_data) > SOCKETIO_MAX_BINARY_BYTES:
+        image_format = message['image_format'] = "chunked"
+    
+    if image_format == "binary":
+        # Raw bytes go out as a SocketIO binary attachment (no base64 copy)
+        message['image'] = image_data
+    elif image_format == "chunked":
+        # Sequence-numbered binary frames; image_ready follows the last one
+        image_id = str(uuid.uuid4())
+        view = memoryview(image_data)
+        total_chunks = (len(image_data) + SOCKETIO_CHUNK_SIZE - 1) // SOCKETIO_CHUNK_SIZE
+        for seq in range(total_chunks):
+            socketio.emit('image_chunk', {
+                'image_id': image_id,
+                'seq': seq,
+                'total_chunks': total_chunks,
+                'data': bytes(view[seq * SOCKETIO_CHUNK_SIZE:(seq + 1) * SOCKETIO_CHUNK_SIZE])
             }, to=sid)
+        message['image_id'] = image_id
+        message['total_chunks'] = total_chunks
+    else:
+        # Option 1: Send as base64 (works without external hosting)
+        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        message['image_data'] = f'data:image/png;base64,{image_base64}'
+    
+    socketio.emit('image_ready', message, to=sid)
+    log(f"📤 Sent image to user {user_id[:8]}... via SocketIO ({image_format}{', cached' if cached else ''})")
+
+def _complete_job(job, image_info, elapsed):
+    """Deliver a finished image to the job's requester"""
+    params = job.params
+    job.result = image_info
+    if params["kind"] != "socketio":
+        return  # the REST handler streams the image itself
+    
+    image_data = get_image(image_info)
+    
+    log(f"✅ Image generated in {elapsed:.1f}s for user {job.user_id[:8]}...")
+    result_cache.put(params["cache_key"], image_data)
+    
+    # Send to every session of the user (they may have reconnected with a new one)
+    sids = sessions.sids(job.user_id)
+    for sid in sids:
+        _emit_image(sid, job.user_id, params["prompt"], image_data, elapsed, image_format=params["image_format"])
+    if not sids and sessions.hold(job.user_id, job.id):
+        log(f"⚠️ User {job.user_id[:8]}... disconnected before image was ready - holding it for their reconnect")
+    elif not sids:
+        log(f"⚠️ User {job.user_id[:8]}... disconnected before image was ready")
+
+def _fail_job(job, error_msg):
+    """Report a failed job to its requester"""
+    job.error = error_msg
+    log(f"❌ Error generating for user {(job.user_id or 'rest')[:8]}...: {error_msg}")
+    if job.params["kind"] != "socketio":
+        return
+    sids = sessions.sids(job.user_id)
+    for sid in sids:
+        _emit_generation_error(sid, job)
+    if not sids:
+        sessions.hold(job.user_id, job.id)
+
+def _emit_generation_error(sid, job):
+    socketio.emit('generation_error', {
+        'status': 'error',
+        'error': job.error,
+        'message': 'Failed to generate image',
+        'job_id': job.id
+    }, to=sid)
+
+def _deliver_held_results(user_id, sid):
+    """Send a reconnected session the results that finished while the user was away"""
+    for job_id in sessions.take_held(user_id):
+        job = job_store.get(job_id)
+        if job is None or job.cancelled:
+            continue
+        if job.error is not None:
+            _emit_generation_error(sid, job)
+            continue
+        image_data = result_cache.get(job.params["cache_key"])
+        if image_data is None:
+            log(f"⚠️ Held result of job {job_id[:8]}... is no longer cached")
+            continue
+        elapsed = job.finished - job.started if job.finished and job.started else 0.0
+        log(f"📬 Delivering held result of job {job_id[:8]}... to reconnected user {user_id[:8]}...")
+        _emit_image(sid, user_id, job.params["prompt"], image_data, elapsed, image_format=job.params["image_format"])
+
+def _emit_generation_progress(job, prompt_id, progress):
+    """Send a generation_progress update to a SocketIO job's sessions
+    
+    ``progress`` is a ProgressTracker snapshot, or None before the first
+    node starts. REST jobs keep the latest snapshot for GET /jobs/<id>.
+    """
+    message = {
+        'status': 'processing',
+        'message': 'Image is being generated...',
+        'prompt_id': prompt_id,
+        'job_id': job.id
+    }
+    if progress:
+        message.update(progress)
+        if progress['steps']:
+            message['message'] = f"Step {progress['step']}/{progress['steps']} ({progress['percent']:.0f}%)"
+        else:
+            message['message'] = f"Running {progress['node_type'] or 'node'}..."
+    job.progress = progress
+    sids = sessions.sids(job.user_id) if job.params["kind"] == "socketio" else ()
+    for sid in sids:
+        socketio.emit('generation_progress', message, to=sid)
+
+def cancel_job(job):
+    """Cancel a queued, fetching or running job
+    
+    Queued jobs simply leave the scheduler, as do jobs waiting for a model
+    download (the download goes on for other jobs and later use). A running
+    job's prompt is removed from ComfyUI's queue, or interrupted if it is
+    executing.
+    
+    Returns "queued", "fetching" or "running" (the state it was cancelled
+    in), or None if the job had already finished.
+    """
+    state = scheduler.cancel(job)
+    if state == "running":
+        prompt_id = job.params.get("prompt_id")
+        with running_prompts_lock:
+            backend = running_prompts.get(prompt_id)
+        if backend is not None:
+            _cancel_prompt(backend, prompt_id)
+    if state:
+        log(f"🛑 Job {job.id[:8]}... cancelled while {state}")
+    return state
+
+def _cancel_prompt(backend, prompt_id):
+    """Drop a prompt from its ComfyUI backend (dequeue or interrupt) and release its worker"""
+    try:
+        backend.client.delete_queued([prompt_id])
+        queue = backend.client.get_queue()
+        if any(item[1] == prompt_id for item in queue.get("queue_running", [])):
+            backend.client.interrupt(prompt_id)
+            log(f"🛑 Interrupted running prompt {prompt_id}")
+        else:
+            log(f"🛑 Removed prompt {prompt_id} from ComfyUI's queue")
+    except Exception as e:
+        log(f"⚠️  Failed to cancel prompt {prompt_id} on {backend.name}: {e}")
+    backend.events.cancel(prompt_id)
+
+def _relay_preview(job, tracker, prompt_id, preview):
+    """Hand one ComfyUI preview frame to the relay for the job's sessions"""
+    node = preview.get("node") or tracker.node
+    recipients = [(sid, job.id) for sid in sessions.sids(job.user_id)]
+    if recipients:
+        preview_relay.publish(recipients, preview["image"], preview["mime_type"], extra={
+            'prompt_id': prompt_id,
+            'node': node,
+            'step': tracker.step,
+            'steps': tracker.steps
+        })
+
+def _run_prompt(backend, job):
+    """Queue a job's prompt on a backend and wait for it
+    
+    The job's pre-encoded ``prompt_json`` is queued when it has one, instead
+    of encoding its workflow again. Progress and previews (if the SocketIO
+    client asked for them) are forwarded while it runs. Returns
+    (outcome, elapsed, load_seconds): outcome as described in
+    wait_for_outputs, and how long the model loader node ran (None if
+    ComfyUI had the model cached).
+    """
+    workflow = job.params["workflow"]
+    restarts = backend.restarts
+    result = queue_prompt(backend, job.params.get("prompt_json") or workflow)
+    if not result or "prompt_id" not in result:
+        raise Exception(f"Failed to queue prompt: {result}")
+    
+    prompt_id = result["prompt_id"]
+    log(f"✅ Queued prompt {prompt_id} on {backend.name} for job {job.id[:8]}...")
+    job.params["prompt_id"] = prompt_id
+    with running_prompts_lock:
+        running_prompts[prompt_id] = backend
+    if job.cancelled:
+        _cancel_prompt(backend, prompt_id)  # cancelled while the prompt was being queued
+    
+    # Send progress update, then forward the sampler's steps as they run
+    _emit_generation_progress(job, prompt_id, None)
+    tracker = ProgressTracker(
+        workflow,
+        emit=lambda progress: _emit_generation_progress(job, prompt_id, progress),
+        max_rate=PROGRESS_EVENTS_PER_SECOND,
+    )
+    previews = job.params["kind"] == "socketio" and job.params.get("previews")
+    loader = model_loader_node(workflow)
+    model_load = {}  # start/end of the loader node; ComfyUI skips it while the model is cached
+    
+    def on_event(msg_type, data):
+        if msg_type == "preview":
+            if previews:
+                _relay_preview(job, tracker, prompt_id, data)
+            return
+        if msg_type == "executing":
+            if data.get("node") == loader:
+                model_load["start"] = time.time()
+            elif "start" in model_load and "end" not in model_load:
+                model_load["end"] = time.time()
+        tracker(msg_type, data)
+    
+    backend.events.watch(prompt_id, on_event)
+    
+    # Wait for completion
+    start_time = time.time()
+    try:
+        outcome = wait_for_outputs(
+            backend,
+            prompt_id,
+            cancelled=lambda: job.cancelled,
+            lost=lambda: backend.restarts != restarts or not backend.healthy,
+        )
+    finally:
+        preview_relay.discard([job.id])
+        with running_prompts_lock:
+            running_prompts.pop(prompt_id, None)
+    load_seconds = model_load["end"] - model_load["start"] if "end" in model_load else None
+    return outcome, time.time() - start_time, load_seconds
+
+def run_generation_job(job):
+    """Scheduler runner: render one job as a ComfyUI prompt and deliver its image"""
+    params = job.params
+    if job.cancelled:
+        job.error = "cancelled"
+        return
+    
+    # An identical job may have finished while this one was queued (the
+    # request already counted its lookup, so only fetch the bytes on a hit)
+    if params["cache_key"] in result_cache:
+        if params["kind"] != "socketio":
+            job.result = {"cached": True}
+            return  # the REST handler serves it from the cache
+        image_data = result_cache.get(params["cache_key"])
+        if image_data is not None:
+            job.result = {"cached": True}
+            sids = sessions.sids(job.user_id)
+            for sid in sids:
+                _emit_image(sid, job.user_id, params["prompt"], image_data, 0.0, cached=True, image_format=params["image_format"])
+            if not sids:
+                sessions.hold(job.user_id, job.id)
+            return
+    
+    try:
+        workflow = params["workflow"]
         
-        # Wait for completion
-        start_time = time.time()
-        image_info = wait_for_completion(prompt_id)
-        elapsed = time.time() - start_time
+        # Queue on the best free backend and wait; if that ComfyUI crashes or
+        # stops answering meanwhile, the prompt is queued again on whichever
+        # healthy backend frees up first (possibly the restarted one)
+        model = workflow_model(workflow)
+        for attempt in range(MAX_PROMPT_REQUEUES + 1):
+            backend = comfy_pool.acquire(model, timeout=BACKEND_WAIT_TIMEOUT)
+            outcome = load_seconds = None
+            try:
+                outcome, elapsed, load_seconds = _run_prompt(backend, job)
+            finally:
+                comfy_pool.release(backend, model=model if outcome is not None else None,
+                                   lost=bool(outcome and "lost" in outcome), load_seconds=load_seconds)
+            if not outcome or "lost" not in outcome:
+                break
+            if attempt == MAX_PROMPT_REQUEUES:
+                raise Exception("ComfyUI backends failed repeatedly while generating")
+            log(f"🔁 Re-queuing job {job.id[:8]}... after losing backend {backend.name} (attempt {attempt + 2})")
         
-        if not image_info:
+        if job.cancelled or (outcome and "cancelled" in outcome):
+            job.error = "cancelled"
+            return
+        
+        if not outcome:
             raise Exception("Generation timeout or failed")
         
         # Check if ComfyUI returned an error
-        if "error" in image_info:
-            error_details = image_info.get("error", {})
-            error_msg = "ComfyUI execution failed"
-            
-            # Try to extract useful error message
-            if "messages" in error_details:
-                for msg in error_details.get("messages", []):
-                    if isinstance(msg, list) and len(msg) > 1:
-                        if msg[0] == "execution_error":
-                            error_data = msg[1]
-                            exception_msg = error_data.get("exception_message", "Unknown error")
-                            node_type = error_data.get("node_type", "Unknown")
-                            error_msg = f"ComfyUI error in {node_type}: {exception_msg}"
-                            break
-            
+        if "error" in outcome:
+            error_msg = comfyui_error_message(outcome.get("error", {}))
             log(f"❌ ComfyUI execution error: {error_msg}")
             raise Exception(error_msg)
         
-        # Check if we have a filename (successful generation)
-        if "filename" not in image_info:
-            log(f"❌ No filename in image_info. Got: {image_info}")
-            raise Exception("Image generation failed - no filename returned")
-        
-        # Get the image
-        image_data = get_image(
-            image_info["filename"],
-            image_info.get("subfolder", ""),
-            image_info.get("type", "output")
-        )
-        
-        log(f"✅ Image generated in {elapsed:.1f}s for user {user_id[:8]}...")
-        
-        # Option 1: Send as base64 (works without external hosting)
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
-        
-        # Send to specific user
-        if sid:
-            socketio.emit('image_ready', {
-                'status': 'complete',
-                'image_data': f'data:image/png;base64,{image_base64}',
-                'prompt': prompt,
-                'generation_time': elapsed,
-                'size_bytes': len(image_data)
-            }, to=sid)
-            log(f"📤 Sent image to user {user_id[:8]}... via SocketIO")
-        else:
-            log(f"⚠️ User {user_id[:8]}... disconnected before image was ready")
-            
+        node_id = image_output_node(workflow)
+        images = outcome["outputs"].get(node_id)
+        if not images or "filename" not in images[0]:
+            log(f"❌ No image for job {job.id[:8]}... (node {node_id}). Got: {outcome['outputs']}")
+            _fail_job(job, "Image generation failed - no filename returned")
+            return
+        _complete_job(job, dict(images[0], backend=backend.name), elapsed)
     except Exception as e:
         import traceback
-        error_trace = traceback.format_exc()
-        log(f"❌ Error generating for user {user_id[:8]}...: {e}")
-        log(error_trace)
-        
-        # Send error to user
-        sid = connected_users.get(user_id)
-        if sid:
-            socketio.emit('generation_error', {
-                'status': 'error',
-                'error': str(e),
-                'message': 'Failed to generate image'
-            }, to=sid)
+        log(traceback.format_exc())
+        if job.error is None and job.result is None:
+            _fail_job(job, str(e))
 
 # ============================================
 # REST API Routes
 # ============================================
 
 @app.route('/health', methods=['GET'])
+@app.route('/health/ready', methods=['GET'])
 def health():
-    """Health check endpoint"""
-    try:
-        response = requests.get(f"http://localhost:{PORT}/system_stats")
-        if response.status_code == 200:
-            return jsonify({"status": "healthy", "comfyui": "running"})
-    except:
-        pass
+    """Readiness: 200 once ComfyUI is up and warmed up, 503 before that (or with no healthy backend)"""
+    comfyui_running = bool(comfy_pool.healthy())
+    
+    if not startup["ready"]:
+        return jsonify({"status": startup["phase"], "ready": False,
+                        "comfyui": "running" if comfyui_running else "not running",
+                        "cold_start": startup["cold_start"]}), 503
+    if not comfyui_running:
+        return jsonify({"status": "unhealthy", "ready": False, "comfyui": "not running",
+                        "backends": comfy_pool.stats()}), 503
+    return jsonify({"status": "healthy", "ready": True, "comfyui": "running", "queue": scheduler.stats(),
+                    "jobs": job_store.stats(), "cache": result_cache.stats(),
+                    "previews": preview_relay.stats(), "sessions": sessions.stats(), "cold_start": startup["cold_start"],
+                    "model_fetch": model_fetcher.stats() if model_fetcher else None,
+                    "backends": comfy_pool.stats()})
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """Liveness: 200 while the API process works (also during warm-up), 503 if startup failed"""
+    status = 503 if startup["phase"] == "failed" else 200
+    return jsonify({"status": "failed" if status == 503 else "alive", "phase": startup["phase"],
+                    "uptime": round(time.time() - startup["started"], 1)}), status
+
+def _cached_image_response(cache_key):
+    """Response for a cached image (304 if the client already has it), or None"""
+    image_data, image_path = result_cache.lookup(cache_key)
+    if image_data is None and image_path is None:
+        return None
+    etag = f'"{cache_key}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        return Response(status=304, headers={"ETag": etag, "X-Cache": "HIT"})
+    if image_path is not None:
+        response = send_file(image_path, mimetype="image/png", etag=False)
+    else:
+        response = send_file(BytesIO(image_data), mimetype="image/png", etag=False)
+    response.headers["ETag"] = etag
+    response.headers["X-Cache"] = "HIT"
+    return response
+
+def _stream_image_response(image_info, cache_key):
+    """Proxy ComfyUI's /view response to the client chunk by chunk
+    
+    Nothing is buffered in full or written to /tmp; the chunks are teed into
+    the result cache's disk tier as they pass through.
+    """
+    upstream = comfy_pool.get(image_info["backend"]).client.open_image(
+        image_info["filename"],
+        image_info.get("subfolder", ""),
+        image_info.get("type", "output")
+    )
+    headers = {"ETag": f'"{cache_key}"', "X-Cache": "MISS"}
+    if "Content-Length" in upstream.headers:
+        headers["Content-Length"] = upstream.headers["Content-Length"]
+        log(f"   Size: {int(headers['Content-Length']):,} bytes")
     
-    return jsonify({"status": "unhealthy", "comfyui": "not running"}), 503
+    def body():
+        try:
+            yield from result_cache.put_stream(cache_key, upstream.iter_content(STREAM_CHUNK_SIZE))
+        finally:
+            upstream.close()
+    
+    return Response(body(), mimetype="image/png", headers=headers, direct_passthrough=True)
+
+def _build_rest_job(data):
+    """(job, models to fetch) for a REST request body (prompt, template or custom workflow, user_id, priority)
+    
+    REST clients without a user_id share fair-share slots by client address.
+    Raises ValueError for an unknown priority or template and for an invalid
+    custom workflow, MissingModelError if the workflow loads a model that
+    is not on disk and cannot be fetched.
+    """
+    prompt = data.get("prompt", "a beautiful landscape")
+    priority = data.get("priority", DEFAULT_PRIORITY)
+    if priority not in PRIORITY_TIERS:
+        raise ValueError(f"Unknown priority '{priority}' (expected one of {', '.join(PRIORITY_TIERS)})")
+    custom_workflow = "workflow" in data
+    if custom_workflow:
+        workflow = data["workflow"]
+        if conditioning_cache_enabled:
+            validate_workflow(workflow)
+            workflow = cached_text_encoders(workflow)
+        template = WorkflowTemplate("custom", workflow)
+    else:
+        template = get_template(data.get("template"))
+    
+    log(f"📝 Prompt: '{prompt}' (template: {template.name})")
+    
+    # Inject the prompt into the graph's positive prompt encoder
+    slots = {"prompt": prompt} if "prompt" in template.slots else {}
+    workflow = template.render(**slots)
+    prompt_json = template.encode(**slots)
+    if slots:
+        log("✅ Prompt injected into workflow")
+    fetch_models = check_models(workflow)
+    
+    job = Job(
+        user_id=data.get("user_id") or f"rest:{request.remote_addr}",
+        priority=priority,
+        affinity=workflow_model(workflow),
+        kind="rest",
+        workflow=workflow,
+        prompt_json=prompt_json,
+        cache_key=workflow_key(prompt_json),
+        prompt=prompt,
+    )
+    return job, fetch_models
+
+def _job_image_response(job):
+    """Response for a finished REST job: its image, or the error it failed with"""
+    if job.cancelled:
+        return jsonify({"error": "cancelled", "job_id": job.id}), 410
+    if job.error is not None:
+        log(f"❌ Generation failed: {job.error}")
+        return jsonify({"error": job.error, "job_id": job.id}), 500
+    
+    cache_key = job.params["cache_key"]
+    image_info = job.result
+    if image_info.get("cached") or cache_key in result_cache:
+        cached = _cached_image_response(cache_key)
+        if cached is not None:
+            return cached
+        if image_info.get("cached"):
+            return jsonify({"error": "Cached image disappeared, please retry"}), 500
+    
+    # Stream the image from ComfyUI straight to the client
+    log(f"📤 Streaming generated image to client...")
+    log(f"   Filename: {image_info.get('filename', 'unknown')}")
+    log(f"   Subfolder: {image_info.get('subfolder', 'none')}")
+    log(f"   Type: {image_info.get('type', 'output')}")
+    
+    try:
+        return _stream_image_response(image_info, cache_key)
+    except Exception as e:
+        log(f"❌ Failed to get image: {e}")
+        return jsonify({"error": f"Failed to get image: {str(e)}"}), 500
+
+def _queue_full_response(error):
+    """503 when the server queue is full (or ComfyUI failed to start), 429 when only this user's share is"""
+    if isinstance(error, SchedulerClosed):
+        return jsonify({"error": "unavailable", "message": str(error)}), 503
+    if isinstance(error, UserQueueFull):
+        return jsonify({"error": "user_queue_full", "message": str(error), "max_user_queue": MAX_USER_QUEUE}), 429
+    return jsonify({"error": "queue_full", "message": "Server is busy, please try again in a few minutes"}), 503
+
+def _job_status(job):
+    """JSON-ready status of a REST job"""
+    status = {
+        "job_id": job.id,
+        "status": job.state,
+        "priority": job.priority,
+        "submitted": job.submitted,
+        "started": job.started,
+        "finished": job.finished,
+    }
+    if job.state == "queued":
+        status["queue_position"] = job.position
+    elif job.state == "fetching":
+        status["fetching"] = [fetch.snapshot() for fetch in job.params.get("fetches", ())]
+    elif job.state == "running" and job.progress:
+        status["progress"] = job.progress
+    if job.finished is not None:
+        status["generation_time"] = round(job.finished - job.submitted, 3)
+    if job.error is not None:
+        status["error"] = job.error
+    elif job.done.is_set():
+        status["cached"] = bool(job.result.get("cached"))
+        status["image_url"] = f"/jobs/{job.id}/image"
+    return status
 
 @app.route('/generate', methods=['POST'])
 def generate():
-    """Generate image from prompt"""
+    """Generate image from prompt (blocks until the image is ready)
+    
+    Compatibility wrapper around the job API: new clients should POST /jobs
+    and poll GET /jobs/<id> instead of holding a connection for minutes.
+    """
     log("\n" + "="*60)
     log("🎨 NEW IMAGE GENERATION REQUEST")
     log("="*60)
@@ -545,79 +1629,51 @@ def generate():
         data = request.json
         log(f"   Request data: {data}")
         
-        prompt = data.get("prompt", "a beautiful landscape")
-        workflow = data.get("workflow", DEFAULT_WORKFLOW.copy())
-        
-        log(f"📝 Prompt: '{prompt}'")
-        
-        # Update prompt in workflow
-        if "6" in workflow:
-            workflow["6"]["inputs"]["text"] = prompt
-            log("✅ Prompt injected into workflow")
-        
-        # Queue the prompt
-        log("📤 Queuing prompt to ComfyUI...")
-        log(f"   ComfyUI URL: http://localhost:{PORT}/prompt")
-        
         try:
-            result = queue_prompt(workflow)
-            log(f"📥 Queue result: {result}")
-        except Exception as e:
-            log(f"❌ Failed to queue prompt: {e}")
-            return jsonify({"error": f"Failed to queue: {str(e)}"}), 500
+            job, fetch_models = _build_rest_job(data)
+        except MissingModelError as e:
+            log(f"🚫 Rejecting request: {e}")
+            return jsonify({"error": "missing_models", "message": str(e), "problems": e.problems}), 400
+        except ValueError as e:
+            return jsonify({"error": "invalid_request", "message": str(e)}), 400
         
-        if not result or "prompt_id" not in result:
-            log(f"❌ Invalid queue result: {result}")
-            return jsonify({"error": "Failed to queue prompt", "details": str(result)}), 500
+        # Identical workflow already rendered? Return it immediately
+        cached = _cached_image_response(job.params["cache_key"])
+        if cached is not None:
+            log(f"⚡ Result cache hit ({job.params['cache_key'][:12]})")
+            log("="*60 + "\n")
+            return cached
         
-        prompt_id = result["prompt_id"]
-        log(f"✅ Prompt queued successfully!")
-        log(f"   Prompt ID: {prompt_id}")
+        try:
+            position = schedule_job(job, fetch_models)
+        except QueueFull as e:
+            log(f"🚫 Rejecting request: {e}")
+            return _queue_full_response(e)
         
         # Wait for completion
-        log("⏳ Waiting for generation to complete...")
+        if position is None:
+            log(f"⏳ Job {job.id[:8]}... waiting for its models to download, then for generation to complete...")
+        else:
+            log(f"⏳ Job {job.id[:8]}... queued at position {position}, waiting for generation to complete...")
         log("   (This may take 1-5 minutes for FLUX models)")
         
-        start_time = time.time()
-        image_info = wait_for_completion(prompt_id)
-        elapsed = time.time() - start_time
+        if not job.done.wait(GENERATE_WAIT_TIMEOUT):
+            # Still queued or running: hand the client the job to poll instead
+            job_store.add(job)
+            log(f"⌛ Job {job.id[:8]}... not done after {GENERATE_WAIT_TIMEOUT}s - answering 504, poll /jobs/{job.id}")
+            log("="*60 + "\n")
+            return jsonify({"error": "timeout", "job_id": job.id, "status_url": f"/jobs/{job.id}"}), 504
+        elapsed = job.finished - job.submitted
         
         log(f"⏱️  Generation took {elapsed:.1f} seconds")
-        log(f"📊 Image info: {image_info}")
-        
-        if not image_info:
-            log("❌ Generation timeout or failed!")
-            return jsonify({"error": "Generation timeout"}), 500
-        
-        # Get the image
-        log(f"📥 Downloading generated image...")
-        log(f"   Filename: {image_info.get('filename', 'unknown')}")
-        log(f"   Subfolder: {image_info.get('subfolder', 'none')}")
-        log(f"   Type: {image_info.get('type', 'output')}")
+        log(f"📊 Image info: {job.result}")
         
-        try:
-            image_data = get_image(
-                image_info["filename"],
-                image_info.get("subfolder", ""),
-                image_info.get("type", "output")
-            )
-            log(f"✅ Image downloaded successfully!")
-            log(f"   Size: {len(image_data):,} bytes ({len(image_data)/1024/1024:.2f} MB)")
-        except Exception as e:
-            log(f"❌ Failed to download image: {e}")
-            return jsonify({"error": f"Failed to get image: {str(e)}"}), 500
-        
-        # Save temporarily and send
-        temp_path = f"/tmp/{uuid.uuid4()}.png"
-        with open(temp_path, "wb") as f:
-            f.write(image_data)
-        
-        log(f"💾 Image saved to: {temp_path}")
-        log("📤 Sending image to client...")
-        log("✅ IMAGE GENERATION COMPLETE!")
+        response = _job_image_response(job)
+        if job.error is None:
+            log("✅ IMAGE GENERATION COMPLETE!")
         log("="*60 + "\n")
         
-        return send_file(temp_path, mimetype="image/png")
+        return response
         
     except Exception as e:
         import traceback
@@ -631,16 +1687,137 @@ def generate():
         log("="*60 + "\n")
         return jsonify({"error": str(e), "traceback": error_trace}), 500
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a generation and return its job id immediately (202)"""
+    try:
+        data = request.json or {}
+        try:
+            job, fetch_models = _build_rest_job(data)
+        except MissingModelError as e:
+            log(f"🚫 Rejecting request: {e}")
+            return jsonify({"error": "missing_models", "message": str(e), "problems": e.problems}), 400
+        except ValueError as e:
+            return jsonify({"error": "invalid_request", "message": str(e)}), 400
+        
+        if job.params["cache_key"] in result_cache:
+            # Already rendered: the job is born finished
+            job.result = {"cached": True}
+            job.state = "done"
+            job.started = job.finished = job.submitted
+            job.done.set()
+            log(f"⚡ Result cache hit for job {job.id[:8]}... ({job.params['cache_key'][:12]})")
+        else:
+            try:
+                position = schedule_job(job, fetch_models)
+            except QueueFull as e:
+                log(f"🚫 Rejecting job: {e}")
+                return _queue_full_response(e)
+            if position is not None:
+                log(f"📥 Job {job.id[:8]}... queued at position {position}")
+        job_store.add(job)
+        
+        status = _job_status(job)
+        status["status_url"] = f"/jobs/{job.id}"
+        return jsonify(status), 202, {"Location": f"/jobs/{job.id}"}
+    except Exception as e:
+        log(f"❌ Error in POST /jobs: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job status; ?wait=N long-polls up to N seconds for the job to finish"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "not_found", "message": "Unknown or expired job id"}), 404
+    try:
+        wait = min(max(float(request.args.get("wait", 0)), 0), JOB_LONG_POLL_MAX)
+    except ValueError:
+        return jsonify({"error": "invalid_wait", "message": "wait must be a number of seconds"}), 400
+    if wait:
+        job_store.wait(job, wait)
+    return jsonify(_job_status(job))
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """Cancel a job: dequeue it, or interrupt its prompt on ComfyUI"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "not_found", "message": "Unknown or expired job id"}), 404
+    state = cancel_job(job)
+    if state is None:
+        return jsonify(dict(_job_status(job), error="already_finished")), 409
+    return jsonify(dict(_job_status(job), status="cancelled", was=state))
+
+@app.route('/jobs/<job_id>/image', methods=['GET'])
+def job_image(job_id):
+    """The finished job's image (409 while it is still queued or running)"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "not_found", "message": "Unknown or expired job id"}), 404
+    if not job.done.is_set():
+        return jsonify(dict(_job_status(job), error="not_ready")), 409
+    return _job_image_response(job)
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Result cache hit/miss counters and tier sizes"""
+    return jsonify(result_cache.stats())
+
+@app.route('/cache/conditioning', methods=['GET'])
+def conditioning_cache_stats():
+    """Conditioning cache counters per backend and in total (hit ratio, encode time saved)"""
+    if not conditioning_cache_enabled:
+        return jsonify({"enabled": False})
+    backends = {}
+    for backend in comfy_pool.backends:
+        try:
+            backends[backend.name] = backend.client.conditioning_cache_stats()
+        except Exception as e:
+            backends[backend.name] = {"error": str(e)}
+    counted = [stats for stats in backends.values() if "error" not in stats]
+    hits = sum(stats["memory_hits"] + stats["disk_hits"] for stats in counted)
+    lookups = hits + sum(stats["misses"] for stats in counted)
+    seconds_saved = sum(stats["seconds_saved"] for stats in counted)
+    jobs = sum(backend.completed for backend in comfy_pool.backends)
+    return jsonify({
+        "enabled": True,
+        "hits": hits,
+        "misses": lookups - hits,
+        "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+        "seconds_saved": round(seconds_saved, 3),
+        "seconds_saved_per_prompt": round(seconds_saved / jobs, 3) if jobs else 0.0,
+        "backends": backends,
+    })
+
+@app.route('/debug/comfyui-log', methods=['GET'])
+def comfyui_log():
+    """Last ?lines=N (default 200) lines of a local ComfyUI's output (?backend=name), as plain text"""
+    try:
+        lines = max(1, int(request.args.get("lines", 200)))
+    except ValueError:
+        return jsonify({"error": "invalid_lines", "message": "lines must be an integer"}), 400
+    name = request.args.get("backend")
+    local = [backend for backend in comfy_pool.backends if backend.supervisor]
+    backend = next((backend for backend in local if name in (None, backend.name)), None)
+    if backend is None:
+        return jsonify({"error": "not_found", "message": "No local ComfyUI backend by that name",
+                        "backends": [backend.name for backend in local]}), 404
+    return Response("\n".join(backend.supervisor.tail(lines)) + "\n", mimetype="text/plain")
+
 @app.route('/list-models', methods=['GET'])
 def list_models():
-    """List available models"""
+    """List available models, and which manifest models are present"""
     models_dir = Path(COMFYUI_DIR) / "models" / "checkpoints"
     models = []
     
     if models_dir.exists():
         models = [f.name for f in models_dir.iterdir() if f.suffix in ['.safetensors', '.ckpt', '.pt']]
     
-    return jsonify({"models": models})
+    inventory = model_inventory or ModelInventory(Path(COMFYUI_DIR) / "models")
+    manifest = [dict(entry.to_dict(), bundles=list(entry.bundles), present=inventory.has(entry.category, entry.name))
+                for entry in (model_manifest.entries if model_manifest else ())]
+    return jsonify({"models": models, "manifest": manifest})
 
 def get_notebook_url():
     """Get the public URL of the Modal notebook"""
@@ -661,24 +1838,26 @@ def main():
             log(f"   ✅ '{event}' handler registered")
     log("")
     
-    # Start ComfyUI
-    if not start_comfyui():
-        log("❌ Failed to start ComfyUI. Exiting...")
-        return
+    # Start ComfyUI, warm it up and start the workers in the background;
+    # /health reports ready once that has finished
+    socketio.start_background_task(bring_up)
     
     # Get public URL (you may need to set this manually in Modal)
     url = get_notebook_url()
     
-    # Send Discord notification
-    send_discord_notification(url)
-    
     log("\n" + "=" * 60)
-    log("✅ API Server Started!")
+    log("✅ API Server Started! (ComfyUI warming up - watch /health)")
     log("=" * 60)
     log(f"\n📡 Endpoints:")
-    log(f"   POST {url}/generate      - Generate images")
-    log(f"   GET  {url}/health        - Health check")
+    log(f"   POST {url}/generate      - Generate images (blocking)")
+    log(f"   POST {url}/jobs          - Queue a generation, returns a job id")
+    log(f"   GET  {url}/jobs/<id>     - Job status (?wait=N to long-poll)")
+    log(f"   GET  {url}/jobs/<id>/image - Finished job's image")
+    log(f"   DELETE {url}/jobs/<id>   - Cancel a job")
+    log(f"   GET  {url}/health        - Readiness (503 until warmed up)")
+    log(f"   GET  {url}/health/live   - Liveness")
     log(f"   GET  {url}/list-models   - List models")
+    log(f"   GET  {url}/debug/comfyui-log - Recent ComfyUI output")
     log("\n🎯 Example:")
     log(f"   curl -X POST {url}/generate \\")
     log(f"     -H 'Content-Type: application/json' \\")
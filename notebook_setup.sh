@@ -19,7 +19,7 @@ echo "✅ ComfyUI directory found"
 # Step 2: Install dependencies
 echo ""
 echo "📦 Step 2: Installing Python dependencies..."
-pip install flask requests pyngrok -q
+pip install flask requests websocket-client pyngrok -q
 echo "✅ Dependencies installed"
 
 # Step 3: Check for models
@@ -57,13 +57,23 @@ echo "✅ Project directory: $PROJECT_DIR"
 # Step 5: Check if files exist
 echo ""
 echo "📝 Step 5: Checking project files..."
-if [ ! -f "notebook_comfyui_api.py" ]; then
-    echo "⚠️  notebook_comfyui_api.py not found in $PROJECT_DIR"
-    echo "   Please upload the project files to this directory."
+# The server imports these modules and files from its own directory
+REQUIRED_FILES="notebook_comfyui_api.py comfyui_client.py comfyui_backends.py comfyui_supervisor.py
+    comfyui_conditioning_cache.py job_scheduler.py job_store.py model_downloader.py model_fetcher.py
+    model_manifest.py model_store.py models_manifest.json preview_relay.py progress_tracker.py
+    result_cache.py session_registry.py workflow_templates.py"
+MISSING_FILES=""
+for f in $REQUIRED_FILES; do
+    [ -f "$f" ] || MISSING_FILES="$MISSING_FILES $f"
+done
+if [ -n "$MISSING_FILES" ]; then
+    echo "⚠️  Project files missing from $PROJECT_DIR:"
+    for f in $MISSING_FILES; do
+        echo "   - $f"
+    done
     echo ""
-    echo "   Files needed:"
-    echo "   - notebook_comfyui_api.py"
-    echo "   - config.json (optional)"
+    echo "   Upload the whole project directory (all .py files, models_manifest.json,"
+    echo "   workflows/ and config.json) to $PROJECT_DIR."
     echo ""
     exit 1
 fi
@@ -78,7 +88,14 @@ else
     echo "⚠️  config.json not found (Discord notifications disabled)"
 fi
 
-# Step 7: Ready to start
+# Step 7: Shared model store
+if [ -n "$MODEL_STORE" ]; then
+    echo ""
+    echo "🔗 Step 7: Linking models from the shared store $MODEL_STORE..."
+    python model_store.py --store "$MODEL_STORE" add /root/ComfyUI/models/*/*.safetensors
+fi
+
+# Step 8: Ready to start
 echo ""
 echo "╔════════════════════════════════════════════════════════╗"
 echo "║  ✅ Setup Complete!                                    ║"
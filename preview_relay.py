@@ -0,0 +1,209 @@
+"""
+Live latent previews relayed from ComfyUI to SocketIO sessions
+ComfyUI (started with --preview-method) sends a small preview image over
+its websocket after every sampler step. The relay downscales each frame
+once, re-encodes it as JPEG/WebP and sends it to the sessions that asked
+for it.
+
+Delivery is latest-frame-wins: a session gets at most ``max_rate`` frames
+per second and at most one unacknowledged frame. While a frame is in
+flight newer frames replace each other in a single pending slot, so a
+slow client costs one frame of memory, never a growing emit buffer. The
+pending frame goes out when the in-flight one is acknowledged, but not
+before ``1 / max_rate`` seconds after the previous send. Frames carry a
+``seq`` number and only the ack of the frame in flight releases the next
+one. A frame that is not acknowledged within ``ack_timeout`` is written
+off.
+
+Usage:
+    relay = PreviewRelay(send=lambda sid, message, on_ack: ..., max_rate=1)
+    relay.publish([(sid, job_id)], image_bytes, "image/jpeg", extra={"step": 3})
+    relay.forget(sid)   # on disconnect
+"""
+
+import threading
+import time
+from io import BytesIO
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class _Session:
+    """Delivery state of one SocketIO session"""
+
+    __slots__ = ("last_sent", "in_flight_since", "in_flight_seq", "seq", "pending", "timer")
+
+    def __init__(self):
+        self.last_sent = 0.0
+        self.in_flight_since = None
+        self.in_flight_seq = None
+        self.seq = 0            # frames sent to this session
+        self.pending = None     # newest (job_id, message) waiting for an ack
+        self.timer = None       # sends the pending frame once the rate allows
+
+
+class PreviewRelay:
+    """Rate-limited, drop-not-queue preview delivery
+
+    ``send(sid, message, on_ack)`` must emit the message to one session and
+    call ``on_ack()`` when the client acknowledges it.
+    """
+
+    def __init__(self, send, max_rate=1.0, max_size=384, image_format="jpeg", quality=70, ack_timeout=5.0):
+        self.send = send
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.max_size = max_size
+        self.image_format = image_format
+        self.quality = quality
+        self.ack_timeout = ack_timeout
+        self.sent = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    @property
+    def can_resize(self):
+        """True if Pillow is installed (frames are relayed unscaled otherwise)"""
+        return Image is not None
+
+    def publish(self, recipients, image, mime_type, extra=None):
+        """Offer one preview frame to ``recipients`` [(sid, job_id), ...]
+
+        The frame is only transcoded if at least one session can take it.
+        """
+        now = time.time()
+        with self._lock:
+            ready = []
+            for sid, job_id in recipients:
+                session = self._sessions.setdefault(sid, _Session())
+                in_flight = session.in_flight_since is not None and now - session.in_flight_since < self.ack_timeout
+                if in_flight or session.timer is not None:
+                    ready.append((sid, job_id, session, False))
+                elif now - session.last_sent >= self.min_interval:
+                    ready.append((sid, job_id, session, True))
+                else:
+                    self.dropped += 1
+        if not ready:
+            return
+
+        image, mime_type = self._transcode(image, mime_type)
+        base = dict(extra or {}, mime_type=mime_type, size_bytes=len(image), image=image)
+        to_send = []
+        with self._lock:
+            for sid, job_id, session, send_now in ready:
+                message = dict(base, job_id=job_id)
+                if send_now:
+                    to_send.append((sid, self._start(session, message, now)))
+                else:
+                    if session.pending is not None:
+                        self.dropped += 1
+                    session.pending = (job_id, message)
+        for sid, message in to_send:
+            self._send(sid, message)
+
+    def discard(self, job_ids):
+        """Drop pending frames of jobs that have finished"""
+        job_ids = set(job_ids)
+        with self._lock:
+            for session in self._sessions.values():
+                if session.pending is not None and session.pending[0] in job_ids:
+                    session.pending = None
+                    self.dropped += 1
+
+    def forget(self, sid):
+        """Drop all state for a disconnected session"""
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+            if session is not None and session.timer is not None:
+                session.timer.cancel()
+
+    def stats(self):
+        with self._lock:
+            return {"sent": self.sent, "dropped": self.dropped, "sessions": len(self._sessions),
+                    "resize": self.can_resize}
+
+    # ------------------------------------------------------------------
+    # internals
+    # ------------------------------------------------------------------
+
+    def _start(self, session, message, now):
+        """Mark a frame as sent and in flight; returns it tagged with its seq (lock held)
+
+        An older pending frame is dropped, so it can never follow this one.
+        """
+        if session.pending is not None:
+            session.pending = None
+            self.dropped += 1
+        session.seq += 1
+        session.in_flight_seq = session.seq
+        session.in_flight_since = session.last_sent = now
+        return dict(message, seq=session.seq)
+
+    def _send(self, sid, message):
+        with self._lock:
+            self.sent += 1
+        seq = message["seq"]
+        try:
+            self.send(sid, message, lambda *args: self._acked(sid, seq))
+        except Exception as e:
+            log(f"⚠️  Preview send to {sid} failed: {e}")
+            self._acked(sid, seq)
+
+    def _acked(self, sid, seq):
+        """Client took frame ``seq``: send the newest pending one once the rate allows
+
+        A late ack for an older frame is ignored.
+        """
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is None or session.in_flight_seq != seq:
+                return
+            session.in_flight_since = session.in_flight_seq = None
+            if session.pending is None or session.timer is not None:
+                return
+            delay = session.last_sent + self.min_interval - time.time()
+            if delay > 0:
+                session.timer = threading.Timer(delay, self._send_pending, args=(sid,))
+                session.timer.daemon = True
+                session.timer.start()
+                return
+        self._send_pending(sid)
+
+    def _send_pending(self, sid):
+        """Send a session's pending frame unless another is in flight"""
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is None:
+                return
+            session.timer = None
+            if session.pending is None or session.in_flight_seq is not None:
+                return
+            _, message = session.pending
+            session.pending = None
+            message = self._start(session, message, time.time())
+        self._send(sid, message)
+
+    def _transcode(self, image, mime_type):
+        """Downscale to max_size and re-encode; unchanged if Pillow is missing or fails"""
+        if Image is None:
+            return image, mime_type
+        try:
+            with Image.open(BytesIO(image)) as frame:
+                frame = frame.convert("RGB")
+                frame.thumbnail((self.max_size, self.max_size))
+                out = BytesIO()
+                frame.save(out, format=self.image_format.upper(), quality=self.quality)
+            return out.getvalue(), MIME_TYPES.get(self.image_format, f"image/{self.image_format}")
+        except Exception:
+            return image, mime_type
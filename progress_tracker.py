@@ -0,0 +1,107 @@
+"""
+Per-step generation progress from ComfyUI's execution events
+ComfyUI reports the node it is executing and, for samplers, a progress
+message per step. A ProgressTracker turns those into percent complete,
+current node and an ETA derived from the observed step times, and hands
+them to a callback at most ``max_rate`` times per second.
+
+Usage:
+    tracker = ProgressTracker(workflow, emit=send_update, max_rate=2)
+    comfy_events.watch(prompt_id, tracker)
+"""
+
+import time
+
+SAMPLER_NODES = ("KSampler", "KSamplerAdvanced", "SamplerCustom", "SamplerCustomAdvanced")
+
+
+class ProgressTracker:
+    """Throttled progress reports for one queued prompt
+
+    Called as ``tracker(msg_type, data)`` with ComfyUI ``executing`` and
+    ``progress`` messages. Updates are dropped, not queued, while the rate
+    limit applies; the last step of a sampler is always reported.
+    """
+
+    STEP_TIME_SMOOTHING = 0.3  # Weight of the newest step in the moving average
+
+    def __init__(self, workflow, emit, max_rate=2.0):
+        self.workflow = workflow
+        self.emit = emit
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.samplers = [node_id for node_id, node in workflow.items()
+                         if node.get("class_type") in SAMPLER_NODES]
+        self.samplers_done = set()
+        self.started = time.time()
+        self.node = None
+        self.step = 0
+        self.steps = 0
+        self.step_time = None
+        self.emitted = 0
+        self.dropped = 0
+        self._last_step_at = None
+        self._last_emit = 0.0
+
+    def __call__(self, msg_type, data):
+        now = time.time()
+        force = False
+        if msg_type == "executing":
+            node = data.get("node")
+            if node is None or node == self.node:
+                return
+            if self.node in self.samplers:
+                self.samplers_done.add(self.node)
+            self.node = node
+            self.step = self.steps = 0
+            self._last_step_at = now
+        elif msg_type == "progress":
+            value, maximum = int(data.get("value", 0)), int(data.get("max", 0))
+            node = data.get("node")
+            if node and node != self.node:
+                self.node = node
+                self._last_step_at = now
+            if value > self.step and self._last_step_at is not None:
+                per_step = (now - self._last_step_at) / (value - self.step)
+                if self.step_time is None:
+                    self.step_time = per_step
+                else:
+                    self.step_time += self.STEP_TIME_SMOOTHING * (per_step - self.step_time)
+            self.step, self.steps = value, maximum
+            self._last_step_at = now
+            force = maximum > 0 and value >= maximum
+        else:
+            return
+
+        if not force and now - self._last_emit < self.min_interval:
+            self.dropped += 1
+            return
+        self._last_emit = now
+        self.emitted += 1
+        self.emit(self.snapshot(now))
+
+    def snapshot(self, now=None):
+        """Current progress as a JSON-ready dict"""
+        now = now or time.time()
+        total = len(self.samplers) or 1
+        fraction = self.step / self.steps if self.steps else 0.0
+        node = self.workflow.get(self.node) or {}
+        return {
+            "percent": round(min(100.0, 100.0 * (len(self.samplers_done) + fraction) / total), 1),
+            "step": self.step,
+            "steps": self.steps,
+            "node": self.node,
+            "node_type": node.get("class_type"),
+            "elapsed": round(now - self.started, 1),
+            "eta_seconds": self._eta(),
+        }
+
+    def _eta(self):
+        """Seconds left for the remaining sampler steps, or None before the first step"""
+        if self.step_time is None:
+            return None
+        remaining = max(self.steps - self.step, 0)
+        for node_id in self.samplers:
+            if node_id != self.node and node_id not in self.samplers_done:
+                steps = self.workflow[node_id].get("inputs", {}).get("steps")
+                remaining += steps if isinstance(steps, int) else 0
+        return round(remaining * self.step_time, 1)
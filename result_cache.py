@@ -0,0 +1,247 @@
+"""
+Content-addressed cache of generated images
+ComfyUI is deterministic for a given workflow graph (fixed seed), so the
+canonical hash of the final graph identifies the image it will produce.
+Results live in an in-memory LRU tier with a byte budget, backed by an
+on-disk tier with size-based LRU eviction.
+
+Usage:
+    cache = ResultCache(memory_bytes=256 << 20, disk_dir="result_cache", disk_bytes=4 << 30)
+    key = workflow_key(workflow)
+    image = cache.get(key)
+    if image is None:
+        image = ...generate...
+        cache.put(key, image)
+"""
+
+import collections
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+def canonical_json(workflow):
+    """Stable JSON encoding of a workflow graph (sorted keys, no whitespace)"""
+    return json.dumps(workflow, sort_keys=True, separators=(",", ":"))
+
+
+def workflow_key(workflow):
+    """SHA-256 of the canonical workflow graph (a dict, or its canonical JSON bytes)"""
+    if isinstance(workflow, bytes):
+        return hashlib.sha256(workflow).hexdigest()
+    return hashlib.sha256(canonical_json(workflow).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory + disk) LRU cache of image bytes keyed by workflow hash"""
+
+    def __init__(self, memory_bytes=256 << 20, disk_dir=None, disk_bytes=4 << 30, suffix=".png"):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()   # key -> bytes, oldest first
+        self._memory_size = 0
+        self._disk = collections.OrderedDict()     # key -> size, least recently used first
+        self._disk_size = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        if self.disk_dir:
+            self._load_disk_index()
+
+    def get(self, key):
+        """Return cached bytes for key, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+            on_disk = key in self._disk
+        if on_disk:
+            try:
+                data = self._path(key).read_bytes()
+            except OSError:
+                data = None
+            with self._lock:
+                if data is None:
+                    self._drop_disk(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self.disk_hits += 1
+                    self._remember(key, data)
+                    self._touch(key)
+                    return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def __contains__(self, key):
+        """Membership test that does not count as a hit or miss"""
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def put(self, key, data):
+        """Store image bytes in both tiers"""
+        with self._lock:
+            self.stores += 1
+            self._remember(key, data)
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            log(f"⚠️  Result cache write failed: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+        with self._lock:
+            if key in self._disk:
+                self._disk_size -= self._disk.pop(key)
+            self._disk[key] = len(data)
+            self._disk_size += len(data)
+            self._evict_disk()
+
+    def put_stream(self, key, chunks):
+        """Pass chunks through while writing them to the disk tier
+
+        The entry is committed only if the stream is consumed to the end, so
+        an aborted download never leaves a truncated image in the cache. The
+        memory tier is filled on the next ``get`` instead of holding a copy.
+        """
+        if not self.disk_dir:
+            yield from chunks
+            return
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        size = 0
+        complete = False
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            os.replace(tmp, path)
+            complete = True
+        finally:
+            if not complete:
+                tmp.unlink(missing_ok=True)
+        with self._lock:
+            self.stores += 1
+            if key in self._disk:
+                self._disk_size -= self._disk.pop(key)
+            self._disk[key] = size
+            self._disk_size += size
+            self._evict_disk()
+
+    def lookup(self, key):
+        """Like ``get`` but disk hits are returned as a path to stream from
+
+        Returns ``(bytes, None)`` for a memory hit, ``(None, path)`` for a
+        disk hit and ``(None, None)`` for a miss.
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data, None
+            if key in self._disk:
+                path = self._path(key)
+                if path.exists():
+                    self._disk.move_to_end(key)
+                    self.disk_hits += 1
+                    self._touch(key)
+                    return None, path
+                self._drop_disk(key)
+            self.misses += 1
+            return None, None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "memory_budget": self.memory_bytes,
+                "disk_items": len(self._disk),
+                "disk_bytes": self._disk_size,
+                "disk_budget": self.disk_bytes if self.disk_dir else 0,
+            }
+
+    # ------------------------------------------------------------------
+    # internals (called with the lock held unless noted)
+    # ------------------------------------------------------------------
+
+    def _path(self, key):
+        return self.disk_dir / f"{key}{self.suffix}"
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _touch(self, key):
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def _drop_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_size -= size
+
+    def _evict_disk(self):
+        while self._disk_size > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self.evictions += 1
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU order from file mtimes (not locked, init only)"""
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.disk_dir.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.name[:-len(self.suffix)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        self._evict_disk()
+        if entries:
+            log(f"🗄️  Result cache: {len(self._disk)} image(s) on disk ({self._disk_size / 1024 / 1024:.0f} MB)")
@@ -0,0 +1,145 @@
+"""
+Thread-safe registry of SocketIO sessions by user and by sid
+Connect and disconnect handlers run in the eventlet loop while scheduler
+workers look up where to send progress and images, so both directions are
+indexed (user_id -> sids, sid -> user_id) behind one lock and every
+operation is O(1). A user may have several sessions (tabs) at once. When
+the last one goes away the user is remembered for ``ttl`` seconds, so a
+tab that reconnects with its user_id resumes it and collects results that
+finished while it was away.
+
+Usage:
+    sessions = SessionRegistry(ttl=600)
+    user_id, resumed = sessions.connect(sid, user_id=auth.get("user_id"))
+    for sid in sessions.sids(user_id):
+        socketio.emit("image_ready", message, to=sid)
+    sessions.hold(user_id, job_id)          # nobody connected: deliver later
+    held = sessions.take_held(user_id)      # on reconnect
+    user_id, last = sessions.disconnect(sid)
+"""
+
+import collections
+import threading
+import time
+import uuid
+
+
+class SessionRegistry:
+    """Bidirectional user_id <-> sid index with expiry of disconnected users
+
+    Users without a session are forgotten ``ttl`` seconds after their last
+    session disconnected, together with the results held for them;
+    ``max_held`` bounds the results held per user.
+    """
+
+    def __init__(self, ttl=600, max_held=32):
+        self.ttl = ttl
+        self.max_held = max_held
+        self.resumed = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        self._sids = {}                                 # user_id -> {sid: None} in connect order
+        self._users = {}                                # sid -> user_id
+        self._away = collections.OrderedDict()          # user_id -> expiry time, oldest first
+        self._held = {}                                 # user_id -> deque of job ids
+
+    def connect(self, sid, user_id=None):
+        """Register a session; returns (user_id, resumed)
+
+        ``user_id`` is the id a reconnecting client presents. It is resumed
+        if that user is connected or still remembered; otherwise (or
+        without one) the session gets a new user_id.
+        """
+        with self._lock:
+            self._expire()
+            resumed = user_id is not None and (user_id in self._sids or user_id in self._away)
+            if not resumed:
+                user_id = str(uuid.uuid4())
+            else:
+                self.resumed += 1
+            self._away.pop(user_id, None)
+            self._sids.setdefault(user_id, {})[sid] = None
+            self._users[sid] = user_id
+            return user_id, resumed
+
+    def disconnect(self, sid):
+        """Forget a session; returns (user_id, last) or (None, False) for an unknown sid
+
+        ``last`` is True when that was the user's only session; the user
+        is then remembered for ``ttl`` seconds.
+        """
+        with self._lock:
+            user_id = self._users.pop(sid, None)
+            if user_id is None:
+                return None, False
+            sids = self._sids[user_id]
+            sids.pop(sid, None)
+            last = not sids
+            if last:
+                del self._sids[user_id]
+                self._away[user_id] = time.time() + self.ttl
+            self._expire()
+            return user_id, last
+
+    def sids(self, user_id):
+        """The user's connected sids (oldest first); empty if none"""
+        with self._lock:
+            sids = self._sids.get(user_id)
+            return tuple(sids) if sids else ()
+
+    def user(self, sid):
+        """user_id of a session, or None"""
+        with self._lock:
+            return self._users.get(sid)
+
+    def is_connected(self, user_id):
+        with self._lock:
+            return user_id in self._sids
+
+    def hold(self, user_id, job_id):
+        """Keep a finished job for delivery when the user reconnects
+
+        Returns False if the user is unknown (never connected or expired).
+        """
+        with self._lock:
+            if user_id not in self._sids and user_id not in self._away:
+                return False
+            self._held.setdefault(user_id, collections.deque(maxlen=self.max_held)).append(job_id)
+            return True
+
+    def take_held(self, user_id):
+        """Job ids held for the user, oldest first (and forget them)"""
+        with self._lock:
+            return list(self._held.pop(user_id, ()))
+
+    def __len__(self):
+        """Connected users"""
+        with self._lock:
+            return len(self._sids)
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {
+                "users": len(self._sids),
+                "sessions": len(self._users),
+                "away": len(self._away),
+                "held_results": sum(len(held) for held in self._held.values()),
+                "resumed": self.resumed,
+                "expired": self.expired,
+                "ttl": self.ttl,
+            }
+
+    # ------------------------------------------------------------------
+    # internals (called with the lock held)
+    # ------------------------------------------------------------------
+
+    def _expire(self):
+        now = time.time()
+        while self._away:
+            user_id, expires = next(iter(self._away.items()))
+            if expires > now:
+                break
+            del self._away[user_id]
+            self._held.pop(user_id, None)
+            self.expired += 1
@@ -0,0 +1,297 @@
+"""
+Precompiled ComfyUI workflow templates with named parameter slots
+A template is validated and analysed once: the sampler, the positive and
+negative prompt encoders, the latent image and the model loader are found
+by following the graph, so their inputs become named slots (prompt,
+negative, seed, width, height, steps, cfg, model, filename_prefix).
+Rendering builds a brand-new graph per request with the slot values filled
+in. Nothing is shared with the template or with other requests, and no
+copy.deepcopy is involved.
+
+The graph is also pre-encoded as canonical JSON (result_cache.canonical_json)
+split around the slots, so ``encode`` produces the request body for
+POST /prompt, and the bytes the result-cache key is hashed from, by joining
+fixed byte segments with the JSON of the slot values only.
+
+Usage:
+    templates = load_templates("workflows", builtin={"default": DEFAULT_WORKFLOW})
+    workflow = templates["default"].render(prompt="a red fox", width=1024, height=1024)
+    prompt_json = templates["default"].encode(prompt="a red fox", width=1024, height=1024)
+"""
+
+import json
+from pathlib import Path
+
+from progress_tracker import SAMPLER_NODES
+from result_cache import canonical_json
+
+
+def log(message):
+    """Print with immediate flush"""
+    print(message, flush=True)
+
+
+class TemplateError(ValueError):
+    """Raised for an invalid workflow graph or an unknown template parameter"""
+
+
+# Same encoding as result_cache.canonical_json, for single values
+_encode_value = json.JSONEncoder(sort_keys=True, separators=(",", ":")).encode
+
+# Latent image nodes whose width/height inputs size the output
+LATENT_NODES = ("EmptyLatentImage", "EmptySD3LatentImage")
+
+# Prompt encoders whose "text" input is the prompt (the second one is the
+# cached encoder from comfyui_conditioning_cache.py)
+TEXT_ENCODE_NODES = ("CLIPTextEncode", "CachedCLIPTextEncode")
+
+# Text encoder loaders: class_type -> index of their CLIP output
+CLIP_LOADER_OUTPUTS = {
+    "CLIPLoader": 0,
+    "DualCLIPLoader": 0,
+    "TripleCLIPLoader": 0,
+    "CheckpointLoaderSimple": 1,
+}
+
+IMAGE_OUTPUT_NODES = ("SaveImage", "PreviewImage")
+
+# Loader nodes of the diffusion model and the input naming its file
+MODEL_LOADER_INPUTS = {
+    "UNETLoader": "unet_name",
+    "CheckpointLoaderSimple": "ckpt_name",
+    "CheckpointLoader": "ckpt_name",
+}
+
+
+def is_link(value):
+    """True for a ComfyUI input link: [source_node_id, output_index]"""
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and isinstance(value[1], int)
+
+
+def image_output_node(workflow):
+    """Id of the node whose images are the workflow's result"""
+    for class_type in IMAGE_OUTPUT_NODES:
+        for node_id, node in workflow.items():
+            if node.get("class_type") == class_type:
+                return node_id
+    raise ValueError("workflow has no SaveImage/PreviewImage node")
+
+
+def model_loader_node(workflow):
+    """Id of the node that loads the workflow's diffusion model, or None"""
+    for node_id, node in workflow.items():
+        input_name = MODEL_LOADER_INPUTS.get(node.get("class_type"))
+        if input_name and isinstance(node["inputs"].get(input_name), str):
+            return node_id
+    return None
+
+
+def workflow_model(workflow):
+    """File name of the diffusion model a workflow loads, or None"""
+    node_id = model_loader_node(workflow)
+    if node_id is None:
+        return None
+    node = workflow[node_id]
+    return node["inputs"][MODEL_LOADER_INPUTS[node["class_type"]]]
+
+
+def validate_workflow(workflow):
+    """Check a workflow graph's shape; raises TemplateError
+
+    Every node needs a class_type and an inputs dict, every link must point
+    at an existing node, and some node must save or preview an image.
+    """
+    if not isinstance(workflow, dict) or not workflow:
+        raise TemplateError("workflow must be a non-empty object of nodes")
+    for node_id, node in workflow.items():
+        if not isinstance(node, dict) or not isinstance(node.get("class_type"), str):
+            raise TemplateError(f"node {node_id} has no class_type")
+        if not isinstance(node.get("inputs"), dict):
+            raise TemplateError(f"node {node_id} ({node['class_type']}) has no inputs object")
+        for name, value in node["inputs"].items():
+            if is_link(value) and value[0] not in workflow:
+                raise TemplateError(f"node {node_id} input '{name}' links to missing node {value[0]}")
+    try:
+        image_output_node(workflow)
+    except ValueError as e:
+        raise TemplateError(str(e)) from None
+
+
+def find_slots(workflow):
+    """{slot name: (node_id, input_name)} for the parameters this graph exposes"""
+    slots = {}
+
+    def add(name, node_id, input_name):
+        inputs = workflow[node_id]["inputs"] if node_id in workflow else {}
+        if input_name in inputs and not is_link(inputs[input_name]):
+            slots[name] = (node_id, input_name)
+
+    def linked(node_id, input_name):
+        value = workflow[node_id]["inputs"].get(input_name)
+        return value[0] if is_link(value) else None
+
+    sampler = next((node_id for node_id, node in workflow.items() if node["class_type"] in SAMPLER_NODES), None)
+    if sampler is not None:
+        add("seed", sampler, "noise_seed" if "noise_seed" in workflow[sampler]["inputs"] else "seed")
+        add("steps", sampler, "steps")
+        add("cfg", sampler, "cfg")
+        for slot, input_name in (("prompt", "positive"), ("negative", "negative")):
+            encoder = linked(sampler, input_name)
+            if encoder is not None and workflow[encoder]["class_type"] in TEXT_ENCODE_NODES:
+                add(slot, encoder, "text")
+        latent = linked(sampler, "latent_image")
+        if latent is not None and workflow[latent]["class_type"] in LATENT_NODES:
+            add("width", latent, "width")
+            add("height", latent, "height")
+    loader = model_loader_node(workflow)
+    if loader is not None:
+        add("model", loader, MODEL_LOADER_INPUTS[workflow[loader]["class_type"]])
+    add("filename_prefix", image_output_node(workflow), "filename_prefix")
+    return slots
+
+
+def cached_text_encoders(workflow):
+    """Copy of a workflow with CLIPTextEncode nodes swapped for CachedCLIPTextEncode
+
+    Only encoders fed straight from a text encoder loader are swapped; their
+    ``encoder`` input names the loader and its files, which together with
+    the text keys the conditioning cache. Encoders behind anything that
+    modifies the CLIP model (e.g. a LoRA) are left alone.
+    """
+    converted = {}
+    for node_id, node in workflow.items():
+        inputs = node.get("inputs", {})
+        clip = inputs.get("clip")
+        loader = workflow.get(clip[0]) if node.get("class_type") == "CLIPTextEncode" and is_link(clip) else None
+        if (loader is not None and CLIP_LOADER_OUTPUTS.get(loader.get("class_type")) == clip[1]
+                and not any(is_link(value) for value in loader.get("inputs", {}).values())):
+            encoder = f"{loader['class_type']}:{canonical_json(loader['inputs'])}"
+            converted[node_id] = {"inputs": dict(inputs, encoder=encoder), "class_type": "CachedCLIPTextEncode"}
+        else:
+            converted[node_id] = node
+    return converted
+
+
+class WorkflowTemplate:
+    """A validated workflow graph that renders fresh request graphs
+
+    The template keeps its own private copy of the graph, split per node
+    into literal inputs and links, so ``render`` only has to build new
+    dicts and link lists; nothing it returns aliases the template.
+    """
+
+    def __init__(self, name, workflow):
+        validate_workflow(workflow)
+        self.name = name
+        self.slots = find_slots(workflow)
+        # (node_id, class_type, literal inputs, link inputs); literals are
+        # JSON scalars or frozen by a round-trip through json
+        self._nodes = []
+        for node_id, node in workflow.items():
+            literals, links = {}, {}
+            for input_name, value in node["inputs"].items():
+                if is_link(value):
+                    links[input_name] = (value[0], value[1])
+                else:
+                    literals[input_name] = value if isinstance(value, (str, int, float, bool, type(None))) \
+                        else json.loads(json.dumps(value))
+            self._nodes.append((node_id, node["class_type"], literals, links))
+        self._segments, self._slot_order = self._compile_json()
+        self._default_json = {name: _encode_value(value).encode("utf-8") for name, value in self.defaults().items()}
+
+    def _compile_json(self):
+        """Canonical JSON of the graph cut at every slot value
+
+        Returns (segments, slot_order): ``len(segments) == len(slot_order) + 1``
+        and the encoded graph is segments[0] + value(slot_order[0]) +
+        segments[1] + ...
+        """
+        markers = {name: f"\x00slot:{name}\x00" for name in self.slots}
+        encoded = canonical_json(self.render(**markers))
+        segments, slot_order = [], []
+        position = 0
+        marked = sorted((encoded.index(_encode_value(marker)), name) for name, marker in markers.items())
+        for index, name in marked:
+            segments.append(encoded[position:index].encode("utf-8"))
+            slot_order.append(name)
+            position = index + len(_encode_value(markers[name]))
+        segments.append(encoded[position:].encode("utf-8"))
+        return segments, slot_order
+
+    def render(self, **params):
+        """A new workflow graph with ``params`` written into their slots
+
+        Raises TemplateError for a parameter the template has no slot for.
+        """
+        targets = {}
+        for name, value in params.items():
+            if name not in self.slots:
+                raise TemplateError(f"template '{self.name}' has no '{name}' parameter "
+                                    f"(it has {', '.join(sorted(self.slots))})")
+            node_id, input_name = self.slots[name]
+            targets.setdefault(node_id, {})[input_name] = value
+        graph = {}
+        for node_id, class_type, literals, links in self._nodes:
+            inputs = dict(literals)
+            for input_name, (source, index) in links.items():
+                inputs[input_name] = [source, index]
+            if node_id in targets:
+                inputs.update(targets[node_id])
+            graph[node_id] = {"inputs": inputs, "class_type": class_type}
+        return graph
+
+    def encode(self, **params):
+        """Canonical JSON bytes of ``render(**params)`` without building or dumping the graph
+
+        Equal to ``canonical_json(self.render(**params)).encode()``; only the
+        slot values are encoded. Raises TemplateError for an unknown slot.
+        """
+        for name in params:
+            if name not in self.slots:
+                raise TemplateError(f"template '{self.name}' has no '{name}' parameter "
+                                    f"(it has {', '.join(sorted(self.slots))})")
+        segments = self._segments
+        parts = [segments[0]]
+        for i, name in enumerate(self._slot_order):
+            parts.append(_encode_value(params[name]).encode("utf-8") if name in params else self._default_json[name])
+            parts.append(segments[i + 1])
+        return b"".join(parts)
+
+    def value(self, workflow, name):
+        """A slot's value in a graph rendered from this template (None if there is no such slot)"""
+        if name not in self.slots:
+            return None
+        node_id, input_name = self.slots[name]
+        return workflow[node_id]["inputs"].get(input_name)
+
+    def node(self, name):
+        """Id of the node holding a slot, or None"""
+        return self.slots[name][0] if name in self.slots else None
+
+    def defaults(self):
+        """The template's own value for every slot"""
+        graph = {node_id: literals for node_id, _, literals, _ in self._nodes}
+        return {name: graph[node_id].get(input_name) for name, (node_id, input_name) in self.slots.items()}
+
+
+def load_templates(directory=None, builtin=None, transform=None):
+    """{name: WorkflowTemplate} for ``builtin`` graphs plus every *.json in directory
+
+    File templates are named after the file (workflows/flux_workflow.json
+    -> "flux_workflow"). ``transform(workflow)`` is applied to every graph
+    after validation (e.g. cached_text_encoders). Invalid files are logged
+    and skipped.
+    """
+    def compile_template(name, workflow):
+        if transform is not None:
+            validate_workflow(workflow)
+            workflow = transform(workflow)
+        return WorkflowTemplate(name, workflow)
+
+    templates = {name: compile_template(name, workflow) for name, workflow in (builtin or {}).items()}
+    for path in sorted(Path(directory).glob("*.json")) if directory and Path(directory).is_dir() else ():
+        try:
+            templates[path.stem] = compile_template(path.stem, json.loads(path.read_text()))
+        except (OSError, ValueError) as e:
+            log(f"⚠️  Skipping workflow template {path.name}: {e}")
+    return templates